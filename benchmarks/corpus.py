@@ -0,0 +1,130 @@
+# benchmarks/corpus.py
+"""
+合成合约语料：按指定函数数量生成可被分块器正常切分的 Solidity / Rust (Anchor 风格) 源文件。
+相同参数与 seed 生成的文件逐字节一致，便于跨版本对比基准结果。
+"""
+import os
+import random
+from typing import Dict, List, Sequence
+
+# 语料规模 -> 每个文件的函数数量 (large 远超 CHUNK_MAX_LINES，用于覆盖分块审计)
+SIZES: Dict[str, int] = {"small": 4, "medium": 24, "large": 160}
+
+SOLIDITY_FUNCTIONS = [
+    """    /// @notice 提取余额
+    function withdraw{i}(uint256 amount) external {{
+        require(balances[msg.sender] >= amount, "insufficient");
+        (bool ok, ) = msg.sender.call{{value: amount}}("");
+        require(ok, "transfer failed");
+        balances[msg.sender] -= amount;
+    }}""",
+    """    function deposit{i}() external payable {{
+        balances[msg.sender] += msg.value;
+        totalDeposits += msg.value;
+        emit Deposited(msg.sender, msg.value);
+    }}""",
+    """    function setOwner{i}(address newOwner) external {{
+        owner = newOwner;
+    }}""",
+    """    function distribute{i}(address[] calldata users, uint256 amount) external onlyOwner {{
+        for (uint256 j = 0; j < users.length; j++) {{
+            balances[users[j]] += amount;
+        }}
+    }}""",
+    """    function unlock{i}() external {{
+        require(block.timestamp >= unlockAt, "locked");
+        locked = false;
+    }}""",
+    """    function forward{i}(address target, bytes calldata data) external onlyOwner {{
+        target.call(data);
+    }}""",
+]
+
+RUST_FUNCTIONS = [
+    """    pub fn withdraw_{i}(ctx: Context<Withdraw>, amount: u64) -> Result<()> {{
+        let vault = &mut ctx.accounts.vault;
+        **vault.to_account_info().try_borrow_mut_lamports()? -= amount;
+        **ctx.accounts.authority.try_borrow_mut_lamports()? += amount;
+        Ok(())
+    }}""",
+    """    pub fn deposit_{i}(ctx: Context<Deposit>, amount: u64) -> Result<()> {{
+        let vault = &mut ctx.accounts.vault;
+        vault.total = vault.total + amount;
+        Ok(())
+    }}""",
+    """    pub fn set_config_{i}(ctx: Context<SetConfig>, fee_bps: u16) -> Result<()> {{
+        let data = ctx.accounts.config.try_borrow_data()?;
+        msg!("config len {{}}", data.len());
+        ctx.accounts.state.fee_bps = fee_bps;
+        Ok(())
+    }}""",
+    """    pub fn close_{i}(ctx: Context<Close>) -> Result<()> {{
+        let state = &mut ctx.accounts.state;
+        state.closed = true;
+        Ok(())
+    }}""",
+]
+
+SOLIDITY_HEADER = """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+contract {name} {{
+    address public owner;
+    bool public locked = true;
+    uint256 public unlockAt;
+    uint256 public totalDeposits;
+    mapping(address => uint256) public balances;
+
+    event Deposited(address indexed user, uint256 amount);
+
+    modifier onlyOwner() {{
+        require(msg.sender == owner, "not owner");
+        _;
+    }}
+
+"""
+
+RUST_HEADER = """use anchor_lang::prelude::*;
+
+declare_id!("Fg6PaFpoGXkYsidMpWTK6W2BeZ7FEfcYkg476zPFsLnS");
+
+#[program]
+pub mod {name} {{
+    use super::*;
+
+"""
+
+
+def render_contract(language: str, name: str, functions: int, rng: random.Random) -> str:
+    """生成一个包含 functions 个函数的合约源码"""
+    templates = SOLIDITY_FUNCTIONS if language == "solidity" else RUST_FUNCTIONS
+    header = (SOLIDITY_HEADER if language == "solidity" else RUST_HEADER).format(name=name)
+    body = "\n\n".join(rng.choice(templates).format(i=i) for i in range(functions))
+    return header + body + "\n}\n"
+
+
+def generate_corpus(
+    out_dir: str,
+    files: int,
+    size: str = "small",
+    languages: Sequence[str] = ("solidity",),
+    seed: int = 0,
+) -> List[str]:
+    """在 out_dir 下生成 files 个文件 (多种语言时轮流生成)，返回文件路径列表"""
+    if size not in SIZES:
+        raise ValueError(f"未知的语料规模: {size} (可选: {', '.join(SIZES)})")
+    rng = random.Random(f"{seed}-{size}")
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for index in range(files):
+        language = languages[index % len(languages)]
+        if language == "solidity":
+            path = os.path.join(out_dir, f"Contract{size.title()}{index}.sol")
+            code = render_contract(language, f"Contract{size.title()}{index}", SIZES[size], rng)
+        else:
+            path = os.path.join(out_dir, f"program_{size}_{index}.rs")
+            code = render_contract(language, f"program_{size}_{index}", SIZES[size], rng)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(code)
+        paths.append(path)
+    return paths
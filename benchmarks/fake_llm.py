@@ -0,0 +1,88 @@
+# benchmarks/fake_llm.py
+"""
+确定性的本地 LLM 替身：不访问网络，按 "固定延迟 + 输出 Token 数 / 生成速率" 模拟响应时间。
+同一 Prompt 总是得到同一份报告，Token 用量照常计入 usage_tracker，便于与真实运行对比。
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Set
+
+from llm_services.abstract_service import AbstractLLMService
+from llm_services.rate_limit import estimate_tokens
+from llm_services.usage import usage_tracker
+
+VULNERABILITY_NAMES = ["Reentrancy", "Missing Access Control", "Unchecked Call Return", "Integer Overflow",
+                       "Timestamp Dependence", "Missing Signer Check"]
+SEVERITIES = ["High", "Medium", "Low", "Informational"]
+
+
+class FakeLLMService(AbstractLLMService):
+    """
+    latency: 每次请求的固定开销 (秒，模拟首 Token 延迟)；tokens_per_second: 输出生成速率 (0 表示瞬时)；
+    stream_chunk_chars: 流式接口每个片段的字符数。
+    """
+
+    def __init__(self, latency: float = 0.3, tokens_per_second: float = 200.0,
+                 model_name: str = "fake-llm", stream_chunk_chars: int = 24):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.model_name = model_name
+        self.temperature = 0.0
+        self.stream_chunk_chars = stream_chunk_chars
+        # 见过的 system prompt：再次出现时按前缀缓存命中计入 cached_tokens
+        self._seen_prefixes: Set[str] = set()
+
+    def build_report(self, user_prompt: str) -> Dict[str, Any]:
+        """由 Prompt 哈希确定漏洞数量、名称、行号与严重度"""
+        digest = hashlib.sha256(user_prompt.encode("utf-8")).digest()
+        count = digest[0] % 4
+        return {
+            "analysis_summary": f"基准测试替身报告 ({count} 个问题)",
+            "vulnerabilities": [
+                {
+                    "name": VULNERABILITY_NAMES[digest[i + 1] % len(VULNERABILITY_NAMES)],
+                    "line": 1 + digest[i + 5] % 40,
+                    "severity": SEVERITIES[digest[i + 9] % len(SEVERITIES)],
+                    "description": "由基准测试替身生成的确定性描述。",
+                    "fix_suggestion": "参照审计清单修复。",
+                    "fixed_code_snippet": "// fixed",
+                }
+                for i in range(count)
+            ],
+        }
+
+    def _respond(self, system_prompt: str, user_prompt: str):
+        """返回 (报告文本, 模拟耗时)，并记录用量"""
+        text = json.dumps(self.build_report(user_prompt), ensure_ascii=False)
+        completion_tokens = estimate_tokens(text)
+        cached = estimate_tokens(system_prompt) if system_prompt in self._seen_prefixes else 0
+        self._seen_prefixes.add(system_prompt)
+        usage_tracker.record(
+            self.model_name,
+            prompt_tokens=estimate_tokens(system_prompt, user_prompt),
+            cached_tokens=cached,
+            completion_tokens=completion_tokens,
+        )
+        generation = completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return text, self.latency + generation
+
+    def generate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        text, delay = self._respond(system_prompt, user_prompt)
+        time.sleep(delay)
+        return self.parse_json_output(text)
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        text, delay = self._respond(system_prompt, user_prompt)
+        await asyncio.sleep(delay)
+        return self.parse_json_output(text)
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        text, delay = self._respond(system_prompt, user_prompt)
+        await asyncio.sleep(self.latency)
+        pieces = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        per_piece = (delay - self.latency) / max(len(pieces), 1)
+        for piece in pieces:
+            await asyncio.sleep(per_piece)
+            yield piece
@@ -0,0 +1,99 @@
+# benchmarks/import_time.py
+"""
+CLI 启动开销回归检查：在全新的子进程中用 python -X importtime 导入入口模块，
+检查 (1) 模型 SDK 与具体分析器没有被提前导入；(2) 导入配置模块没有立即构造 Settings；
+(3) 总导入耗时不超过预算。任一项不满足时以非零状态码退出，可直接放进 CI。
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 300 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+# 只应在真正用到时 (工厂按配置创建实例时) 才导入的模块
+LAZY_MODULES = (
+    "openai",
+    "google.genai",
+    "static_analyzers.slither_analyzer",
+    "static_analyzers.soteria_analyzer",
+    "http.server",
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入入口模块后输出已加载的延迟模块与 Settings 的构造状态
+PROBE = """
+import sys
+import {module}
+from config.settings import llm_settings, project_settings
+lazy = {lazy!r}
+print("LOADED", ",".join(m for m in lazy if m in sys.modules))
+# 非延迟代理 (直接构造的 Settings 实例) 视为已构造
+loaded = lambda settings: int(getattr(type(settings), "is_loaded", lambda self: True)(settings))
+print("SETTINGS", loaded(llm_settings), loaded(project_settings))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 输出为 (模块, 自身微秒, 累计微秒) 列表"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module: str) -> Tuple[List[Tuple[str, int, int]], List[str], Tuple[bool, bool]]:
+    code = PROBE.format(module=module, lazy=LAZY_MODULES)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    loaded, settings = [], (False, False)
+    for line in proc.stdout.splitlines():
+        if line.startswith("LOADED "):
+            loaded = [m for m in line[len("LOADED "):].split(",") if m]
+        elif line.startswith("SETTINGS "):
+            llm, project = line.split()[1:]
+            settings = (llm == "1", project == "1")
+    return parse_importtime(proc.stderr), loaded, settings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="检查入口模块的导入耗时与延迟导入是否退化")
+    parser.add_argument("--module", default="main", help="要检查的入口模块")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="入口模块累计导入耗时上限 (毫秒)")
+    parser.add_argument("--top", type=int, default=10, help="列出累计耗时最高的前 N 个模块")
+    args = parser.parse_args(argv)
+
+    rows, loaded, settings = measure(args.module)
+    total_ms = next((cumulative for name, _, cumulative in rows if name == args.module), 0) / 1000
+
+    print(f"⏱️  [Import] {args.module} 累计导入耗时 {total_ms:.1f} ms (预算 {args.budget_ms:.0f} ms)")
+    for name, _, cumulative in sorted(rows, key=lambda r: r[2], reverse=True)[1:args.top + 1]:
+        print(f"   {cumulative / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if loaded:
+        failures.append(f"以下模块应延迟导入，却在导入 {args.module} 时已加载: {', '.join(loaded)}")
+    if any(settings):
+        failures.append("导入阶段已构造 Settings (应在首次访问配置时才构造)")
+    if total_ms > args.budget_ms:
+        failures.append(f"导入耗时 {total_ms:.1f} ms 超出预算 {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ 导入检查通过")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# benchmarks/replay.py
+"""
+回放型静态分析器：用录制好的工具输出 (benchmarks/fixtures) 代替真实的 Slither / Soteria 进程。
+录制输出经由真实分析器的解析函数转换为 StaticFinding，再把文件名与行号映射到被审计的文件上；
+run_analysis 按 latency 睡眠以模拟工具耗时。无需安装任何工具即可跑通完整流水线。
+"""
+import asyncio
+import json
+import os
+import time
+from typing import List
+
+from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
+from static_analyzers.findings import StaticAnalysisResult, StaticFinding
+from static_analyzers.slither_analyzer import SlitherAnalyzer
+from static_analyzers.soteria_analyzer import SoteriaAnalyzer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_slither_fixture(path: str = os.path.join(FIXTURES_DIR, "slither.json")) -> List[StaticFinding]:
+    with open(path, "r", encoding="utf-8") as f:
+        detectors = json.load(f)["results"]["detectors"]
+    return [SlitherAnalyzer.parse_detector(det) for det in detectors]
+
+
+def load_soteria_fixture(path: str = os.path.join(FIXTURES_DIR, "soteria.txt")) -> List[StaticFinding]:
+    with open(path, "r", encoding="utf-8") as f:
+        return SoteriaAnalyzer.parse_output(f.read())
+
+
+class ReplayStaticAnalyzer(AbstractStaticAnalyzer):
+    """
+    findings: 录制的发现 (每个文件都回放同一组)；latency: 每次运行的模拟耗时 (秒)。
+    行号超出文件长度时按取模折回文件内，保证分块路由与真实运行一样工作。
+    """
+
+    def __init__(self, tool: str, findings: List[StaticFinding], latency: float = 0.0):
+        super().__init__()
+        self.TOOL_NAME = tool
+        self.findings = findings
+        self.latency = latency
+
+    @classmethod
+    def for_project_type(cls, project_type: str, latency: float = 0.0) -> "ReplayStaticAnalyzer":
+        if project_type == "SOLANA":
+            return cls("Soteria (replay)", load_soteria_fixture(), latency)
+        return cls("Slither (replay)", load_slither_fixture(), latency)
+
+    def check_installed(self) -> bool:
+        return True
+
+    def tool_version(self) -> str:
+        return "replay"
+
+    def _replay(self, file_path: str) -> StaticAnalysisResult:
+        with open(file_path, "r", encoding="utf-8") as f:
+            total = max(len(f.read().splitlines()), 1)
+        findings = []
+        for finding in self.findings:
+            lines = [((start - 1) % total + 1, (start - 1) % total + 1 + (end - start)) for start, end in finding.lines]
+            lines = [(start, min(end, total)) for start, end in lines]
+            findings.append(finding.model_copy(update={"file": os.path.basename(file_path), "lines": lines}))
+        return StaticAnalysisResult(tool=self.TOOL_NAME, findings=findings)
+
+    def run_analysis(self, file_path: str) -> StaticAnalysisResult:
+        time.sleep(self.latency)
+        return self._replay(file_path)
+
+    async def arun_analysis(self, file_path: str) -> StaticAnalysisResult:
+        await asyncio.sleep(self.latency)
+        return self._replay(file_path)
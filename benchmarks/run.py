@@ -0,0 +1,178 @@
+# benchmarks/run.py
+"""
+离线基准测试：替身 LLM + 回放静态分析器 + 合成语料，不消耗 API 配额、不需要安装 Slither / Soteria。
+
+    python -m benchmarks.run                       # 全部场景
+    python -m benchmarks.run --scenario batch --files 200 --llm-latency 0.5 --json bench.json
+
+场景：
+- single: 小文件逐个走单文件入口 (AuditAnalyzer.analyze)
+- batch:  .sol / .rs 混合的中等文件走批量流水线 (BatchAuditRunner)
+- large:  超过 CHUNK_MAX_LINES 的大文件走单文件入口 (分块并发审计)
+
+每个场景在独立子进程中运行，峰值 RSS 互不干扰。输出 files/sec、单文件延迟 p50 / p95 与峰值 RSS。
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from config.settings import project_settings
+from core.analyzer import AuditAnalyzer
+from core.batch import BatchAuditRunner, detect_file_project_type
+from core.metrics import percentile
+
+SCENARIOS = ("single", "batch", "large")
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    files: int
+    seconds: float
+    files_per_second: float
+    p50_seconds: float
+    p95_seconds: float
+    peak_rss_mb: float
+    failures: int
+
+
+def _peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位为 KB (macOS 为字节)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _make_analyzer(args, project_type: str) -> AuditAnalyzer:
+    llm = FakeLLMService(latency=args.llm_latency, tokens_per_second=args.tokens_per_second)
+    return AuditAnalyzer(llm, ReplayStaticAnalyzer.for_project_type(project_type, args.static_latency))
+
+
+def _run_single(args, files: List[str]) -> Tuple[List[float], int]:
+    analyzers: Dict[str, AuditAnalyzer] = {}
+    latencies, failures = [], 0
+    for path in files:
+        project_type = detect_file_project_type(path)
+        if project_type not in analyzers:
+            analyzers[project_type] = _make_analyzer(args, project_type)
+        with open(path, "r", encoding="utf-8") as f:
+            code = f.read()
+        start = time.perf_counter()
+        try:
+            analyzers[project_type].analyze(path, code)
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, failures
+
+
+async def _run_batch(args, files: List[str]) -> Tuple[List[float], int]:
+    project_types = sorted({detect_file_project_type(path) for path in files})
+    runner = BatchAuditRunner(
+        {project_type: _make_analyzer(args, project_type) for project_type in project_types},
+        static_workers=args.static_workers,
+        llm_concurrency=args.llm_concurrency,
+        queue_size=project_settings.PIPELINE_QUEUE_SIZE,
+        dedup_min_lines=project_settings.DEDUP_MIN_LINES if project_settings.DEDUP_ENABLED else None,
+    )
+    latencies, failures = [], 0
+    async for result in runner.run(files):
+        latencies.append(result.metrics.wall_seconds)
+        failures += 0 if result.ok else 1
+    return latencies, failures
+
+
+def run_scenario(scenario: str, args) -> ScenarioResult:
+    """在当前进程中运行一个场景 (由 _scenario_process 在子进程中调用)"""
+    workdir = tempfile.mkdtemp(prefix=f"certi-bench-{scenario}-")
+    # 基准测试不读写结果缓存，RAG 索引写到临时目录
+    project_settings.CACHE_ENABLED = False
+    project_settings.RAG_INDEX_PATH = os.path.join(workdir, "rag_index.json")
+
+    if scenario == "single":
+        files = generate_corpus(os.path.join(workdir, "src"), args.files, "small", seed=args.seed)
+    elif scenario == "batch":
+        files = generate_corpus(os.path.join(workdir, "src"), args.files, "medium",
+                                languages=("solidity", "rust"), seed=args.seed)
+    else:
+        files = generate_corpus(os.path.join(workdir, "src"), args.large_files, "large", seed=args.seed)
+
+    start = time.perf_counter()
+    # 审计过程的进度输出不计入结果，直接丢弃
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if scenario == "batch":
+            latencies, failures = asyncio.run(_run_batch(args, files))
+        else:
+            latencies, failures = _run_single(args, files)
+    elapsed = time.perf_counter() - start
+
+    return ScenarioResult(
+        scenario=scenario,
+        files=len(files),
+        seconds=round(elapsed, 3),
+        files_per_second=round(len(files) / elapsed, 3) if elapsed else 0.0,
+        p50_seconds=round(percentile(latencies, 0.5), 3),
+        p95_seconds=round(percentile(latencies, 0.95), 3),
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+        failures=failures,
+    )
+
+
+def _scenario_process(scenario: str, args, queue) -> None:
+    queue.put(asdict(run_scenario(scenario, args)))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Certi-Audit 离线基准测试")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--files", type=int, default=40, help="single / batch 场景的文件数")
+    parser.add_argument("--large-files", type=int, default=3, help="large 场景的文件数")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="替身 LLM 每次请求的固定延迟 (秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="替身 LLM 的输出速率 (0 表示瞬时)")
+    parser.add_argument("--static-latency", type=float, default=0.2, help="回放分析器每次运行的模拟耗时 (秒)")
+    parser.add_argument("--static-workers", type=int, default=project_settings.BATCH_STATIC_WORKERS)
+    parser.add_argument("--llm-concurrency", type=int, default=project_settings.BATCH_LLM_CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=0, help="语料生成的随机种子")
+    parser.add_argument("--json", type=str, default=None, metavar="FILE", help="把结果写入 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        print(f"⏱️  [Bench] 运行场景: {scenario} ...", flush=True)
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_scenario_process, args=(scenario, args, queue))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        results.append(result)
+
+    print(f"\n{'场景':<8}{'文件':>6}{'耗时(s)':>10}{'files/s':>10}{'p50(s)':>9}{'p95(s)':>9}{'峰值RSS(MB)':>13}{'失败':>6}")
+    for r in results:
+        print(f"{r['scenario']:<8}{r['files']:>6}{r['seconds']:>10.2f}{r['files_per_second']:>10.2f}"
+              f"{r['p50_seconds']:>9.2f}{r['p95_seconds']:>9.2f}{r['peak_rss_mb']:>13.1f}{r['failures']:>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
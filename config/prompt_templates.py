@@ -7,19 +7,14 @@ SYSTEM_PROMPT_TEMPLATE = (
     "结合静态分析工具的发现，输出严格符合 JSON Schema 的审计报告。使用中文回答。"
 )
 
-USER_PROMPT_TEMPLATE = """
-    请严格根据以下步骤分析提供的代码：
+# 审计步骤与输出格式：与 SYSTEM_PROMPT_TEMPLATE 一起组成每次调用都字节一致的 system prompt 前缀，
+# 供服务端 Prompt 缓存命中。随文件变化的内容只能出现在 USER_PROMPT_TEMPLATE 中。
+AUDIT_INSTRUCTIONS_TEMPLATE = """
+    请严格根据以下步骤分析用户消息中提供的代码：
     
     ### 步骤 1：上下文增强与事实核查
-    
-    **A. 安全最佳实践 (RAG):**
-    {rag_context}
-    
-    **B. 静态代码分析报告 (工具运行结果):**
-    *这是由确定性算法生成的分析结果。如果报告了漏洞，请务必在你的分析中包含它并解释其原理。*
-    ---
-    {static_analysis_result}
-    ---
+    用户消息包含 **A. 安全最佳实践 (RAG)** 与 **B. 静态代码分析报告 (工具运行结果)**。
+    *静态分析报告是由确定性算法生成的分析结果。如果报告了漏洞，请务必在你的分析中包含它并解释其原理。*
     
     ### 步骤 2：漏洞识别和推理 (混合分析)
     1. **结合分析**：确认静态分析报告的漏洞位置，结合代码上下文解释其成因。
@@ -31,9 +26,57 @@ USER_PROMPT_TEMPLATE = """
     ---
     {schema_json}
     ---
+"""
+
+# 不做检索 (RAG_TOP_K=0) 时整份知识库也是不变内容，追加在前缀末尾
+KNOWLEDGE_BASE_TEMPLATE = """
+    ### 安全最佳实践知识库
+    ---
+    {best_practices_content}
+    ---
+"""
+
+# 知识库已整体放入 system prompt 时，用户消息中的 A 部分使用这段说明
+KNOWLEDGE_BASE_IN_SYSTEM_PROMPT = "(见系统提示中的安全最佳实践知识库)"
+
+USER_PROMPT_TEMPLATE = """
+    **A. 安全最佳实践 (RAG):**
+    {rag_context}
+    
+    **B. 静态代码分析报告 (工具运行结果):**
+    ---
+    {static_analysis_result}
+    ---
     
     待分析的代码：
     ---
     {contract_code}
     ---
-"""
\ No newline at end of file
+"""
+
+# 大文件分块审计时追加在 contract_code 之前的说明
+CHUNK_CONTEXT_TEMPLATE = """以下代码是文件 `{file_name}` 的一个片段 (原文件第 {start_line}-{end_line} 行，共 {total_lines} 行)，包含: {names}。
+其余部分会单独审计，请只报告该片段内的问题。
+**行号约定：漏洞的 line 字段请使用片段内的相对行号 (片段第 1 行 = 原文件第 {start_line} 行)。**
+
+{contract_code}"""
+
+# 输出修复：只回传校验错误与上次的输出，不再重复发送合约代码与知识库
+REPAIR_SYSTEM_PROMPT = (
+    "你是一个 JSON 修复工具。根据给出的校验错误修正 JSON，使其符合审计报告的结构："
+    "顶层为 analysis_summary (字符串) 与 vulnerabilities (数组)，每个漏洞包含 name、line (整数)、"
+    "severity (High / Medium / Low / Informational 之一)、description、fix_suggestion、fixed_code_snippet；"
+    "可选的顶层 confidence 为 High / Medium / Low 之一。"
+    "保留原有内容与行号，不要新增或删除漏洞，只输出修正后的 JSON。"
+)
+
+REPAIR_PROMPT_TEMPLATE = """上一次输出未通过校验，错误如下：
+---
+{errors}
+---
+
+上一次的输出：
+---
+{raw_output}
+---
+"""
@@ -1,6 +1,7 @@
 # config/settings.py
+import threading
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Literal
+from typing import Any, Callable, Literal, Optional, cast
 
 # 定义支持的链/语言类型
 ProjectType = Literal['EVM', 'SOLANA', 'MOVE']
@@ -13,6 +14,36 @@ class LLMSettings(BaseSettings):
     TEMPERATURE: float = 0.1
     TIMEOUT: int = 60 
     SEVERITY_LEVELS: Literal['High', 'Medium', 'Low', 'Informational'] = 'High'
+    # 自定义 API 地址 (代理 / 本地兼容服务)，留空使用官方地址
+    BASE_URL: str = ""
+
+    # 异步调用的重试与流控 (0 表示不限制)
+    MAX_RETRIES: int = 5
+    RETRY_BASE_DELAY: float = 1.0
+    RETRY_MAX_DELAY: float = 60.0
+    REQUESTS_PER_MINUTE: int = 0
+    TOKENS_PER_MINUTE: int = 0
+    MAX_CONCURRENCY: int = 0
+    # 向服务端发送 Prompt 前缀缓存提示 (OpenAI prompt_cache_key)；兼容服务不接受该参数时关闭
+    PROMPT_CACHE: bool = True
+    # 输出不是合法 JSON / 不符合 Schema 时的修复请求次数 (只回传错误与原输出，0 表示不修复)
+    REPAIR_MAX_ATTEMPTS: int = 1
+
+    # 级联路由：设置 CASCADE_FAST_MODEL 后先用该 (廉价) 模型审计，静态分析报告了不低于
+    # CASCADE_ESCALATE_IMPACT 的发现、或模型自评置信度低于 CASCADE_MIN_CONFIDENCE 时改用 MODEL_NAME
+    CASCADE_FAST_MODEL: str = ""
+    CASCADE_ESCALATE_IMPACT: Literal['Low', 'Medium', 'High'] = 'High'
+    CASCADE_MIN_CONFIDENCE: Literal['Low', 'Medium', 'High'] = 'Medium'
+    # 集成：逗号分隔的模型列表 (如 "gpt-4o,gemini-2.5-pro")，并行调用并合并去重漏洞，替代 MODEL_NAME 作为强模型
+    ENSEMBLE_MODELS: str = ""
+    # 集成去重时，同名漏洞行号相差不超过该值视为同一条
+    ENSEMBLE_LINE_TOLERANCE: int = 3
+
+    # 发送前的 Prompt 预算 (见 core.budget)：单次请求的输入 Token 上限 (0 表示 上下文窗口 - OUTPUT_RESERVE_TOKENS)、
+    # 为模型输出预留的 Token 数，以及费用预估时每个请求按多少输出 Token 计
+    PROMPT_BUDGET_TOKENS: int = 0
+    OUTPUT_RESERVE_TOKENS: int = 4096
+    EXPECTED_OUTPUT_TOKENS: int = 1000
 
 class ProjectSettings(BaseSettings):
     """项目环境配置"""
@@ -24,6 +55,107 @@ class ProjectSettings(BaseSettings):
     OPENAI_API_KEY: str = "" 
     GEMINI_API_KEY: str = "" 
     SECURITY_BEST_PRACTICES_PATH: str = "config/best_practices.txt"
+    # 知识库检索：每次只注入最相关的 top-k 条目 (0 表示注入整份知识库)
+    RAG_TOP_K: int = 4
+    RAG_INDEX_PATH: str = ".audit_cache/rag_index.json"
+
+    # 批量模式并发度：同时运行的静态分析工具数 / LLM 在途请求上限
+    BATCH_STATIC_WORKERS: int = 4
+    BATCH_LLM_CONCURRENCY: int = 8
+    # 批量流水线各阶段 (静态分析 / Prompt / LLM / 校验) 之间的队列容量，决定背压与内存上限
+    PIPELINE_QUEUE_SIZE: int = 16
+    # 批量模式的费用上限 (美元，按发送前预估累计，完成后以实际费用修正)；0 表示不限制
+    BATCH_MAX_COST_USD: float = 0
+    # 批量模式静态分析的执行方式：async = 事件循环内的异步子进程 (取消时杀掉进程组)；process = 进程池
+    BATCH_STATIC_EXECUTOR: Literal['async', 'process'] = 'async'
+    # 批量模式下同一项目 (foundry.toml / hardhat.config.* 等) 的文件共享一次静态分析编译
+    STATIC_PROJECT_MODE: bool = True
+
+    # 静态分析子进程限制：按工具的墙钟超时 (秒)，以及可选的内存 (MB) / CPU 时间 (秒) rlimit；0 表示不限制
+    SLITHER_TIMEOUT: float = 600
+    SOTERIA_TIMEOUT: float = 900
+    STATIC_MEMORY_LIMIT_MB: int = 0
+    STATIC_CPU_LIMIT_SECONDS: int = 0
+
+    # 静态发现进入 Prompt 前的过滤阈值 (低于阈值的发现不发送给 LLM)
+    STATIC_MIN_IMPACT: Literal['Optimization', 'Informational', 'Low', 'Medium', 'High'] = 'Optimization'
+    STATIC_MIN_CONFIDENCE: Literal['Low', 'Medium', 'High'] = 'Low'
+
+    # 大文件分块审计：超过该行数的文件在函数边界切块并行审计
+    CHUNK_MAX_LINES: int = 400
+    CHUNK_CONCURRENCY: int = 4
+
+    # 增量审计：只保留变更行上下该行数以内的静态发现
+    DIFF_CONTEXT_LINES: int = 5
+
+    # 批量模式跨文件去重：相同函数区域 (去注释 / 空白后的代码 + 静态检测器) 只送审一次；
+    # 有效代码行数少于 DEDUP_MIN_LINES 的区域不参与去重 (总在本文件内送审)
+    DEDUP_ENABLED: bool = True
+    DEDUP_MIN_LINES: int = 1
+
+    # 监听模式 (--watch)：轮询间隔与去抖时间 (最后一次保存后等待多久开始审计)，单位秒
+    WATCH_POLL_INTERVAL: float = 0.5
+    WATCH_DEBOUNCE_SECONDS: float = 1.0
+
+    # 批量模式的结果日志 (append-only JSONL)：每完成一步立即落盘，--resume 时跳过已完成的工作；留空表示不记录
+    JOURNAL_PATH: str = ".audit_cache/journal.jsonl"
+
+    # 结果缓存 (静态分析 + LLM 响应)，按大小 / 时间淘汰
+    CACHE_ENABLED: bool = True
+    CACHE_DIR: str = ".audit_cache"
+    CACHE_MAX_MB: int = 512
+    CACHE_MAX_AGE_DAYS: float = 30
+
+    # 常驻审计服务 (--serve)：监听地址、同时运行的任务数、排队上限、保留的已结束任务数、
+    # /metrics 计算分位数时使用的最近文件数 (计数类指标始终累计)
+    SERVER_HOST: str = "127.0.0.1"
+    SERVER_PORT: int = 8765
+    SERVER_MAX_JOBS: int = 2
+    SERVER_MAX_QUEUED: int = 100
+    SERVER_JOB_HISTORY: int = 200
+    SERVER_METRICS_WINDOW: int = 1000
+
+    # 多进程 / 多机分片 (--queue)：租约时长与每次领取的文件数、单个文件最多领取次数、
+    # 空闲 worker 的轮询间隔 (秒)、协调者在本机启动的 worker 进程数
+    QUEUE_LEASE_SECONDS: float = 120
+    QUEUE_LEASE_BATCH: int = 4
+    QUEUE_MAX_ATTEMPTS: int = 3
+    QUEUE_POLL_INTERVAL: float = 2.0
+    QUEUE_LOCAL_WORKERS: int = 2
+
+class LazySettings:
+    """
+    延迟构造的配置代理：第一次读写属性时才读取环境变量 / .env 并校验。
+    导入本模块没有副作用，main.py 中 load_dotenv() 与各模块导入的先后顺序也不再重要。
+    """
+
+    def __init__(self, factory: Callable[[], BaseSettings]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self) -> BaseSettings:
+        instance: Optional[BaseSettings] = object.__getattribute__(self, "_instance")
+        if instance is None:
+            with object.__getattribute__(self, "_lock"):
+                instance = object.__getattribute__(self, "_instance")
+                if instance is None:
+                    instance = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def is_loaded(self) -> bool:
+        return object.__getattribute__(self, "_instance") is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._resolve(), name, value)
+
+    def __repr__(self) -> str:
+        return repr(self._resolve())
+
 
-llm_settings = LLMSettings()
-project_settings = ProjectSettings()
\ No newline at end of file
+llm_settings = cast(LLMSettings, LazySettings(LLMSettings))
+project_settings = cast(ProjectSettings, LazySettings(ProjectSettings))
\ No newline at end of file
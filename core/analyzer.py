@@ -1,23 +1,123 @@
 # core/analyzer.py
+import asyncio
 import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from pydantic import ValidationError
 
-from llm_services.abstract_service import AbstractLLMService
-from core.pydantic_schema import AuditReport
+from llm_services.abstract_service import AbstractLLMService, LLMOutputError
+from core.pydantic_schema import AuditReport, Vulnerability
+from llm_services.json_stream import IncrementalArrayParser
 # [🔴] 确保正确导入 settings
 from config.settings import project_settings, llm_settings
 from config import prompt_templates
 # [✨] 引入抽象接口
 from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
+from static_analyzers.findings import IMPACT_ORDER, StaticAnalysisResult, render_findings, select_findings
+from core.chunker import (
+    CodeChunk, detect_language, filter_static_findings, merge_reports, overlaps, pack_units,
+    relative_static_findings, remap_report, remap_vulnerability, route_static_findings, split_source, split_units,
+)
+from core.budget import PromptAllocation, PromptBudget, PromptBudgetError, CODE_SHARE
+from core.cache import RegionResultCache
+from core.dedup import RegionDeduplicator, RegionGroup, code_line_numbers, from_code_ordinal, to_code_ordinal
+from core.metrics import record_estimate, timed
+from core.prompts import PromptAssembler, stable_schema_json
+from core.diff import LineRange
+from core.retrieval import BM25Index, load_or_build_index
+
+
+@dataclass
+class PromptJob:
+    """一次 LLM 请求：分块 (或全文) 及其 Prompt"""
+    chunk: CodeChunk
+    system_prompt: str
+    user_prompt: str
+    # 分块请求中模型使用相对行号，校验后需要映射回原文件
+    relative_lines: bool = False
+    # 静态分析报告了高影响发现：级联路由时直接使用强模型
+    escalate: bool = False
+
+
+@dataclass
+class AuditPlan:
+    """一个文件的审计计划：待发送的请求，以及增量 / 去重模式下复用的区域结论"""
+    file_path: str
+    contract_code: str
+    jobs: List[PromptJob] = field(default_factory=list)
+    incremental: bool = False
+    # 增量模式：重新审计后写入区域缓存的函数区域 / 直接复用的 (区域, 结论) / 摘要头
+    recorded_units: List[CodeChunk] = field(default_factory=list)
+    reused: List[Tuple[CodeChunk, AuditReport]] = field(default_factory=list)
+    header: str = ""
+    # 跨文件去重：本文件送审、结论供批次内重复区域复用的区域 / 等待其他文件结论的重复区域
+    owned: List[Tuple[CodeChunk, RegionGroup]] = field(default_factory=list)
+    borrowed: List[Tuple[CodeChunk, RegionGroup]] = field(default_factory=list)
+    # 发送前的预估：全部请求的输入 Token 与费用 (美元，模型不在价格表中时为 None)
+    estimated_tokens: int = 0
+    estimated_cost: Optional[float] = 0.0
+
+# 流式模式下每解析出一条漏洞就回调一次 (行号已映射回原文件)
+VulnerabilityCallback = Callable[[Vulnerability], None]
+
+# 模型输出：解析后的字典，或无法解析为 JSON 时的原文
+RawOutput = Union[Dict[str, Any], str]
+
+# 修复请求中最多列出的校验错误条数
+MAX_REPAIR_ERRORS = 20
+
+
+def describe_output_error(error: Exception) -> str:
+    """把 JSON 解析错误 / Pydantic 校验错误整理为修复 Prompt 中每条一行的文本"""
+    if isinstance(error, ValidationError):
+        lines = []
+        for item in error.errors(include_url=False)[:MAX_REPAIR_ERRORS]:
+            location = ".".join(str(part) for part in item["loc"]) or "(根对象)"
+            lines.append(f"- {location}: {item['msg']}")
+        if error.error_count() > MAX_REPAIR_ERRORS:
+            lines.append(f"- ... 另有 {error.error_count() - MAX_REPAIR_ERRORS} 条错误")
+        return "\n".join(lines)
+    return f"- {error}"
+
 
 class AuditAnalyzer:
-    
+
     # [✨] 依赖注入：接收一个通用的 static_analyzer
-    def __init__(self, llm_service: AbstractLLMService, static_analyzer: AbstractStaticAnalyzer):
+    def __init__(
+        self,
+        llm_service: AbstractLLMService,
+        static_analyzer: AbstractStaticAnalyzer,
+        region_cache: Optional[RegionResultCache] = None,
+    ):
         self.llm_service = llm_service
-        self.static_analyzer = static_analyzer 
+        self.static_analyzer = static_analyzer
+        # 按函数区域缓存审计结论，供增量 (diff) 审计复用未改动区域
+        self.region_cache = region_cache
         self.report_schema = AuditReport
-        self.rag_context = self._load_rag_context()
+        # RAG_TOP_K > 0 时按需检索相关条目；为 0 时退回整份知识库注入
+        self.rag_index: Optional[BM25Index] = None
+        self.rag_context = ""
+        if project_settings.RAG_TOP_K > 0:
+            self.rag_index = load_or_build_index(
+                project_settings.SECURITY_BEST_PRACTICES_PATH, project_settings.RAG_INDEX_PATH
+            )
+        else:
+            self.rag_context = self._load_rag_context()
+        # Schema 在实例生命周期内不变，只生成一次；连同审计步骤 (及整份知识库) 组成固定的 Prompt 前缀
+        self.schema_json = stable_schema_json(self.report_schema.model_json_schema())
+        self.prompt_assembler = PromptAssembler(self.schema_json, knowledge_base=self.rag_context)
+        # 发送前的 Token 预算；固定开销 = system 前缀 + 用户消息模板 + 分块说明模板
+        self.prompt_budget = PromptBudget(
+            self._model_name(), llm_settings.PROMPT_BUDGET_TOKENS, llm_settings.OUTPUT_RESERVE_TOKENS
+        )
+        self.prompt_overhead = self.prompt_budget.count(
+            self.prompt_assembler.system_prompt,
+            prompt_templates.USER_PROMPT_TEMPLATE.format(rag_context="", static_analysis_result="", contract_code=""),
+            prompt_templates.CHUNK_CONTEXT_TEMPLATE.format(
+                file_name="", start_line=0, end_line=0, total_lines=0, names="", contract_code=""
+            ),
+        )
 
     def _load_rag_context(self) -> str:
         try:
@@ -27,38 +127,588 @@ class AuditAnalyzer:
         except FileNotFoundError:
             return "没有可用的安全最佳实践上下文。"
 
-    def analyze(self, file_path: str, contract_code: str) -> AuditReport:
-        
+    def retrieve_rag_snippets(self, contract_code: str, static_text: str) -> List[str]:
+        """以静态发现 + 代码为查询，从知识库索引中取 top-k 相关条目 (按相关度降序)"""
+        if self.rag_index is None:
+            return []
+        hits = self.rag_index.search(f"{static_text}\n{contract_code}", project_settings.RAG_TOP_K)
+        return [self.rag_index.snippets[doc_id] for doc_id, _ in hits]
+
+    def format_rag_context(self, snippets: List[str]) -> str:
+        if self.rag_index is None:
+            return self.rag_context or "没有可用的安全最佳实践上下文。"
+        if not snippets:
+            return "没有可用的安全最佳实践上下文。"
+        return prompt_templates.RAG_CONTEXT_TEMPLATE.format(best_practices_content="\n\n".join(snippets))
+
+    def retrieve_rag_context(self, contract_code: str, static_text: str) -> str:
+        return self.format_rag_context(self.retrieve_rag_snippets(contract_code, static_text))
+
+    # --- 以下步骤可单独调用，便于批量模式把静态分析与 LLM 调用拆到不同的并发池 ---
+
+    def run_static_analysis(self, file_path: str) -> StaticAnalysisResult:
+        """步骤 1: 运行静态分析器，返回结构化的发现列表"""
+        with timed("static"):
+            return self.static_analyzer.run_analysis(file_path)
+
+    def build_prompts(self, contract_code: str, static_result: StaticAnalysisResult) -> Tuple[str, str]:
+        """
+        步骤 2: 构建混合 Prompt，返回 (固定前缀 system_prompt, 随文件变化的 user_prompt)。
+        超出 Token 预算时按优先级压缩检索条目与静态发现 (见 core.budget)。
+        """
+        # 结构化发现在这里才按严重度 / 置信度过滤并渲染为紧凑文本
+        thresholds = dict(
+            min_impact=project_settings.STATIC_MIN_IMPACT,
+            min_confidence=project_settings.STATIC_MIN_CONFIDENCE,
+        )
+        static_text = render_findings(static_result, **thresholds)
+        snippets = self.retrieve_rag_snippets(contract_code, static_text)
+
+        def _render(allocation: PromptAllocation) -> Tuple[str, str]:
+            return self.prompt_assembler.build(
+                self.format_rag_context(snippets[:allocation.rag_items]),
+                render_findings(
+                    static_result, limit=allocation.static_items, notes_chars=allocation.notes_chars, **thresholds
+                ),
+                contract_code,
+            )
+
+        full = PromptAllocation(
+            len(snippets), len(select_findings(static_result, **thresholds)), len(static_result.notes)
+        )
+        system_prompt, user_prompt, _ = self.prompt_budget.allocate(_render, full)
+        return system_prompt, user_prompt
+
+    @staticmethod
+    def needs_strong_model(static_result: StaticAnalysisResult) -> bool:
+        """静态发现中有不低于 CASCADE_ESCALATE_IMPACT 的条目时，级联路由跳过廉价模型"""
+        threshold = IMPACT_ORDER.index(llm_settings.CASCADE_ESCALATE_IMPACT)
+        return any(
+            finding.impact in IMPACT_ORDER and IMPACT_ORDER.index(finding.impact) >= threshold
+            for finding in static_result.findings
+        )
+
+    def validate_report(self, raw_data: Dict[str, Any]) -> AuditReport:
+        """步骤 4: 使用 Pydantic 校验 LLM 输出"""
+        try:
+            return self.report_schema.model_validate(raw_data)
+        except ValidationError as e:
+            print(f"❌ Pydantic 验证失败")
+            raise e
+
+    def plan_chunks(self, file_path: str, contract_code: str) -> List[CodeChunk]:
+        """
+        大文件按 contract/function 边界切块；小文件返回覆盖全文的单个分块。
+        代码超出 Token 预算中留给代码的份额时，按比例缩小分块行数。
+        """
+        language = detect_language(file_path, contract_code)
+        max_lines = project_settings.CHUNK_MAX_LINES
+        code_tokens = self.prompt_budget.count(contract_code)
+        code_limit = self.prompt_budget.code_limit(self.prompt_overhead, CODE_SHARE)
+        if code_tokens > code_limit:
+            total_lines = len(contract_code.splitlines())
+            max_lines = max(1, min(max_lines, total_lines * code_limit // code_tokens))
+        return split_source(contract_code, language, max_lines)
+
+    def preflight(self, file_path: str, contract_code: str) -> None:
+        """
+        在静态分析之前检查 Prompt 预算：按函数边界切块后仍有分块的代码超出单次请求预算时
+        抛出 PromptBudgetError，避免静态分析跑完才发现请求发不出去。
+        """
+        code_limit = self.prompt_budget.code_limit(self.prompt_overhead)
+        for chunk in self.plan_chunks(file_path, contract_code):
+            tokens = self.prompt_budget.count(chunk.code)
+            if tokens > code_limit:
+                raise PromptBudgetError(
+                    f"{file_path} 第 {chunk.start_line}-{chunk.end_line} 行 ({', '.join(chunk.names) or '顶层声明'}) "
+                    f"约 {tokens} Token，超出单次请求可用于代码的预算 {code_limit} Token"
+                )
+
+    def estimate_plan(self, plan: AuditPlan) -> None:
+        """发送前估算计划内全部请求的输入 Token 与费用，记入当前文件的指标"""
+        if not plan.jobs:
+            return
+        plan.estimated_tokens = sum(self.prompt_budget.count(job.system_prompt, job.user_prompt) for job in plan.jobs)
+        plan.estimated_cost = self.prompt_budget.estimate_cost(
+            plan.estimated_tokens, llm_settings.EXPECTED_OUTPUT_TOKENS * len(plan.jobs)
+        )
+        record_estimate(plan.estimated_tokens, plan.estimated_cost)
+        cost = f"约 ${plan.estimated_cost:.4f}" if plan.estimated_cost is not None else "模型不在价格表中，未估算费用"
+        print(
+            f"💰 [Budget] {plan.file_path or '合约'}: {len(plan.jobs)} 个请求，"
+            f"预计输入约 {plan.estimated_tokens} Token，{cost}"
+        )
+
+    # --- 审计计划：拆成 构建 Prompt → LLM 调用 → 校验 → 汇总 四步，批量流水线按步骤分别调度 ---
+
+    def _chunk_job(
+        self, file_path: str, total_lines: int, chunk: CodeChunk, static_result: StaticAnalysisResult
+    ) -> PromptJob:
+        chunk_code = prompt_templates.CHUNK_CONTEXT_TEMPLATE.format(
+            file_name=os.path.basename(file_path) or "contract",
+            start_line=chunk.start_line,
+            end_line=chunk.end_line,
+            total_lines=total_lines,
+            names=", ".join(chunk.names) or "(顶层声明)",
+            contract_code=chunk.code,
+        )
+        system_prompt, user_prompt = self.build_prompts(chunk_code, static_result)
+        return PromptJob(
+            chunk, system_prompt, user_prompt, relative_lines=True, escalate=self.needs_strong_model(static_result)
+        )
+
+    def _chunk_jobs(
+        self, file_path: str, contract_code: str, chunks: List[CodeChunk], static_result: StaticAnalysisResult
+    ) -> List[PromptJob]:
+        """每块只携带落在其行区间内的静态发现，行号改写为块内相对行号"""
+        total_lines = len(contract_code.splitlines())
+        return [
+            self._chunk_job(file_path, total_lines, chunk, relative_static_findings(chunk_static, chunk))
+            for chunk, chunk_static in zip(chunks, route_static_findings(static_result, chunks))
+        ]
+
+    def plan_audit(
+        self,
+        contract_code: str,
+        static_result: StaticAnalysisResult,
+        file_path: str = "",
+        incremental: bool = False,
+        changed_ranges: Optional[List[LineRange]] = None,
+        deduplicator: Optional[RegionDeduplicator] = None,
+    ) -> AuditPlan:
+        """
+        为一个文件生成全部 LLM 请求 (内部调用步骤 2 构建 Prompt)。
+        - 小文件：一个覆盖全文的请求；大文件：按函数边界分块，每块一个请求；
+        - 增量模式 (incremental=True)：只为与变更行相交的函数生成请求，静态发现只保留变更行附近的条目，
+          未改动函数复用区域缓存中的上次结论。changed_ranges 为 None 表示整个文件是新增的；
+        - 跨文件去重 (传入 deduplicator，仅全量审计)：批次内已由其他文件送审的相同函数区域不再发送，
+          等待其结论 (见 adopt_regions)。
+        """
+        plan = AuditPlan(file_path=file_path, contract_code=contract_code)
+        with timed("prompt"):
+            if incremental and changed_ranges is not None:
+                self._plan_diff(plan, static_result, changed_ranges)
+            else:
+                self._plan_full(plan, static_result, deduplicator)
+            self.estimate_plan(plan)
+        return plan
+
+    def _plan_full(
+        self, plan: AuditPlan, static_result: StaticAnalysisResult, deduplicator: Optional[RegionDeduplicator]
+    ) -> AuditPlan:
+        file_path, contract_code = plan.file_path, plan.contract_code
+        chunks = self.plan_chunks(file_path, contract_code)
+        try:
+            if deduplicator is not None and self._claim_regions(plan, static_result, deduplicator, chunks):
+                return self._plan_dedup(plan, static_result)
+            if len(chunks) > 1:
+                print(f"✂️  [System] 文件较大，按函数边界切分为 {len(chunks)} 块并行审计...")
+                plan.jobs = self._chunk_jobs(file_path, contract_code, chunks, static_result)
+            else:
+                system_prompt, user_prompt = self.build_prompts(contract_code, static_result)
+                plan.jobs = [PromptJob(
+                    chunks[0], system_prompt, user_prompt, escalate=self.needs_strong_model(static_result)
+                )]
+            return plan
+        except BaseException:
+            # 计划失败时本文件不会送审，必须通知等待其已登记区域的文件
+            self.share_regions(plan, None)
+            raise
+
+    def _plan_diff(
+        self, plan: AuditPlan, static_result: StaticAnalysisResult, changed_ranges: List[LineRange]
+    ) -> AuditPlan:
+        file_path, contract_code = plan.file_path, plan.contract_code
+        units = split_units(contract_code, detect_language(file_path, contract_code))
+        affected = [unit for unit in units if overlaps(unit, changed_ranges)]
+        untouched = [unit for unit in units if not overlaps(unit, changed_ranges)]
+
+        margin = project_settings.DIFF_CONTEXT_LINES
+        focused_static = filter_static_findings(
+            static_result,
+            lambda start, end: any(
+                start <= c_end + margin and c_start - margin <= end for c_start, c_end in changed_ranges
+            ),
+        )
+
+        plan.incremental = True
+        plan.recorded_units = affected
+        if affected:
+            chunks = pack_units(affected, project_settings.CHUNK_MAX_LINES)
+            print(f"🔀 [Diff] {file_path}: {len(affected)} 个函数区域有变更，切分为 {len(chunks)} 块审计...")
+            plan.jobs = self._chunk_jobs(file_path, contract_code, chunks, focused_static)
+
+        reused, missing = 0, 0
+        for unit in untouched:
+            cached = self.region_cache.lookup(self._model_name(), unit) if self.region_cache else None
+            if cached is None:
+                missing += 1
+                continue
+            reused += 1
+            if cached:
+                plan.reused.append((unit, self.report_schema(
+                    analysis_summary="(复用缓存结论)", vulnerabilities=cached
+                )))
+
+        plan.header = (
+            f"增量审计: 重新审计 {len(affected)} 个变更区域，复用 {reused} 个未改动区域的缓存结论"
+            + (f"，{missing} 个未改动区域没有历史结论 (未重新审计)" if missing else "")
+            + "。"
+        )
+        return plan
+
+    def _claim_regions(
+        self,
+        plan: AuditPlan,
+        static_result: StaticAnalysisResult,
+        deduplicator: RegionDeduplicator,
+        chunks: List[CodeChunk],
+    ) -> bool:
+        """
+        在批次指纹表中登记本文件的函数区域，返回是否按去重计划审计。
+        跳过重复区域会把剩余区域切成更多块时 (重复区域夹在中间)，省下的 Token 抵不上多出的请求，
+        此时撤销复用登记、按常规计划审计整个文件。
+        """
+        file_path, contract_code = plan.file_path, plan.contract_code
+        language = detect_language(file_path, contract_code)
+        units = split_units(contract_code, language)
+        for unit, unit_static in zip(units, route_static_findings(static_result, units)):
+            claim = deduplicator.claim(file_path, unit, language, unit_static)
+            if claim is not None:
+                group, is_owner = claim
+                (plan.owned if is_owner else plan.borrowed).append((unit, group))
+        if not plan.borrowed:
+            return False
+
+        borrowed_units = {id(unit) for unit, _ in plan.borrowed}
+        plan.recorded_units = [unit for unit in units if id(unit) not in borrowed_units]
+        if len(pack_units(plan.recorded_units, project_settings.CHUNK_MAX_LINES)) <= len(chunks):
+            return True
+        for unit, group in plan.borrowed:
+            deduplicator.release(group, file_path, unit)
+        plan.borrowed, plan.recorded_units = [], []
+        return False
+
+    def _plan_dedup(self, plan: AuditPlan, static_result: StaticAnalysisResult) -> AuditPlan:
+        file_path, contract_code = plan.file_path, plan.contract_code
+        if plan.recorded_units:
+            chunks = pack_units(plan.recorded_units, project_settings.CHUNK_MAX_LINES)
+            plan.jobs = self._chunk_jobs(file_path, contract_code, chunks, static_result)
+        print(
+            f"🔁 [Dedup] {file_path}: {len(plan.borrowed)} 个函数区域与批次内其他文件相同，"
+            f"复用其结论，{len(plan.jobs)} 块送审..."
+        )
+        plan.header = f"跨文件去重: {len(plan.borrowed)} 个函数区域与批次内其他文件相同，复用其审计结论。"
+        return plan
+
+    def share_regions(self, plan: AuditPlan, reports: Optional[List[Optional[AuditReport]]]) -> None:
+        """
+        把本文件送审区域的结论 (行号换算为区域内有效代码行的序号) 发布给批次内的重复区域。
+        reports 为 None 或含缺失项 (审计失败) 时发布 None，等待方不再阻塞。
+        """
+        if not plan.owned:
+            return
+        failed = reports is None or any(report is None for report in reports)
+        # 各请求的报告在校验时已映射回原文件行号
+        vulnerabilities = [] if failed else [vul for report in reports for vul in report.vulnerabilities]
+        language = detect_language(plan.file_path, plan.contract_code)
+        for unit, group in plan.owned:
+            if failed:
+                group.resolve(None)
+                continue
+            code_lines = code_line_numbers(unit.code, language)
+            group.resolve([
+                vul.model_copy(update={"line": to_code_ordinal(code_lines, vul.line - unit.start_line + 1)})
+                for vul in vulnerabilities if unit.contains(vul.line)
+            ])
+
+    def adopt_regions(self, plan: AuditPlan) -> List[Vulnerability]:
+        """
+        把 owner 发布的结论按有效代码行映射到本文件的重复区域，按 owner 文件合并后写入 plan.reused，返回复用的漏洞。
+        """
+        adopted: List[Vulnerability] = []
+        by_owner: Dict[str, List[Tuple[CodeChunk, List[Vulnerability]]]] = {}
+        missing = 0
+        language = detect_language(plan.file_path, plan.contract_code)
+        for unit, group in plan.borrowed:
+            conclusions = group.conclusions
+            if conclusions is None:
+                missing += 1
+                continue
+            code_lines = code_line_numbers(unit.code, language)
+            vulnerabilities = [
+                vul.model_copy(update={
+                    "line": min(unit.start_line + from_code_ordinal(code_lines, vul.line) - 1, unit.end_line)
+                })
+                for vul in conclusions
+            ]
+            by_owner.setdefault(group.owner.file_path, []).append((unit, vulnerabilities))
+            adopted.extend(vulnerabilities)
+        if not plan.jobs and missing == len(plan.borrowed):
+            # 本文件没有任何区域真正被审计过，不能当作审计通过
+            owners = sorted({group.owner.file_path for _, group in plan.borrowed})
+            raise RuntimeError(f"所有重复区域的原审计均失败: {', '.join(owners)}")
+        for owner_path, regions in by_owner.items():
+            span = CodeChunk(
+                min(unit.start_line for unit, _ in regions), max(unit.end_line for unit, _ in regions), "",
+                [name for unit, _ in regions for name in unit.names],
+            )
+            plan.reused.append((span, self.report_schema(
+                analysis_summary=f"(复用 {owner_path} 中 {len(regions)} 个相同区域的结论)",
+                vulnerabilities=[vul for _, vulnerabilities in regions for vul in vulnerabilities],
+            )))
+        if missing:
+            plan.header += f" 其中 {missing} 个区域的原审计失败，未包含其结论。"
+        return adopted
+
+    def validate_job(self, job: PromptJob, raw_data: Dict[str, Any]) -> AuditReport:
+        """步骤 4: 校验单个请求的输出，分块请求的相对行号映射回原文件"""
+        report = self.validate_report(raw_data)
+        return remap_report(report, job.chunk) if job.relative_lines else report
+
+    # --- 输出修复：不合法的输出只把错误与原输出发回模型修正，不重跑整份 Prompt ---
+
+    def build_repair_prompts(self, raw_output: RawOutput, error: Exception) -> Tuple[str, str]:
+        if not isinstance(raw_output, str):
+            raw_output = json.dumps(raw_output, ensure_ascii=False, indent=2)
+        return prompt_templates.REPAIR_SYSTEM_PROMPT, prompt_templates.REPAIR_PROMPT_TEMPLATE.format(
+            errors=describe_output_error(error), raw_output=raw_output
+        )
+
+    def salvage_report(self, raw_output: RawOutput) -> Optional[AuditReport]:
+        """
+        从不合法的输出中保留能通过校验的部分：逐条校验漏洞，丢弃不合法条目；
+        原文无法解析为 JSON 时，用增量解析器取出已闭合的漏洞对象。什么都取不到时返回 None。
+        """
+        summary = None
+        if isinstance(raw_output, str):
+            items = []
+            for element in IncrementalArrayParser("vulnerabilities").feed(raw_output):
+                try:
+                    items.append(json.loads(element))
+                except ValueError:
+                    continue
+        elif isinstance(raw_output, dict):
+            items = raw_output.get("vulnerabilities")
+            items = items if isinstance(items, list) else []
+            if isinstance(raw_output.get("analysis_summary"), str):
+                summary = raw_output["analysis_summary"]
+        else:
+            items = []
+
+        vulnerabilities = []
+        for item in items:
+            try:
+                vulnerabilities.append(Vulnerability.model_validate(item))
+            except ValidationError:
+                continue
+        if not vulnerabilities and summary is None:
+            return None
+
+        dropped = len(items) - len(vulnerabilities)
+        note = f"(模型输出未完全通过校验，保留 {len(vulnerabilities)} 条有效漏洞" + (
+            f"，丢弃 {dropped} 条不合法条目)" if dropped else ")"
+        )
+        return self.report_schema(
+            analysis_summary=f"{summary or '(摘要缺失)'}\n{note}", vulnerabilities=vulnerabilities
+        )
+
+    def _try_validate(
+        self, job: PromptJob, raw_output: RawOutput, error: Optional[Exception]
+    ) -> Tuple[Optional[AuditReport], Optional[Exception]]:
+        """返回 (报告, 错误)：已有解析错误时直接返回，否则做 Schema 校验"""
+        if error is not None:
+            return None, error
+        with timed("validate"):
+            try:
+                return self.validate_job(job, raw_output), None
+            except ValidationError as e:
+                return None, e
+
+    def _give_up(self, job: PromptJob, outputs: List[RawOutput], error: Exception) -> AuditReport:
+        """修复次数用尽：从各次输出中挑有效漏洞最多的部分结果；一条都取不到时抛出最后的错误"""
+        salvaged = [report for report in map(self.salvage_report, outputs) if report is not None]
+        if not salvaged:
+            raise error
+        report = max(salvaged, key=lambda r: len(r.vulnerabilities))
+        print(f"⚠️ [Repair] 输出仍不合法，保留部分结果 ({len(report.vulnerabilities)} 条漏洞)")
+        return remap_report(report, job.chunk) if job.relative_lines else report
+
+    def _log_repair(self, attempt: int, error: Exception) -> None:
+        kind = "Schema 校验失败" if isinstance(error, ValidationError) else "JSON 解析失败"
+        print(f"🔧 [Repair] {kind}，发送修复请求 ({attempt}/{llm_settings.REPAIR_MAX_ATTEMPTS})...")
+
+    async def _acall(self, call: Awaitable[Dict[str, Any]]) -> Tuple[RawOutput, Optional[Exception]]:
+        """调用 LLM，返回 (输出, 解析错误)；输出不是合法 JSON 时返回原文与错误"""
+        with timed("llm"):
+            try:
+                return await call, None
+            except LLMOutputError as e:
+                return e.raw_output, e
+
+    def run_job(self, job: PromptJob) -> AuditReport:
+        """
+        步骤 3 + 4 的同步入口：在新的事件循环中运行 arun_job。
+        同步调用同样经过服务的 CallPolicy (RPM / TPM 预算与 429 / 5xx 退避重试)，不直接调用同步 SDK。
+        """
+        return asyncio.run(self.arun_job(job))
+
+    async def arun_job(self, job: PromptJob, on_vulnerability: Optional[VulnerabilityCallback] = None) -> AuditReport:
+        """
+        步骤 3 + 4：调用 LLM 并校验，输出不合法时进行有限次数的修复。
+        传入回调时首次请求走流式接口 (修复请求不再回调，避免重复上报)。
+        """
+        if on_vulnerability is not None:
+            first_call = self.agenerate_streaming(job, on_vulnerability)
+        else:
+            first_call = self.llm_service.agenerate_response(job.system_prompt, job.user_prompt, escalate=job.escalate)
+        raw_output, error = await self._acall(first_call)
+        outputs = [raw_output]
+        report, error = self._try_validate(job, raw_output, error)
+        for attempt in range(1, llm_settings.REPAIR_MAX_ATTEMPTS + 1):
+            if report is not None:
+                break
+            self._log_repair(attempt, error)
+            repair_call = self.llm_service.agenerate_response(*self.build_repair_prompts(raw_output, error))
+            raw_output, error = await self._acall(repair_call)
+            outputs.append(raw_output)
+            report, error = self._try_validate(job, raw_output, error)
+        return report if report is not None else self._give_up(job, outputs, error)
+
+    async def agenerate_streaming(self, job: PromptJob, on_vulnerability: VulnerabilityCallback) -> Dict[str, Any]:
+        """
+        步骤 3 的流式版本：边接收边解析 vulnerabilities 数组，每个元素一闭合就校验并回调，
+        不必等整份报告生成完毕。返回完整输出解析后的字典，仍由 validate_job 做最终校验。
+        """
+        parser = IncrementalArrayParser("vulnerabilities")
+        async for delta in self.llm_service.astream_response(job.system_prompt, job.user_prompt, escalate=job.escalate):
+            for element in parser.feed(delta):
+                try:
+                    vul = Vulnerability(**json.loads(element))
+                except (ValueError, TypeError):
+                    # 单条不合法时不中断流，最终校验会给出完整的错误
+                    continue
+                on_vulnerability(remap_vulnerability(vul, job.chunk) if job.relative_lines else vul)
+        return self.llm_service.parse_json_output(parser.text)
+
+    def finish_audit(self, plan: AuditPlan, reports: List[AuditReport]) -> AuditReport:
+        """合并各请求的报告，写入区域缓存，增量 / 去重模式下拼上复用的结论与摘要头"""
+        chunk_reports = [(job.chunk, report) for job, report in zip(plan.jobs, reports)]
+        if plan.incremental or plan.borrowed:
+            if chunk_reports:
+                self._record_regions(
+                    plan.file_path, plan.contract_code, merge_reports(chunk_reports), units=plan.recorded_units
+                )
+            merged = merge_reports(chunk_reports + plan.reused)
+            return merged.model_copy(update={
+                "analysis_summary": f"{plan.header}\n{merged.analysis_summary}".rstrip()
+            })
+
+        if len(reports) == 1 and not plan.jobs[0].relative_lines:
+            report = reports[0]
+        else:
+            report = merge_reports(chunk_reports)
+        return self._record_regions(plan.file_path, plan.contract_code, report)
+
+    async def _arun_jobs(
+        self, plan: AuditPlan, on_vulnerability: Optional[VulnerabilityCallback] = None
+    ) -> List[AuditReport]:
+        """并行执行一个计划内的全部请求 (分块并发受 CHUNK_CONCURRENCY 限制)；传入回调时走流式接口"""
+        semaphore = asyncio.Semaphore(project_settings.CHUNK_CONCURRENCY)
+
+        async def _run(job: PromptJob) -> AuditReport:
+            async with semaphore:
+                return await self.arun_job(job, on_vulnerability)
+
+        return list(await asyncio.gather(*[_run(job) for job in plan.jobs]))
+
+    def _record_regions(self, file_path: str, contract_code: str, report: AuditReport,
+                        units: Optional[List[CodeChunk]] = None) -> AuditReport:
+        """把审计结论按函数区域写入区域缓存 (未启用缓存时直接返回)"""
+        if self.region_cache is not None:
+            if units is None:
+                units = split_units(contract_code, detect_language(file_path, contract_code))
+            self.region_cache.store(self._model_name(), units, report)
+        return report
+
+    def _model_name(self) -> str:
+        return getattr(self.llm_service, "model_name", llm_settings.MODEL_NAME)
+
+    def analyze_with_static(
+        self,
+        contract_code: str,
+        static_result: StaticAnalysisResult,
+        file_path: str = "",
+        on_vulnerability: Optional[VulnerabilityCallback] = None,
+    ) -> AuditReport:
+        """
+        在已有静态分析结果的基础上完成 Prompt 构建、LLM 调用与校验。
+        单块文件也走异步路径，与批量模式一样经过 CallPolicy 的限流与退避重试。
+        """
+        plan = self.plan_audit(contract_code, static_result, file_path=file_path)
+        reports = asyncio.run(self._arun_jobs(plan, on_vulnerability))
+        return self.finish_audit(plan, reports)
+
+    async def aanalyze_with_static(
+        self,
+        contract_code: str,
+        static_result: StaticAnalysisResult,
+        file_path: str = "",
+        on_vulnerability: Optional[VulnerabilityCallback] = None,
+    ) -> AuditReport:
+        """analyze_with_static 的异步版本，使用服务的 agenerate_response (带重试与限流)"""
+        plan = self.plan_audit(contract_code, static_result, file_path=file_path)
+        return self.finish_audit(plan, await self._arun_jobs(plan, on_vulnerability))
+
+    async def aanalyze_diff_with_static(
+        self,
+        contract_code: str,
+        static_result: StaticAnalysisResult,
+        changed_ranges: Optional[List[LineRange]],
+        file_path: str = "",
+        on_vulnerability: Optional[VulnerabilityCallback] = None,
+    ) -> AuditReport:
+        """增量审计：只把与变更行相交的函数送给 LLM，其余区域复用缓存结论 (规则见 plan_audit)"""
+        plan = self.plan_audit(
+            contract_code, static_result, file_path=file_path, incremental=True, changed_ranges=changed_ranges
+        )
+        return self.finish_audit(plan, await self._arun_jobs(plan, on_vulnerability))
+
+    def analyze_diff(
+        self,
+        file_path: str,
+        contract_code: str,
+        changed_ranges: Optional[List[LineRange]],
+        on_vulnerability: Optional[VulnerabilityCallback] = None,
+    ) -> AuditReport:
+        """增量审计的同步入口：静态分析 + aanalyze_diff_with_static"""
+        self.preflight(file_path, contract_code)
+        print(f"🔍 [System] 正在运行静态分析 (模式: {project_settings.PROJECT_TYPE})...")
+        static_result = self.run_static_analysis(file_path)
+        print(f"✅ [System] 静态分析完成。")
+        return asyncio.run(self.aanalyze_diff_with_static(
+            contract_code, static_result, changed_ranges, file_path=file_path, on_vulnerability=on_vulnerability
+        ))
+
+    def analyze(
+        self, file_path: str, contract_code: str, on_vulnerability: Optional[VulnerabilityCallback] = None
+    ) -> AuditReport:
+
+        # 0. 📏 Prompt 预算预检：代码本身放不下时不必先跑静态分析
+        self.preflight(file_path, contract_code)
+
         # 1. 🚀 调用多态的静态分析器
         # 无论是 Slither 还是未来的 SolanaAnalyzer，调用方式都一样
         print(f"🔍 [System] 正在运行静态分析 (模式: {project_settings.PROJECT_TYPE})...")
-        
-        static_result = self.static_analyzer.run_analysis(file_path)
-        
+
+        static_result = self.run_static_analysis(file_path)
+
         print(f"✅ [System] 静态分析完成。")
-        print(f"   (摘要: {static_result[:50].replace(chr(10), ' ')}...)")
-        
-        schema_json = json.dumps(self.report_schema.model_json_schema(), indent=2)
-        
-        # 2. 📝 构建混合 Prompt
-        system_prompt = prompt_templates.SYSTEM_PROMPT_TEMPLATE
-        
-        # 使用新的占位符 static_analysis_result
-        user_prompt = prompt_templates.USER_PROMPT_TEMPLATE.format(
-            rag_context=self.rag_context,
-            static_analysis_result=static_result,  
-            schema_json=schema_json,
-            contract_code=contract_code
-        )
-        
-        # 3. 🧠 调用 LLM
-        print(f"🧠 [AI] 正在调用 {llm_settings.MODEL_NAME} 进行语义分析...")
-        raw_data = self.llm_service.generate_response(system_prompt, user_prompt)
+        print(f"   (摘要: {static_result.summary_line()})")
 
-        # 4. ✅ 验证与返回
-        try:
-            report = self.report_schema(**raw_data)
-            return report
-        except ValidationError as e:
-            print(f"❌ Pydantic 验证失败")
-            raise e
\ No newline at end of file
+        # 2. 📝 构建混合 Prompt + 3. 🧠 调用 LLM + 4. ✅ 验证与返回
+        # 传入 on_vulnerability 时走流式接口，每解析出一条漏洞立即回调
+        print(f"🧠 [AI] 正在调用 {llm_settings.MODEL_NAME} 进行语义分析...")
+        return self.analyze_with_static(
+            contract_code, static_result, file_path=file_path, on_vulnerability=on_vulnerability
+        )
@@ -0,0 +1,152 @@
+# core/batch.py
+"""
+批量审计模式：接受目录 / glob / 文件列表，并发执行审计。
+
+- 文件按 静态分析 → 构建 Prompt → LLM 调用 → 校验 的分阶段流水线处理 (见 core.pipeline)，
+  各阶段之间是有界队列：静态分析与 LLM 等待互相重叠，下游跟不上时上游自动放缓；
+- 静态分析 (Slither/Soteria 子进程) 默认以异步子进程并发执行 (也可切换为有界进程池)，
+  单个工具超时或被取消时整组杀掉，不会拖住其他文件；
+  同一项目下的文件合并为一次项目级分析 (只编译一次)，再按文件拆分结果；
+- 每个文件完成后立即产出结果，不必等待整个批次结束；
+- 传入结果日志时逐步落盘，中断后可续跑 (见 core.journal)；
+- 启用跨文件去重时，批次内重复的函数区域只送审一次，运行结束后 self.deduplicator 保存分组结果。
+"""
+import contextlib
+import glob
+import os
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from core.analyzer import AuditAnalyzer
+from core.budget import CostLedger
+from core.dedup import RegionDeduplicator
+from core.diff import LineRange
+from core.journal import AuditJournal
+from core.pipeline import AuditPipeline, BatchResult
+from core.pydantic_schema import Vulnerability
+
+# 文件后缀 -> 项目类型
+EXTENSION_PROJECT_TYPES: Dict[str, str] = {
+    ".sol": "EVM",
+    ".rs": "SOLANA",
+    ".move": "MOVE",
+}
+
+# 遍历目录时跳过的依赖 / 构建产物目录
+IGNORED_DIRS = {".git", "node_modules", "target", "out", "cache", "artifacts", "lib", "__pycache__"}
+
+
+def collect_contract_files(targets: Iterable[str]) -> List[str]:
+    """
+    将命令行传入的目标 (文件 / 目录 / glob) 展开为去重后的合约文件列表。
+    目录会被递归遍历，只保留已知后缀的文件。
+    """
+    files: List[str] = []
+
+    def _add_dir(directory: str):
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+            for name in sorted(names):
+                if os.path.splitext(name)[1] in EXTENSION_PROJECT_TYPES:
+                    files.append(os.path.join(root, name))
+
+    for target in targets:
+        if os.path.isdir(target):
+            _add_dir(target)
+        elif glob.has_magic(target):
+            for match in sorted(glob.glob(target, recursive=True)):
+                if os.path.isdir(match):
+                    _add_dir(match)
+                elif os.path.splitext(match)[1] in EXTENSION_PROJECT_TYPES:
+                    files.append(match)
+        else:
+            files.append(target)
+
+    # 保序去重
+    seen = set()
+    unique_files = []
+    for f in files:
+        key = os.path.abspath(f)
+        if key not in seen:
+            seen.add(key)
+            unique_files.append(f)
+    return unique_files
+
+
+def detect_file_project_type(file_path: str, default: str = "EVM") -> str:
+    """根据文件后缀推断项目类型"""
+    return EXTENSION_PROJECT_TYPES.get(os.path.splitext(file_path)[1], default)
+
+
+class BatchAuditRunner:
+    """
+    批量审计编排器。
+    analyzers: 项目类型 -> AuditAnalyzer，同一批次可以混合 .sol 与 .rs 文件。
+    """
+
+    def __init__(
+        self,
+        analyzers: Dict[str, AuditAnalyzer],
+        static_workers: int,
+        llm_concurrency: int,
+        project_type_override: Optional[str] = None,
+        changed_ranges: Optional[Dict[str, Optional[List[LineRange]]]] = None,
+        project_mode: bool = True,
+        static_executor: str = "async",
+        queue_size: int = 16,
+        on_vulnerability: Optional[Callable[[str, Vulnerability], None]] = None,
+        dedup_min_lines: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        cost_ledger: Optional[CostLedger] = None,
+        journal: Optional[AuditJournal] = None,
+    ):
+        if static_workers < 1 or llm_concurrency < 1:
+            raise ValueError("static_workers 与 llm_concurrency 必须 >= 1")
+        self.analyzers = analyzers
+        self.static_workers = static_workers
+        self.llm_concurrency = llm_concurrency
+        # 命令行 --type 显式指定时，整批文件统一使用该类型
+        self.project_type_override = project_type_override
+        # 增量模式：文件 -> 相对 base ref 的变更行区间 (None 表示新增文件)
+        self.changed_ranges = changed_ranges
+        # 项目级静态分析：同一项目根目录下的文件共享一次编译
+        self.project_mode = project_mode
+        # 静态分析执行方式："async" 为事件循环内的异步子进程，"process" 为进程池
+        self.static_executor = static_executor
+        # 流水线各阶段之间的队列容量 (背压)
+        self.queue_size = queue_size
+        # 流式模式：(文件, 漏洞) 回调
+        self.on_vulnerability = on_vulnerability
+        # 跨文件去重：区域最少有效代码行数，None 表示不去重；每次 run() 使用新的指纹表
+        self.dedup_min_lines = dedup_min_lines
+        self.deduplicator: Optional[RegionDeduplicator] = None
+        # 整批的费用上限 (美元，按发送前预估占用额度)，None 表示不限制
+        self.max_cost = max_cost
+        # 多个进程共享的额度账本 (分片模式)；设置后替代 max_cost
+        self.cost_ledger = cost_ledger
+        # 结果日志：逐步落盘，续跑时跳过已完成的工作
+        self.journal = journal
+
+    async def run(self, file_paths: List[str]) -> AsyncIterator[BatchResult]:
+        """按完成顺序流式产出每个文件的审计结果"""
+        self.deduplicator = None
+        if self.dedup_min_lines is not None and len(file_paths) > 1:
+            self.deduplicator = RegionDeduplicator(self.dedup_min_lines)
+        pipeline = AuditPipeline(
+            self.analyzers,
+            static_workers=self.static_workers,
+            llm_concurrency=self.llm_concurrency,
+            queue_size=self.queue_size,
+            static_executor=self.static_executor,
+            project_mode=self.project_mode,
+            changed_ranges=self.changed_ranges,
+            on_vulnerability=self.on_vulnerability,
+            deduplicator=self.deduplicator,
+            max_cost=self.max_cost,
+            cost_ledger=self.cost_ledger,
+            journal=self.journal,
+        )
+        files = [(path, self.project_type_override or detect_file_project_type(path)) for path in file_paths]
+        # aclosing：调用方提前退出时立即关闭流水线并取消其 worker
+        async with contextlib.aclosing(pipeline.run(files)) as results:
+            async for result in results:
+                yield result
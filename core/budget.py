@@ -0,0 +1,123 @@
+# core/budget.py
+"""
+发送前的 Prompt 预算：在调用模型之前估算每个请求的 Token 数，把单次请求的预算分给各部分。
+
+    system 前缀 (角色 / 审计步骤 / Schema，不可压缩) > 代码 > 静态发现 > 未结构化工具输出 > 知识库检索条目
+
+- 超出预算时从优先级最低的部分开始压缩：先减少检索条目，再截断未结构化的工具输出，
+  最后从严重度最低的一端裁剪静态发现；只剩代码仍放不下时抛出 PromptBudgetError (不发送请求)；
+- 大文件按 CODE_SHARE 比例给代码留出空间来决定分块大小，为静态发现与检索条目保留余量；
+- 按价格表给出每个文件发送前的费用预估 (不计服务端缓存折扣，偏保守)，供 --max-cost 使用；
+  CostLedger 记录费用上限的已占用额度 (分片模式下由工作队列提供多进程共享的账本)。
+"""
+from dataclasses import dataclass, replace
+from typing import Callable, Optional, Tuple
+
+from llm_services.pricing import estimate_worst_case_cost
+from llm_services.tokens import count_tokens, get_token_profile
+
+# 分块时代码最多占 (预算 - 固定开销) 的比例，其余留给静态发现与检索条目
+CODE_SHARE = 0.75
+
+
+class PromptBudgetError(ValueError):
+    """代码本身已超出单次请求的 Token 预算 (无法通过压缩其他部分解决)"""
+
+
+@dataclass
+class PromptAllocation:
+    """实际进入 Prompt 的各部分规模：检索条目数 / 静态发现条数 / 未结构化输出字符数"""
+    rag_items: int
+    static_items: int
+    notes_chars: int
+
+
+class PromptBudget:
+    """
+    model_name: 用于选择 Token 估算方式与价格 (级联 / 集成取最保守的成员)
+    max_prompt_tokens: 单次请求的输入 Token 上限；为 0 时取 上下文窗口 - output_reserve
+    output_reserve: 为模型输出预留的 Token 数
+    """
+
+    def __init__(self, model_name: str, max_prompt_tokens: int = 0, output_reserve: int = 2048):
+        self.model_name = model_name
+        window_limit = get_token_profile(model_name).context_window - output_reserve
+        self.max_prompt_tokens = min(max_prompt_tokens, window_limit) if max_prompt_tokens > 0 else window_limit
+
+    def count(self, *texts: str) -> int:
+        return sum(count_tokens(text, self.model_name) for text in texts)
+
+    def fits(self, system_prompt: str, user_prompt: str) -> bool:
+        return self.count(system_prompt, user_prompt) <= self.max_prompt_tokens
+
+    def code_limit(self, overhead_tokens: int, share: float = 1.0) -> int:
+        """扣除固定开销 (system 前缀与模板) 后可用于代码的 Token 数"""
+        return max(int((self.max_prompt_tokens - overhead_tokens) * share), 0)
+
+    def allocate(
+        self, render: Callable[[PromptAllocation], Tuple[str, str]], full: PromptAllocation
+    ) -> Tuple[str, str, PromptAllocation]:
+        """
+        render 按给定规模渲染出 (system_prompt, user_prompt)。先尝试完整内容，超出预算时依次压缩
+        检索条目 → 未结构化输出 → 静态发现，返回 (system_prompt, user_prompt, 实际规模)。
+        """
+        allocation = full
+        prompts = render(allocation)
+        if self.fits(*prompts):
+            return (*prompts, allocation)
+
+        while allocation.rag_items > 0 and not self.fits(*prompts):
+            allocation = replace(allocation, rag_items=allocation.rag_items - 1)
+            prompts = render(allocation)
+        while allocation.notes_chars > 0 and not self.fits(*prompts):
+            allocation = replace(allocation, notes_chars=allocation.notes_chars // 2)
+            prompts = render(allocation)
+        if not self.fits(*prompts) and allocation.static_items > 0:
+            # 保留的发现越多 Prompt 越长 (单调)，二分查找能放下的最大条数
+            low, high = 0, allocation.static_items
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.fits(*render(replace(allocation, static_items=middle))):
+                    low = middle
+                else:
+                    high = middle - 1
+            allocation = replace(allocation, static_items=low)
+            prompts = render(allocation)
+
+        tokens = self.count(*prompts)
+        if tokens > self.max_prompt_tokens:
+            raise PromptBudgetError(
+                f"Prompt 约 {tokens} Token，去掉检索条目与静态发现后仍超出单次请求预算 {self.max_prompt_tokens} Token"
+            )
+        print(
+            f"📏 [Budget] Prompt 超出预算 {self.max_prompt_tokens} Token，已压缩: 检索条目 {full.rag_items}→"
+            f"{allocation.rag_items}，静态发现 {full.static_items}→{allocation.static_items}"
+            + (f"，工具输出 {full.notes_chars}→{allocation.notes_chars} 字符" if full.notes_chars else "")
+        )
+        return (*prompts, allocation)
+
+    def estimate_cost(self, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        return estimate_worst_case_cost(self.model_name, prompt_tokens, completion_tokens)
+
+
+class CostLedger:
+    """
+    费用上限的额度账本 (单进程)：文件发送前按预估费用占用额度，完成后以实际费用修正。
+    子类可以把账本放到进程之外 (见 core.workqueue.QueueCostLedger)，多个 worker 共享同一上限。
+    """
+
+    def __init__(self, max_cost: float):
+        self.max_cost = max_cost
+        self.committed = 0.0
+
+    def reserve(self, cost: float) -> Optional[float]:
+        """额度足够时占用 cost 并返回 None，否则不占用并返回剩余额度"""
+        remaining = self.max_cost - self.committed
+        if cost > remaining:
+            return remaining
+        self.committed += cost
+        return None
+
+    def settle(self, reserved: float, actual: float) -> None:
+        """文件结束：释放预估占用，计入实际费用"""
+        self.committed += actual - reserved
@@ -0,0 +1,381 @@
+# core/cache.py
+"""
+基于内容寻址的磁盘结果缓存。
+
+- 静态分析缓存：key = 分析器 + 工具版本 + 合约内容哈希
+- LLM 缓存：key = 模型名 + temperature + Prompt 哈希
+
+两类缓存都以装饰器的形式包裹原有的 AbstractStaticAnalyzer / AbstractLLMService，
+对 AuditAnalyzer 完全透明。另有按函数区域缓存审计结论的 RegionResultCache，供增量审计使用。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from core.chunker import CodeChunk
+from core.pydantic_schema import AuditReport, Vulnerability
+from core.metrics import record_static_cache_hit
+from llm_services.abstract_service import AbstractLLMService, LLMOutputError
+from llm_services.usage import usage_tracker
+from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
+from static_analyzers.findings import StaticAnalysisResult
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    一个命名空间下的 JSON 结果缓存，每条记录一个文件。
+    写入使用临时文件 + os.replace，保证多进程并发读写时不会读到半截内容。
+    """
+
+    def __init__(self, cache_dir: str, namespace: str, max_bytes: int, max_age_seconds: float):
+        self.root = os.path.join(cache_dir, namespace)
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """将任意可 JSON 序列化的组成部分合成一个稳定的 key"""
+        return sha256_text(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                self.misses += 1
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["value"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created_at": time.time(), "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        entries = []
+        for root, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def evict(self) -> int:
+        """先删除过期条目，再按写入时间从旧到新删除直到总大小低于上限，返回删除数量"""
+        now = time.time()
+        removed = 0
+        alive = []
+        for path, mtime, size in self._entries():
+            if now - mtime > self.max_age_seconds or path.endswith(".tmp"):
+                removed += self._remove(path)
+            else:
+                alive.append((path, mtime, size))
+
+        total = sum(size for _, _, size in alive)
+        for path, _, size in sorted(alive, key=lambda e: e[1]):
+            if total <= self.max_bytes:
+                break
+            removed += self._remove(path)
+            total -= size
+        return removed
+
+    def purge(self) -> int:
+        removed = 0
+        for path, _, _ in self._entries():
+            removed += self._remove(path)
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+class CachedStaticAnalyzer(AbstractStaticAnalyzer):
+    """静态分析缓存装饰器：内容与工具版本不变时直接复用上次结果，不再启动子进程"""
+
+    # StaticAnalysisResult 结构变化时递增，使旧格式的缓存条目自然失效
+    FORMAT_VERSION = "findings-v1"
+
+    def __init__(self, inner: AbstractStaticAnalyzer, cache: ResultCache):
+        self.inner = inner
+        self.cache = cache
+        self.limits = inner.limits
+        # 在主进程中解析一次工具版本，随实例一起被 pickle 到进程池
+        self._tool_version = inner.tool_version()
+
+    def check_installed(self) -> bool:
+        return self.inner.check_installed()
+
+    def tool_version(self) -> str:
+        return self._tool_version
+
+    def content_fingerprint(self, file_path: str) -> str:
+        return self.inner.content_fingerprint(file_path)
+
+    def project_root(self, file_path: str) -> Optional[str]:
+        return self.inner.project_root(file_path)
+
+    def project_fingerprint(self, root: str) -> str:
+        return self.inner.project_fingerprint(root)
+
+    # --- 缓存 key 与读写 ---
+
+    def _key(self, *parts: str) -> str:
+        return ResultCache.make_key(type(self.inner).__name__, self._tool_version, *parts, self.FORMAT_VERSION)
+
+    def _file_key(self, file_path: str) -> str:
+        return self._key(self.inner.content_fingerprint(file_path))
+
+    def _project_keys(self, root: str, file_paths: List[str]) -> Dict[str, str]:
+        """项目级结果按 (项目指纹, 文件相对路径) 缓存：项目内任一源码 / 配置变化都会使整组条目失效"""
+        fingerprint = self.inner.project_fingerprint(root)
+        return {
+            path: self._key("project", fingerprint, os.path.relpath(os.path.abspath(path), root))
+            for path in file_paths
+        }
+
+    def _workspace_key(self, root: str) -> str:
+        """整项目分析结果按 (项目根目录, 源码树指纹) 缓存，同一 workspace 的所有文件跨运行共享一次工具运行"""
+        return self._key("workspace", os.path.abspath(root), self.inner.project_fingerprint(root))
+
+    def _load(self, key: str) -> Optional[StaticAnalysisResult]:
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        record_static_cache_hit()
+        return StaticAnalysisResult(**cached)
+
+    def _store(self, key: str, result: StaticAnalysisResult) -> StaticAnalysisResult:
+        # 工具缺失 / 执行失败 / 超时的结果不缓存，下次重新运行
+        if not result.failed:
+            self.cache.set(key, result.model_dump())
+        return result
+
+    def _load_project(self, root: str, keys: Dict[str, str]) -> Dict[str, StaticAnalysisResult]:
+        results = {}
+        for path, key in keys.items():
+            cached = self._load(key)
+            if cached is not None:
+                results[path] = cached
+        if len(results) == len(keys):
+            print(f"💾 [Cache] 项目级静态分析命中缓存: {root} ({len(keys)} 个文件)")
+        return results
+
+    # --- 单文件 ---
+
+    def run_analysis(self, file_path: str) -> StaticAnalysisResult:
+        if not os.path.exists(file_path) or not self.inner.check_installed():
+            return self.inner.run_analysis(file_path)
+
+        if self.inner.WHOLE_PROJECT:
+            root = self.inner.project_root(file_path)
+            return self.inner.split_by_file(root, self.run_workspace_analysis(root), [file_path])[file_path]
+
+        key = self._file_key(file_path)
+        cached = self._load(key)
+        if cached is not None:
+            print(f"💾 [Cache] 静态分析命中缓存: {file_path}")
+            return cached
+        return self._store(key, self.inner.run_analysis(file_path))
+
+    async def arun_analysis(self, file_path: str) -> StaticAnalysisResult:
+        if not os.path.exists(file_path) or not self.inner.check_installed():
+            return await self.inner.arun_analysis(file_path)
+
+        if self.inner.WHOLE_PROJECT:
+            root = self.inner.project_root(file_path)
+            workspace = await self.arun_workspace_analysis(root)
+            return self.inner.split_by_file(root, workspace, [file_path])[file_path]
+
+        key = self._file_key(file_path)
+        cached = self._load(key)
+        if cached is not None:
+            print(f"💾 [Cache] 静态分析命中缓存: {file_path}")
+            return cached
+        return self._store(key, await self.inner.arun_analysis(file_path))
+
+    # --- 项目级 (只有全部文件命中时才跳过整次编译) ---
+
+    def run_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        if not self.inner.check_installed():
+            return self.inner.run_project_analysis(root, file_paths)
+
+        if self.inner.WHOLE_PROJECT:
+            return self.inner.split_by_file(root, self.run_workspace_analysis(root), file_paths)
+
+        keys = self._project_keys(root, file_paths)
+        results = self._load_project(root, keys)
+        missing = [path for path in file_paths if path not in results]
+        if missing:
+            for path, result in self.inner.run_project_analysis(root, missing).items():
+                results[path] = self._store(keys[path], result)
+        return results
+
+    async def arun_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        if not self.inner.check_installed():
+            return await self.inner.arun_project_analysis(root, file_paths)
+
+        if self.inner.WHOLE_PROJECT:
+            return self.inner.split_by_file(root, await self.arun_workspace_analysis(root), file_paths)
+
+        keys = await asyncio.to_thread(self._project_keys, root, file_paths)
+        results = self._load_project(root, keys)
+        missing = [path for path in file_paths if path not in results]
+        if missing:
+            for path, result in (await self.inner.arun_project_analysis(root, missing)).items():
+                results[path] = self._store(keys[path], result)
+        return results
+
+    # --- 整项目 (WHOLE_PROJECT 工具) ---
+
+    def run_workspace_analysis(self, root: str) -> StaticAnalysisResult:
+        key = self._workspace_key(root)
+        cached = self._load(key)
+        if cached is not None:
+            print(f"💾 [Cache] 整项目静态分析命中缓存: {root}")
+            return cached
+        return self._store(key, self.inner.run_workspace_analysis(root))
+
+    async def arun_workspace_analysis(self, root: str) -> StaticAnalysisResult:
+        key = await asyncio.to_thread(self._workspace_key, root)
+        cached = self._load(key)
+        if cached is not None:
+            print(f"💾 [Cache] 整项目静态分析命中缓存: {root}")
+            return cached
+        return self._store(key, await self.inner.arun_workspace_analysis(root))
+
+
+class CachedLLMService(AbstractLLMService):
+    """LLM 响应缓存装饰器：相同模型、温度与 Prompt 不再重复消耗 Token"""
+
+    def __init__(self, inner: AbstractLLMService, cache: ResultCache):
+        self.inner = inner
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # 透传 model_name / temperature 等属性
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _key(self, system_prompt: str, user_prompt: str) -> str:
+        return ResultCache.make_key(
+            getattr(self.inner, "model_name", type(self.inner).__name__),
+            getattr(self.inner, "temperature", None),
+            sha256_text(system_prompt + "\x00" + user_prompt),
+        )
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            model = getattr(self.inner, "model_name", type(self.inner).__name__)
+            print(f"💾 [Cache] LLM 响应命中缓存 (model: {model})")
+            usage_tracker.record_cache_hit(model)
+        return cached
+
+    def generate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        key = self._key(system_prompt, user_prompt)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        result = self.inner.generate_response(system_prompt, user_prompt, **kwargs)
+        self.cache.set(key, result)
+        return result
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        key = self._key(system_prompt, user_prompt)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        result = await self.inner.agenerate_response(system_prompt, user_prompt, **kwargs)
+        self.cache.set(key, result)
+        return result
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        """命中缓存时一次性产出缓存结果；否则透传内部服务的流，结束后解析完整文本写入缓存"""
+        key = self._key(system_prompt, user_prompt)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield json.dumps(cached, ensure_ascii=False)
+            return
+
+        parts: List[str] = []
+        async for delta in self.inner.astream_response(system_prompt, user_prompt, **kwargs):
+            parts.append(delta)
+            yield delta
+        try:
+            self.cache.set(key, self.parse_json_output("".join(parts)))
+        except LLMOutputError:
+            # 输出不是合法 JSON：交给调用方的修复流程处理，不写缓存
+            pass
+
+
+class RegionResultCache:
+    """
+    按代码区域 (函数级单元) 缓存 LLM 审计结论。
+    key = 模型名 + 区域代码哈希，value 为区域内的漏洞 (行号相对区域首行)。
+    增量审计时，未改动的区域即使整体平移了行号也能直接复用上次的结论。
+    """
+
+    def __init__(self, cache: ResultCache):
+        self.cache = cache
+
+    @staticmethod
+    def _key(model_name: str, unit: CodeChunk) -> str:
+        return ResultCache.make_key("region", model_name, sha256_text(unit.code))
+
+    def store(self, model_name: str, units: List[CodeChunk], report: AuditReport) -> None:
+        """把文件级报告 (原文件行号) 拆分到各区域后写入缓存"""
+        for unit in units:
+            relative = [
+                vul.model_copy(update={"line": vul.line - unit.start_line + 1}).model_dump()
+                for vul in report.vulnerabilities
+                if unit.contains(vul.line)
+            ]
+            self.cache.set(self._key(model_name, unit), relative)
+
+    def lookup(self, model_name: str, unit: CodeChunk) -> Optional[List[Vulnerability]]:
+        """命中时返回映射到区域当前位置的漏洞列表 (可能为空列表)，未命中返回 None"""
+        cached = self.cache.get(self._key(model_name, unit))
+        if cached is None:
+            return None
+        return [
+            Vulnerability(**{**item, "line": unit.start_line + item["line"] - 1})
+            for item in cached
+        ]
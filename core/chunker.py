@@ -0,0 +1,250 @@
+# core/chunker.py
+"""
+大合约分块：在 contract / impl / function 边界把源码切成若干连续的行区间，
+每块只附带行号区间与之相交的静态分析发现，分块并行审计后再合并为一份 AuditReport。
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence, Tuple
+
+from core.pydantic_schema import CONFIDENCE_ORDER, AuditReport, Vulnerability
+from static_analyzers.findings import StaticAnalysisResult
+
+# 声明起始行 (可以作为切分点的位置)
+SOLIDITY_DECL_RE = re.compile(
+    r"^\s*(abstract\s+contract|contract|library|interface|function|modifier|constructor|fallback|receive)\b"
+)
+RUST_DECL_RE = re.compile(
+    r"^\s*(pub(\s*\([^)]*\))?\s+)?((async|unsafe|const|extern(\s+\"[^\"]*\")?)\s+)*(fn|impl|mod|trait|struct|enum)\b"
+)
+# 声明前紧邻的注释 / 属性行归属于该声明
+LEADING_TRIVIA_RE = re.compile(r"^\s*(//|/\*|\*|#\[|@)")
+
+# 在这个花括号深度以内出现的声明才作为切分点 (Solidity 函数在 contract 内为 1；Rust impl 内的 fn 可能为 2)
+MAX_SPLIT_DEPTH = {"solidity": 1, "rust": 2}
+
+
+@dataclass
+class CodeChunk:
+    """源码中一个连续的行区间 (行号从 1 开始，闭区间)"""
+    start_line: int
+    end_line: int
+    code: str
+    names: List[str] = field(default_factory=list)
+
+    @property
+    def label(self) -> str:
+        return f"L{self.start_line}-{self.end_line}"
+
+    def contains(self, line: int) -> bool:
+        return self.start_line <= line <= self.end_line
+
+
+def detect_language(file_path: str, code: str) -> str:
+    if file_path.endswith(".sol"):
+        return "solidity"
+    if file_path.endswith(".rs"):
+        return "rust"
+    return "solidity" if re.search(r"\bpragma\s+solidity\b|\bcontract\s+\w+", code) else "rust"
+
+
+# Rust 中单引号还用于生命周期 ('info)，只有 Solidity 把它当作字符串定界符
+QUOTE_CHARS = {"solidity": "\"'", "rust": "\""}
+
+
+def _line_depths(lines: Sequence[str], quote_chars: str = "\"") -> List[int]:
+    """计算每一行行首的花括号深度，忽略字符串与注释中的括号"""
+    depths = []
+    depth = 0
+    in_block_comment = False
+    for line in lines:
+        depths.append(depth)
+        i = 0
+        quote = None
+        while i < len(line):
+            ch = line[i]
+            nxt = line[i + 1] if i + 1 < len(line) else ""
+            if in_block_comment:
+                if ch == "*" and nxt == "/":
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if ch == "\\":
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif ch == "/" and nxt == "/":
+                break
+            elif ch == "/" and nxt == "*":
+                in_block_comment = True
+                i += 1
+            elif ch in quote_chars:
+                quote = ch
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth = max(0, depth - 1)
+            i += 1
+    return depths
+
+
+def find_split_points(code: str, language: str) -> List[Tuple[int, str]]:
+    """
+    返回可作为分块起点的 (行号, 声明名) 列表。
+    行号已向上扩展到紧邻的注释 / 属性行，使文档注释与其声明留在同一块。
+    """
+    lines = code.splitlines()
+    depths = _line_depths(lines, QUOTE_CHARS[language])
+    decl_re = SOLIDITY_DECL_RE if language == "solidity" else RUST_DECL_RE
+    max_depth = MAX_SPLIT_DEPTH[language]
+
+    points = []
+    for idx, line in enumerate(lines):
+        if depths[idx] > max_depth or not decl_re.match(line):
+            continue
+        start = idx
+        while start > 0 and LEADING_TRIVIA_RE.match(lines[start - 1]) and depths[start - 1] == depths[idx]:
+            start -= 1
+        name_match = re.search(r"\b(?:contract|library|interface|function|modifier|fn|impl|mod|trait|struct|enum)\s+(\w+)", line)
+        name = name_match.group(1) if name_match else line.strip().split("(")[0]
+        points.append((start + 1, name))
+    return points
+
+
+def split_units(code: str, language: str) -> List[CodeChunk]:
+    """
+    在声明边界把源码切成首尾相接的最小单元 (一个函数 / 一段合约头部声明)。
+    第一个单元总是从第 1 行开始，包含 pragma / import 等文件头部内容。
+    """
+    lines = code.splitlines()
+    total = len(lines)
+    if total == 0:
+        return []
+    points = find_split_points(code, language)
+    starts = sorted({1} | {line for line, _ in points})
+    names = {}
+    for line, name in points:
+        names.setdefault(line, name)
+
+    units = []
+    for i, start in enumerate(starts):
+        end = (starts[i + 1] - 1) if i + 1 < len(starts) else total
+        unit_names = [names[start]] if start in names else []
+        units.append(CodeChunk(start, end, "\n".join(lines[start - 1:end]), unit_names))
+    return units
+
+
+def pack_units(units: List[CodeChunk], max_lines: int) -> List[CodeChunk]:
+    """把连续的单元贪心打包成不超过 max_lines 行的分块 (单个超长单元例外)"""
+    chunks: List[CodeChunk] = []
+    group: List[CodeChunk] = []
+
+    def _flush():
+        if group:
+            chunks.append(CodeChunk(
+                group[0].start_line,
+                group[-1].end_line,
+                "\n".join(u.code for u in group),
+                [name for u in group for name in u.names],
+            ))
+
+    for unit in units:
+        contiguous = group and unit.start_line == group[-1].end_line + 1
+        if group and (not contiguous or unit.end_line - group[0].start_line + 1 > max_lines):
+            _flush()
+            group = []
+        group.append(unit)
+    _flush()
+    return chunks
+
+
+def split_source(code: str, language: str, max_lines: int) -> List[CodeChunk]:
+    """
+    将源码按声明边界贪心打包成不超过 max_lines 行的连续分块 (单个超长函数例外)。
+    所有分块首尾相接覆盖全文，行号可无损映射回原文件。
+    """
+    total = len(code.splitlines())
+    if total <= max_lines:
+        return [CodeChunk(1, total, code, [])]
+    return pack_units(split_units(code, language), max_lines)
+
+
+def overlaps(chunk: CodeChunk, ranges: Sequence[Tuple[int, int]], margin: int = 0) -> bool:
+    """分块是否与任一 (起始行, 结束行) 区间相交，margin 为向两侧扩展的行数"""
+    return any(start - margin <= chunk.end_line and chunk.start_line <= end + margin for start, end in ranges)
+
+
+# --- 静态分析发现的按行路由 ---
+
+def filter_static_findings(
+    static_result: StaticAnalysisResult,
+    keep: Callable[[int, int], bool],
+) -> StaticAnalysisResult:
+    """
+    按行号区间过滤静态发现：任一区间满足 keep(start, end) 的发现保留，
+    无法定位 (Global) 的发现总是保留，error / notes 原样保留。
+    """
+    return static_result.filter(lambda f: not f.lines or f.touches(keep))
+
+
+def route_static_findings(static_result: StaticAnalysisResult, chunks: List[CodeChunk]) -> List[StaticAnalysisResult]:
+    """把静态发现按行号分配给各分块 (规则见 filter_static_findings)"""
+    return [
+        filter_static_findings(
+            static_result, lambda start, end, c=chunk: start <= c.end_line and c.start_line <= end
+        )
+        for chunk in chunks
+    ]
+
+
+def relative_static_findings(static_result: StaticAnalysisResult, chunk: CodeChunk) -> StaticAnalysisResult:
+    """
+    把已路由到分块的静态发现改写为块内相对行号 (与 CHUNK_CONTEXT_TEMPLATE 要求模型使用的行号一致)，
+    否则模型照抄的绝对行号会在 remap_vulnerability 中被再平移一次。
+    落在分块外的区间丢弃、跨越边界的区间裁剪到分块内；无法定位 (Global) 的发现不变。
+    """
+    offset = chunk.start_line - 1
+    return static_result.model_copy(update={"findings": [
+        finding.model_copy(update={"lines": [
+            (max(start, chunk.start_line) - offset, min(end, chunk.end_line) - offset)
+            for start, end in finding.lines
+            if start <= chunk.end_line and chunk.start_line <= end
+        ]}) if finding.lines else finding
+        for finding in static_result.findings
+    ]})
+
+
+# --- 分块结果合并 ---
+
+def remap_vulnerability(vul: Vulnerability, chunk: CodeChunk) -> Vulnerability:
+    """把分块内的相对行号映射回原文件行号 (越界时钳制到分块范围内)"""
+    line = chunk.start_line + max(vul.line, 1) - 1
+    line = min(max(line, chunk.start_line), chunk.end_line)
+    return vul.model_copy(update={"line": line})
+
+
+def remap_report(report: AuditReport, chunk: CodeChunk) -> AuditReport:
+    return report.model_copy(update={
+        "vulnerabilities": [remap_vulnerability(vul, chunk) for vul in report.vulnerabilities]
+    })
+
+
+def merge_reports(chunk_reports: List[Tuple[CodeChunk, AuditReport]]) -> AuditReport:
+    """合并各分块报告：摘要按块拼接，漏洞按行号排序并按 (名称, 行号) 去重，置信度取各块最低值"""
+    summaries = []
+    vulnerabilities: List[Vulnerability] = []
+    seen = set()
+    for chunk, report in chunk_reports:
+        summaries.append(f"[{chunk.label}] {report.analysis_summary}")
+        for vul in report.vulnerabilities:
+            key = (vul.name.strip().lower(), vul.line)
+            if key not in seen:
+                seen.add(key)
+                vulnerabilities.append(vul)
+    vulnerabilities.sort(key=lambda v: v.line)
+    confidences = [report.confidence for _, report in chunk_reports if report.confidence]
+    return AuditReport(
+        analysis_summary="\n".join(summaries),
+        vulnerabilities=vulnerabilities,
+        confidence=min(confidences, key=CONFIDENCE_ORDER.index) if confidences else None,
+    )
@@ -0,0 +1,201 @@
+# core/dedup.py
+"""
+批量审计的跨文件去重：同一批次中，OpenZeppelin 副本、vendored 库、扁平化合约里的继承代码
+会在大量文件中逐字 (或只差注释 / 空白) 重复，静态分析在每个副本上报同样的问题，LLM 也会反复解释。
+
+- 每个函数级区域 (core.chunker.split_units) 的指纹 = 去掉注释、折叠空白后的代码 + 落在该区域内的静态检测器 ID；
+- 批次内第一个出现的区域 (owner) 照常送审，之后相同指纹的区域不再发送给 LLM，
+  等 owner 的结论发布后按有效代码行的序号映射到本区域复用 (两份副本的注释 / 空行位置可以不同)；
+- 批次结束时按指纹分组列出重复区域及其结论。
+"""
+import asyncio
+import bisect
+import hashlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from core.chunker import QUOTE_CHARS, CodeChunk
+from core.pydantic_schema import Vulnerability
+from static_analyzers.findings import StaticAnalysisResult
+
+# 汇总表中每组最多列出的位置数
+MAX_LISTED_OCCURRENCES = 5
+
+
+def strip_comments(code: str, quote_chars: str = "\"") -> str:
+    """去掉 // 与 /* */ 注释 (字符串中的内容保持不变)，保留换行"""
+    out = []
+    i = 0
+    quote = None
+    while i < len(code):
+        ch = code[i]
+        nxt = code[i + 1] if i + 1 < len(code) else ""
+        if quote:
+            out.append(ch)
+            if ch == "\\" and nxt:
+                out.append(nxt)
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch == "/" and nxt == "/":
+            while i < len(code) and code[i] != "\n":
+                i += 1
+            continue
+        elif ch == "/" and nxt == "*":
+            end = code.find("*/", i + 2)
+            end = len(code) if end == -1 else end + 2
+            out.append("\n" * code.count("\n", i, end))
+            i = end
+            continue
+        else:
+            if ch in quote_chars:
+                quote = ch
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def normalize_code(code: str, language: str) -> Tuple[str, int]:
+    """返回 (规范化文本, 有效代码行数)：去注释、折叠空白，只差格式与注释的副本得到相同文本"""
+    stripped = strip_comments(code, QUOTE_CHARS.get(language, "\""))
+    lines = [line for line in stripped.splitlines() if line.strip()]
+    return re.sub(r"\s+", " ", " ".join(lines)).strip(), len(lines)
+
+
+def code_line_numbers(code: str, language: str) -> List[int]:
+    """区域内有效代码行 (去注释后非空) 的相对行号，从 1 开始"""
+    stripped = strip_comments(code, QUOTE_CHARS.get(language, "\""))
+    return [number for number, line in enumerate(stripped.splitlines(), 1) if line.strip()]
+
+
+def to_code_ordinal(code_lines: List[int], line: int) -> int:
+    """区域内相对行号 -> 第几行有效代码 (落在注释 / 空行上时取其后的第一行代码)"""
+    if not code_lines:
+        return 1
+    return min(bisect.bisect_left(code_lines, line), len(code_lines) - 1) + 1
+
+
+def from_code_ordinal(code_lines: List[int], ordinal: int) -> int:
+    """第几行有效代码 -> 区域内相对行号 (超出时取最后一行代码)"""
+    if not code_lines:
+        return 1
+    return code_lines[min(max(ordinal, 1), len(code_lines)) - 1]
+
+
+def region_fingerprint(normalized: str, checks: Sequence[str]) -> str:
+    payload = normalized + "\x00" + ",".join(sorted(set(checks)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Occurrence:
+    """区域在某个文件中的位置"""
+    file_path: str
+    start_line: int
+    end_line: int
+
+    @property
+    def label(self) -> str:
+        return f"{self.file_path}:L{self.start_line}-{self.end_line}"
+
+
+@dataclass
+class RegionGroup:
+    """同一指纹的全部区域：owner 送审，其余复用 owner 的结论"""
+    fingerprint: str
+    names: List[str]
+    checks: List[str]
+    owner: Occurrence
+    future: asyncio.Future
+    occurrences: List[Occurrence] = field(default_factory=list)
+
+    def resolve(self, vulnerabilities: Optional[List[Vulnerability]]) -> None:
+        """
+        发布 owner 的结论 (行号为区域内有效代码行的序号，见 to_code_ordinal)；owner 审计失败时传 None。
+        可以在任意线程调用：结果总是在事件循环线程中写入 future。
+        """
+        def _set():
+            if not self.future.done():
+                self.future.set_result(vulnerabilities)
+
+        self.future.get_loop().call_soon_threadsafe(_set)
+
+    @property
+    def conclusions(self) -> Optional[List[Vulnerability]]:
+        return self.future.result() if self.future.done() else None
+
+
+class RegionDeduplicator:
+    """
+    一个批次内的区域指纹表。claim() 在构建 Prompt 的线程中调用，内部加锁。
+    min_lines: 有效代码行数少于该值的区域不参与去重 (调大后 getter 等小函数总在本文件内送审，
+    夹在重复区域之间时可能使整个文件退回常规审计)。
+    """
+
+    def __init__(self, min_lines: int = 1):
+        self.min_lines = min_lines
+        self.groups: Dict[str, RegionGroup] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """绑定流水线所在的事件循环 (owner 结论的 future 属于该循环)"""
+        self._loop = loop
+
+    def claim(
+        self, file_path: str, unit: CodeChunk, language: str, unit_static: StaticAnalysisResult
+    ) -> Optional[Tuple[RegionGroup, bool]]:
+        """登记一个区域，返回 (所属分组, 是否为 owner)；区域过小时返回 None"""
+        normalized, code_lines = normalize_code(unit.code, language)
+        if code_lines < self.min_lines:
+            return None
+        # 无法定位行号的全局发现会被路由到每个区域，不计入指纹
+        checks = [finding.check for finding in unit_static.findings if finding.lines]
+        fingerprint = region_fingerprint(normalized, checks)
+        occurrence = Occurrence(file_path, unit.start_line, unit.end_line)
+        with self._lock:
+            group = self.groups.get(fingerprint)
+            if group is None:
+                group = RegionGroup(
+                    fingerprint, list(unit.names), sorted(set(checks)), occurrence,
+                    self._loop.create_future(), [occurrence],
+                )
+                self.groups[fingerprint] = group
+                return group, True
+            group.occurrences.append(occurrence)
+            return group, False
+
+    def release(self, group: RegionGroup, file_path: str, unit: CodeChunk) -> None:
+        """非 owner 的区域最终仍在本文件内送审时，撤销其复用登记"""
+        with self._lock:
+            group.occurrences = [
+                o for o in group.occurrences
+                if (o.file_path, o.start_line, o.end_line) != (file_path, unit.start_line, unit.end_line)
+            ]
+
+    def duplicate_groups(self) -> List[RegionGroup]:
+        return [group for group in self.groups.values() if len(group.occurrences) > 1]
+
+    def summary_lines(self) -> List[str]:
+        """按指纹分组列出重复区域与其 (共享的) 审计结论"""
+        groups = sorted(self.duplicate_groups(), key=lambda g: len(g.occurrences), reverse=True)
+        if not groups:
+            return []
+        reused = sum(len(group.occurrences) - 1 for group in groups)
+        files = len({o.file_path for group in groups for o in group.occurrences})
+        lines = [f"🔁 [Dedup] {len(groups)} 个函数区域在 {files} 个文件中重复出现，{reused} 处复用首次审计的结论："]
+        for group in groups:
+            conclusions = group.conclusions
+            if conclusions is None:
+                findings = "原审计失败"
+            else:
+                findings = "、".join(f"{v.name} ({v.severity})" for v in conclusions) or "未发现问题"
+            checks = f" [静态: {', '.join(group.checks)}]" if group.checks else ""
+            lines.append(f"   • {', '.join(group.names) or '(声明区域)'} ×{len(group.occurrences)}{checks}: {findings}")
+            for occurrence in group.occurrences[:MAX_LISTED_OCCURRENCES]:
+                lines.append(f"       - {occurrence.label}" + (" (已审计)" if occurrence is group.owner else ""))
+            if len(group.occurrences) > MAX_LISTED_OCCURRENCES:
+                lines.append(f"       - ... 另有 {len(group.occurrences) - MAX_LISTED_OCCURRENCES} 处")
+        return lines
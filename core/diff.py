@@ -0,0 +1,71 @@
+# core/diff.py
+"""
+基于 git 的增量 (PR) 审计辅助：计算相对 base ref 的变更文件与变更行区间。
+"""
+import os
+import re
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+LineRange = Tuple[int, int]
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def _git(args: List[str], cwd: str) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise ValueError(f"git {' '.join(args)} 执行失败: {result.stderr.strip()}")
+    return result.stdout
+
+
+def git_toplevel(path: str) -> str:
+    directory = path if os.path.isdir(path) else (os.path.dirname(os.path.abspath(path)) or ".")
+    return _git(["rev-parse", "--show-toplevel"], cwd=directory).strip()
+
+
+def parse_unified_diff(diff_text: str) -> List[LineRange]:
+    """
+    解析 `git diff -U0` 输出中的 hunk 头，返回新文件中的变更行区间 (闭区间，行号从 1 开始)。
+    纯删除的 hunk 记为删除位置所在的那一行，确保其所在函数仍会被重新审计。
+    """
+    ranges: List[LineRange] = []
+    for line in diff_text.splitlines():
+        match = _HUNK_RE.match(line)
+        if not match:
+            continue
+        start = int(match.group(1))
+        count = int(match.group(2)) if match.group(2) is not None else 1
+        if count == 0:
+            ranges.append((max(start, 1), max(start, 1)))
+        else:
+            ranges.append((start, start + count - 1))
+    return ranges
+
+
+def changed_line_ranges(base_ref: str, file_path: str) -> Optional[List[LineRange]]:
+    """
+    返回 file_path 相对 base_ref 的变更行区间 (包含工作区未提交的修改)。
+    - 文件未被 git 跟踪或在 base_ref 中不存在：返回 None，表示整个文件都是新的；
+    - 文件无变化：返回空列表。
+    """
+    top = git_toplevel(file_path)
+    rel_path = os.path.relpath(os.path.abspath(file_path), top)
+    exists_in_base = subprocess.run(
+        ["git", "cat-file", "-e", f"{base_ref}:{rel_path}"],
+        cwd=top, capture_output=True, check=False,
+    ).returncode == 0
+    if not exists_in_base:
+        return None
+    diff_text = _git(["diff", "-U0", "--no-color", base_ref, "--", rel_path], cwd=top)
+    return parse_unified_diff(diff_text)
+
+
+def collect_changed_ranges(base_ref: str, file_paths: List[str]) -> Dict[str, Optional[List[LineRange]]]:
+    """批量计算变更区间，只返回有变化 (或整个文件是新增) 的文件"""
+    changed: Dict[str, Optional[List[LineRange]]] = {}
+    for path in file_paths:
+        ranges = changed_line_ranges(base_ref, path)
+        if ranges is None or ranges:
+            changed[path] = ranges
+    return changed
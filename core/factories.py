@@ -1,17 +1,26 @@
 # core/factories.py
-from typing import Callable, Dict, Type
+import importlib
+from typing import Any, Callable, Dict, Optional, Type
 
-# 引入服务组件
+from core.cache import CachedLLMService, CachedStaticAnalyzer, RegionResultCache, ResultCache
+
+# 引入服务组件 (具体实现按 "模块:类名" 注册，首次使用时才导入：
+# 一次运行只用到一家模型厂商与一种分析器，不必为 openai / google-genai 两个 SDK 都付出导入开销)
 from llm_services.abstract_service import AbstractLLMService
-from llm_services.openai_service import OpenAIService
-from llm_services.gemini_service import GeminiService
+from llm_services.routing import CascadeLLMService, EnsembleLLMService
 
 from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
-from static_analyzers.slither_analyzer import SlitherAnalyzer
-from static_analyzers.soteria_analyzer import SoteriaAnalyzer
+from static_analyzers.tool_runner import ToolLimits
 
 from config.settings import llm_settings, project_settings
 
+
+def import_object(path: str) -> Any:
+    """按 "包.模块:属性" 导入对象；模块只在第一次调用时加载"""
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
 class ServiceFactory:
     """
     负责实例化 LLM 服务和静态分析器的工厂类。
@@ -20,54 +29,129 @@ class ServiceFactory:
 
     # --- LLM 生产线 ---
     @staticmethod
-    def create_openai_service() -> AbstractLLMService:
+    def create_openai_service(model_name: Optional[str] = None) -> AbstractLLMService:
         if not project_settings.OPENAI_API_KEY:
             raise ValueError("配置错误: 使用 OpenAI 服务需要设置 OPENAI_API_KEY")
-        return OpenAIService()
+        return import_object("llm_services.openai_service:OpenAIService")(model_name)
 
     @staticmethod
-    def create_gemini_service() -> AbstractLLMService:
+    def create_gemini_service(model_name: Optional[str] = None) -> AbstractLLMService:
         if not project_settings.GEMINI_API_KEY:
             raise ValueError("配置错误: 使用 Gemini 服务需要设置 GEMINI_API_KEY")
-        return GeminiService()
+        return import_object("llm_services.gemini_service:GeminiService")(model_name)
 
     # LLM 注册表：将模型关键字映射到创建函数
     # 只要模型名称包含 key (如 "gpt-4o" 包含 "gpt")，就使用对应的工厂
-    _LLM_REGISTRY: Dict[str, Callable[[], AbstractLLMService]] = {
+    _LLM_REGISTRY: Dict[str, Callable[[Optional[str]], AbstractLLMService]] = {
         "gpt": create_openai_service,
         "openai": create_openai_service,
         "gemini": create_gemini_service,
     }
 
     @classmethod
-    def get_llm_service(cls) -> AbstractLLMService:
-        """根据配置的模型名称，自动分发对应的服务实例"""
-        model_name = llm_settings.MODEL_NAME.lower()
-        
+    def create_llm_service(cls, model_name: str) -> AbstractLLMService:
+        """按模型名称创建单个模型的服务实例 (启用缓存时包上结果缓存)"""
         for keyword, creator_func in cls._LLM_REGISTRY.items():
-            if keyword in model_name:
+            if keyword in model_name.lower():
                 print(f"🏭 Factory: 根据模型名 '{model_name}' 加载 -> {creator_func.__name__}")
-                return creator_func()
-        
+                service = creator_func(model_name)
+                if project_settings.CACHE_ENABLED:
+                    service = CachedLLMService(service, cls.get_result_cache(cls.LLM_CACHE_NAMESPACE))
+                return service
+
         raise ValueError(f"🏭 Factory: 未知的模型配置 '{model_name}'。支持: {list(cls._LLM_REGISTRY.keys())}")
 
+    @classmethod
+    def get_llm_service(cls) -> AbstractLLMService:
+        """
+        根据配置组装 LLM 服务：
+        - 默认按 MODEL_NAME 分发到单个模型；
+        - 设置 ENSEMBLE_MODELS 时，强模型一级换成多个模型的集成；
+        - 设置 CASCADE_FAST_MODEL 时，在强模型之前加一级廉价模型，按需升级。
+        """
+        ensemble_models = [name.strip() for name in llm_settings.ENSEMBLE_MODELS.split(",") if name.strip()]
+        if ensemble_models:
+            print(f"🏭 Factory: 集成模型 {ensemble_models}")
+            service = EnsembleLLMService(
+                [cls.create_llm_service(name) for name in ensemble_models],
+                line_tolerance=llm_settings.ENSEMBLE_LINE_TOLERANCE,
+            )
+        else:
+            service = cls.create_llm_service(llm_settings.MODEL_NAME)
+
+        if llm_settings.CASCADE_FAST_MODEL:
+            print(f"🏭 Factory: 级联路由 {llm_settings.CASCADE_FAST_MODEL} -> {service.model_name}")
+            service = CascadeLLMService(
+                cls.create_llm_service(llm_settings.CASCADE_FAST_MODEL),
+                service,
+                min_confidence=llm_settings.CASCADE_MIN_CONFIDENCE,
+            )
+        return service
+
     # --- 静态分析器生产线 ---
     
-    # 静态分析器注册表：将 ProjectType 映射到类
-    _ANALYZER_REGISTRY: Dict[str, Type[AbstractStaticAnalyzer]] = {
-        "EVM": SlitherAnalyzer,
-        "SOLANA": SoteriaAnalyzer,
+    # 静态分析器注册表：将 ProjectType 映射到 "模块:类名"
+    _ANALYZER_REGISTRY: Dict[str, str] = {
+        "EVM": "static_analyzers.slither_analyzer:SlitherAnalyzer",
+        "SOLANA": "static_analyzers.soteria_analyzer:SoteriaAnalyzer",
     }
 
     @classmethod
-    def get_static_analyzer(cls) -> AbstractStaticAnalyzer:
-        """根据项目类型配置，自动分发对应的分析器实例"""
-        project_type = project_settings.PROJECT_TYPE
+    def get_static_analyzer(cls, project_type: Optional[str] = None) -> AbstractStaticAnalyzer:
+        """根据项目类型配置，自动分发对应的分析器实例 (批量模式可显式传入 project_type)"""
+        project_type = project_type or project_settings.PROJECT_TYPE
         
-        analyzer_class = cls._ANALYZER_REGISTRY.get(project_type)
+        analyzer_path = cls._ANALYZER_REGISTRY.get(project_type)
         
-        if not analyzer_class:
+        if not analyzer_path:
             raise NotImplementedError(f"🏭 Factory: 项目类型 '{project_type}' 的分析器尚未实现或注册。")
             
+        analyzer_class: Type[AbstractStaticAnalyzer] = import_object(analyzer_path)
         print(f"🏭 Factory: 根据项目类型 '{project_type}' 加载 -> {analyzer_class.__name__}")
-        return analyzer_class()
\ No newline at end of file
+        analyzer = analyzer_class(cls.get_tool_limits(analyzer_class))
+        if project_settings.CACHE_ENABLED:
+            analyzer = CachedStaticAnalyzer(analyzer, cls.get_result_cache(cls.STATIC_CACHE_NAMESPACE))
+        return analyzer
+
+    @staticmethod
+    def get_tool_limits(analyzer_class: Type[AbstractStaticAnalyzer]) -> ToolLimits:
+        """按工具读取超时配置 (<TOOL_NAME>_TIMEOUT)，内存 / CPU 限制所有工具共用"""
+        tool_name = getattr(analyzer_class, "TOOL_NAME", analyzer_class.__name__)
+        return ToolLimits(
+            timeout=getattr(project_settings, f"{tool_name.upper()}_TIMEOUT", 0),
+            memory_mb=project_settings.STATIC_MEMORY_LIMIT_MB,
+            cpu_seconds=project_settings.STATIC_CPU_LIMIT_SECONDS,
+        )
+
+    # --- 结果缓存 ---
+
+    STATIC_CACHE_NAMESPACE = "static"
+    LLM_CACHE_NAMESPACE = "llm"
+    REGION_CACHE_NAMESPACE = "regions"
+
+    @staticmethod
+    def get_result_cache(namespace: str) -> ResultCache:
+        """创建指定命名空间的磁盘缓存，并顺带执行一次淘汰"""
+        cache = ResultCache(
+            cache_dir=project_settings.CACHE_DIR,
+            namespace=namespace,
+            max_bytes=project_settings.CACHE_MAX_MB * 1024 * 1024,
+            max_age_seconds=project_settings.CACHE_MAX_AGE_DAYS * 86400,
+        )
+        cache.evict()
+        return cache
+
+    @classmethod
+    def get_region_cache(cls) -> Optional[RegionResultCache]:
+        """函数区域级审计结论缓存 (增量审计使用)，未启用缓存时返回 None"""
+        if not project_settings.CACHE_ENABLED:
+            return None
+        return RegionResultCache(cls.get_result_cache(cls.REGION_CACHE_NAMESPACE))
+
+    @classmethod
+    def purge_caches(cls) -> int:
+        """清空全部结果缓存，返回删除的条目数"""
+        return sum(
+            cls.get_result_cache(namespace).purge()
+            for namespace in (cls.STATIC_CACHE_NAMESPACE, cls.LLM_CACHE_NAMESPACE, cls.REGION_CACHE_NAMESPACE)
+        )
\ No newline at end of file
@@ -0,0 +1,189 @@
+# core/journal.py
+"""
+批量审计的结果日志 (append-only JSON Lines)：每完成一步就追加一行并立即落盘，
+进程崩溃、被 CI 抢占或中途 Ctrl-C 后，用 --resume 从上次中断的位置继续。
+
+    {"type": "run",    "run_id": ..., "started_at": ..., "resumed": false, "config": {...}}
+    {"type": "static", "file": ..., "sha": ..., "result": StaticAnalysisResult}
+    {"type": "chunk",  "file": ..., "key": Prompt 哈希, "report": AuditReport}
+    {"type": "done",   "file": ..., "sha": ..., "project_type": ..., "report": AuditReport, "metrics": {...}}
+    {"type": "failed", "file": ..., "sha": ..., "error": ...}
+
+- 文件按绝对路径 + 内容哈希识别：上次之后被修改过的文件重新审计；
+- 续跑时已完成 (done) 的文件直接复用报告；失败或缺失的文件重新审计，其中已记录的静态分析结果
+  与已返回的分块报告照样复用，只补做缺失的部分；
+- run 记录保存影响结论的配置 (模型、增量 base 等)，续跑时配置不同则只复用静态分析结果；
+- 不带 --resume 的运行会清空旧日志重新开始；旧日志中还有失败或未完成的文件时拒绝清空
+  (JournalInUseError)，需要 --resume 续跑或 --fresh 确认丢弃。最后一行写到一半 (进程被杀) 时读取时跳过。
+"""
+import datetime
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from core.cache import sha256_text
+from core.pydantic_schema import AuditReport
+from static_analyzers.findings import StaticAnalysisResult
+
+
+class JournalInUseError(ValueError):
+    """旧日志中还有失败或未完成的文件，不带 --resume 的运行需要确认后才能清空"""
+
+
+def _read_records(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # 进程被杀时最后一行可能只写了一半
+                continue
+
+
+def journal_backlog(path: str) -> Tuple[int, int]:
+    """
+    已有日志中 (失败, 未完成) 的文件数，以每个文件最后一条记录为准：
+    failed 为失败；只有 static / chunk 记录、没有 done 的为未完成 (运行被中断)。日志不存在时返回 (0, 0)。
+    """
+    if not os.path.exists(path):
+        return 0, 0
+    states: Dict[str, str] = {}
+    for record in _read_records(path):
+        kind = record.get("type")
+        if kind in ("static", "chunk"):
+            states[record.get("file")] = "unfinished"
+        elif kind in ("done", "failed"):
+            states[record.get("file")] = kind
+    values = list(states.values())
+    return values.count("failed"), values.count("unfinished")
+
+
+def job_key(system_prompt: str, user_prompt: str) -> str:
+    """分块请求的标识：Prompt 内容哈希 (包含代码，文件改动后自然失效)"""
+    return sha256_text(system_prompt + "\x00" + user_prompt)[:32]
+
+
+class AuditJournal:
+    """
+    path: 日志文件路径；config: 影响审计结论的配置 (续跑时与日志中的 run 记录比较)
+    resume: True 时读取已有日志并在其后追加；False 时清空旧日志
+    overwrite: 旧日志中还有失败或未完成的文件时是否仍然清空 (False 时抛出 JournalInUseError)
+    """
+
+    def __init__(self, path: str, config: Dict[str, Any], resume: bool = False, overwrite: bool = False):
+        self.path = path
+        self.config = config
+        self.static: Dict[tuple, StaticAnalysisResult] = {}
+        self.chunks: Dict[tuple, AuditReport] = {}
+        self.done: Dict[str, Dict[str, Any]] = {}
+        self.failed: Dict[str, str] = {}
+        self._hashes: Dict[str, str] = {}
+
+        if not resume and not overwrite:
+            failed, unfinished = journal_backlog(path)
+            if failed or unfinished:
+                raise JournalInUseError(
+                    f"结果日志 {path} 中还有 {failed} 个失败、{unfinished} 个未完成的文件："
+                    f"使用 --resume 继续，或加 --fresh 丢弃旧日志重新开始"
+                )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+        elif resume:
+            print(f"📒 [Journal] 没有找到 {path}，从头开始")
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        self._append({
+            "type": "run",
+            "run_id": uuid.uuid4().hex[:12],
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "resumed": resume,
+            "config": config,
+        })
+
+    def _load(self) -> None:
+        # 每条 run 记录之后的 LLM 结论只在该次运行的配置与本次一致时复用
+        compatible, skipped_runs = True, 0
+        for record in _read_records(self.path):
+            kind, file_path = record.get("type"), record.get("file")
+            if kind == "run":
+                compatible = record.get("config") == self.config
+                skipped_runs += 0 if compatible else 1
+            elif kind == "static":
+                self.static[(file_path, record["sha"])] = StaticAnalysisResult.model_validate(record["result"])
+            elif kind == "failed":
+                self.failed[file_path] = record["error"]
+                self.done.pop(file_path, None)
+            elif not compatible:
+                continue
+            elif kind == "chunk":
+                self.chunks[(file_path, record["key"])] = AuditReport.model_validate(record["report"])
+            elif kind == "done":
+                self.done[file_path] = record
+                self.failed.pop(file_path, None)
+        if skipped_runs:
+            print(f"📒 [Journal] {skipped_runs} 次运行的模型 / 模式与本次不同，只复用其静态分析结果")
+        print(
+            f"📒 [Journal] 读取 {self.path}: 已完成 {len(self.done)} 个文件，失败 {len(self.failed)} 个，"
+            f"已记录静态结果 {len(self.static)} 份 / 分块报告 {len(self.chunks)} 份"
+        )
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    # --- 文件标识 ---
+
+    def file_sha(self, file_path: str) -> str:
+        key = os.path.abspath(file_path)
+        if key not in self._hashes:
+            with open(file_path, "rb") as f:
+                self._hashes[key] = hashlib.sha256(f.read()).hexdigest()
+        return self._hashes[key]
+
+    # --- 查询 (续跑) ---
+
+    def completed(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """上次已审计完成且内容未变的文件，返回其 done 记录"""
+        record = self.done.get(os.path.abspath(file_path))
+        if record is None or record["sha"] != self.file_sha(file_path):
+            return None
+        return record
+
+    def static_result(self, file_path: str) -> Optional[StaticAnalysisResult]:
+        return self.static.get((os.path.abspath(file_path), self.file_sha(file_path)))
+
+    def chunk_report(self, file_path: str, key: str) -> Optional[AuditReport]:
+        return self.chunks.get((os.path.abspath(file_path), key))
+
+    # --- 记录 ---
+
+    def record_static(self, file_path: str, result: StaticAnalysisResult) -> None:
+        if result.failed:
+            return
+        self._append({
+            "type": "static", "file": os.path.abspath(file_path), "sha": self.file_sha(file_path),
+            "result": result.model_dump(),
+        })
+
+    def record_chunk(self, file_path: str, key: str, report: AuditReport) -> None:
+        self._append({"type": "chunk", "file": os.path.abspath(file_path), "key": key, "report": report.model_dump()})
+
+    def record_done(
+        self, file_path: str, project_type: str, report: AuditReport, metrics: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self._append({
+            "type": "done", "file": os.path.abspath(file_path), "sha": self.file_sha(file_path),
+            "project_type": project_type, "report": report.model_dump(), "metrics": metrics or {},
+        })
+
+    def record_failure(self, file_path: str, error: str) -> None:
+        try:
+            sha = self.file_sha(file_path)
+        except OSError:
+            sha = ""
+        self._append({"type": "failed", "file": os.path.abspath(file_path), "sha": sha, "error": error})
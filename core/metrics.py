@@ -0,0 +1,236 @@
+# core/metrics.py
+"""
+审计过程的指标采集与导出。
+
+- 每个文件一条 FileMetrics：各阶段耗时 (静态分析 / 构建 Prompt / LLM 调用 / 校验)、
+  Token 用量与费用、重试次数、静态分析与 LLM 响应的缓存命中；
+- file_scope() 把 FileMetrics 挂到当前上下文，AuditAnalyzer 中的 timed() 与各服务的用量记录
+  自动计入该文件 (asyncio 任务与 to_thread 会继承上下文)；
+- MetricsCollector 汇总整次运行 (计数累计、明细可限定为最近的窗口)，导出 JSON Lines 或 Prometheus 文本格式，并打印汇总表。
+"""
+import contextlib
+import json
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional
+
+from llm_services.usage import TokenUsage, usage_scope, usage_tracker
+
+STAGES = ("static", "prompt", "llm", "validate")
+
+METRICS_FORMATS = ("jsonl", "prometheus")
+
+
+@dataclass
+class FileMetrics:
+    """单个文件的审计指标；阶段耗时为累计秒数 (分块并发调用时是各请求耗时之和)"""
+    file_path: str
+    project_type: str = ""
+    stages: Dict[str, float] = field(default_factory=lambda: {stage: 0.0 for stage in STAGES})
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    static_cache_hits: int = 0
+    # 发送前的预估 (见 core.budget)：全部请求的输入 Token 与费用 (美元，未收录的模型为 0)
+    estimated_prompt_tokens: int = 0
+    estimated_cost_usd: float = 0.0
+    # 从进入流水线到产出结果的墙钟时间
+    wall_seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["stages"] = {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        data["wall_seconds"] = round(self.wall_seconds, 4)
+        data["usage"]["cost_usd"] = round(self.usage.cost_usd, 6)
+        data["estimated_cost_usd"] = round(self.estimated_cost_usd, 6)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FileMetrics":
+        """to_dict() 的逆操作 (汇总其他进程写出的指标)"""
+        return cls(**{**data, "usage": TokenUsage(**data.get("usage", {}))})
+
+
+# 当前上下文正在审计的文件
+_current: ContextVar[Optional[FileMetrics]] = ContextVar("file_metrics", default=None)
+
+
+@contextlib.contextmanager
+def file_scope(metrics: Optional[FileMetrics]) -> Iterator[Optional[FileMetrics]]:
+    """with 块内的阶段耗时、Token 用量与缓存命中计入 metrics (None 时不做任何记录)"""
+    if metrics is None:
+        yield None
+        return
+    token = _current.set(metrics)
+    try:
+        with usage_scope(metrics.usage):
+            yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """把 with 块的耗时累加到当前文件的 stage 阶段 (不在 file_scope 内时只计时不记录)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.stages[stage] = metrics.stages.get(stage, 0.0) + time.perf_counter() - start
+
+
+def record_static_cache_hit() -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.static_cache_hits += 1
+
+
+def record_estimate(prompt_tokens: int, cost: Optional[float]) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.estimated_prompt_tokens += prompt_tokens
+        metrics.estimated_cost_usd += cost or 0.0
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位数 (q 取 0~1)；空列表返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class MetricsCollector:
+    """
+    收集整次运行的 FileMetrics，负责导出与汇总。
+    window: 只保留最近 window 个文件的明细 (用于分位数与 JSON Lines 导出)，None 表示全部保留；
+    计数类指标 (文件数、阶段累计耗时、Token、费用、缓存命中) 始终按运行累计，常驻服务内存与抓取耗时不随历史增长。
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.files: Deque[FileMetrics] = deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.ok_files = 0
+        self.error_files = 0
+        self.stage_seconds: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.estimated_cost_usd = 0.0
+        self.static_cache_hits = 0
+        self._usage = TokenUsage()
+        # 常驻服务中 add() 在事件循环线程调用，导出在 HTTP 线程调用
+        self._lock = threading.Lock()
+
+    def add(self, metrics: Optional[FileMetrics]) -> None:
+        if metrics is None:
+            return
+        with self._lock:
+            self.files.append(metrics)
+            if metrics.ok:
+                self.ok_files += 1
+            else:
+                self.error_files += 1
+            for stage, seconds in metrics.stages.items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            self.estimated_cost_usd += metrics.estimated_cost_usd
+            self.static_cache_hits += metrics.static_cache_hits
+            self._usage.add(metrics.usage)
+
+    def totals(self) -> TokenUsage:
+        total = TokenUsage()
+        with self._lock:
+            total.add(self._usage)
+        return total
+
+    def recent(self) -> List[FileMetrics]:
+        """窗口内的文件明细 (快照)"""
+        with self._lock:
+            return list(self.files)
+
+    # --- 导出 ---
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(m.to_dict(), ensure_ascii=False) + "\n" for m in self.recent())
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式 (可交给 node_exporter textfile collector 或 Pushgateway)"""
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP certi_audit_{name} {help_text}")
+            lines.append(f"# TYPE certi_audit_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"certi_audit_{name}{{{label_text}}} {value}" if label_text else f"certi_audit_{name} {value}")
+
+        recent = self.recent()
+        metric("files_total", "counter", "Audited files by status.",
+               [({"status": "ok"}, self.ok_files), ({"status": "error"}, self.error_files)])
+        metric("stage_seconds_total", "counter", "Cumulative seconds spent per pipeline stage.",
+               [({"stage": stage}, round(self.stage_seconds.get(stage, 0.0), 4)) for stage in STAGES])
+        quantiles = []
+        for stage in STAGES:
+            values = [m.stages.get(stage, 0.0) for m in recent]
+            quantiles += [({"stage": stage, "quantile": str(q)}, round(percentile(values, q), 4)) for q in (0.5, 0.95)]
+        metric("file_stage_seconds", "summary", "Per-file stage duration quantiles (most recent files).", quantiles)
+        metric("wall_seconds", "gauge", "Wall-clock seconds of the whole run.",
+               [({}, round(time.perf_counter() - self.started, 4))])
+
+        models = usage_tracker.snapshot()
+        tokens = []
+        for model, usage in models.items():
+            tokens += [
+                ({"model": model, "kind": "prompt"}, usage.prompt_tokens),
+                ({"model": model, "kind": "cached"}, usage.cached_tokens),
+                ({"model": model, "kind": "completion"}, usage.completion_tokens),
+            ]
+        metric("llm_tokens_total", "counter", "LLM tokens by model and kind.", tokens)
+        metric("llm_requests_total", "counter", "LLM API requests by model.",
+               [({"model": model}, usage.requests) for model, usage in models.items()])
+        metric("llm_cost_usd_total", "counter", "Estimated LLM cost in USD by model.",
+               [({"model": model}, round(usage.cost_usd, 6)) for model, usage in models.items()])
+        total = self.totals()
+        metric("llm_estimated_cost_usd_total", "counter", "Pre-send LLM cost estimate in USD.",
+               [({}, round(self.estimated_cost_usd, 6))])
+        metric("llm_retries_total", "counter", "LLM call retries after 429/5xx/network errors.", [({}, total.retries)])
+        metric("cache_hits_total", "counter", "Result cache hits by cache.",
+               [({"cache": "llm"}, total.cache_hits),
+                ({"cache": "static"}, self.static_cache_hits)])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "jsonl") -> None:
+        if fmt not in METRICS_FORMATS:
+            raise ValueError(f"不支持的指标格式: {fmt} (可选: {', '.join(METRICS_FORMATS)})")
+        content = self.to_jsonl() if fmt == "jsonl" else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    # --- 汇总表 ---
+
+    def summary_table(self) -> str:
+        """按阶段列出 总耗时 / p50 / p95，以及 Token、费用、重试与缓存命中"""
+        recent = self.recent()
+        rows = [f"{'阶段':<10}{'累计(s)':>10}{'p50(s)':>10}{'p95(s)':>10}"]
+        for stage in STAGES:
+            values = [m.stages.get(stage, 0.0) for m in recent]
+            rows.append(
+                f"{stage:<10}{self.stage_seconds.get(stage, 0.0):>10.2f}"
+                f"{percentile(values, 0.5):>10.2f}{percentile(values, 0.95):>10.2f}"
+            )
+        walls = [m.wall_seconds for m in recent]
+        rows.append(f"{'file wall':<10}{'':>10}{percentile(walls, 0.5):>10.2f}{percentile(walls, 0.95):>10.2f}")
+
+        total = self.totals()
+        rows.append(
+            f"Token: 输入 {total.prompt_tokens} (服务端缓存 {total.cached_tokens}) / 输出 {total.completion_tokens}，"
+            f"LLM 请求 {total.requests} 次，重试 {total.retries} 次，约 ${total.cost_usd:.4f}"
+            f" (发送前预估 ${self.estimated_cost_usd:.4f})"
+        )
+        rows.append(f"本地缓存命中: LLM 响应 {total.cache_hits} 次 / 静态分析 {self.static_cache_hits} 次")
+        return "\n".join(rows)
@@ -0,0 +1,502 @@
+# core/pipeline.py
+"""
+批量审计的分阶段流水线：
+
+    静态分析 ──▶ [queue] ──▶ 构建 Prompt ──▶ [queue] ──▶ LLM 调用 / 校验 / 修复 ──▶ [queue] ──▶ 汇总 ──▶ [queue] ──▶ 调用方
+
+- 每个阶段由独立的 worker 组成，阶段之间用有界 asyncio.Queue 连接：
+  文件 N 在等待模型响应时，文件 N+1 的静态分析已经在运行；
+- 下游处理不过来时 put() 阻塞上游 (背压)，同一时刻驻留内存的文件数只取决于队列容量与 worker 数，
+  与批次大小无关；
+- 单个文件在任一阶段出错只影响它自己，错误结果直接送到输出队列；
+- 模型输出不合法时在 LLM 阶段内发起修复请求 (只回传错误与原输出)，不重跑整个文件；
+- 静态分析之前先做 Prompt 预算预检 (代码本身放不下的文件直接报错)；设置 max_cost 时，
+  每个文件构建好 Prompt 后按预估费用占用额度，超出上限的文件不再发送 (完成后按实际费用修正额度)；
+- 传入结果日志 (core.journal) 时，静态结果、分块报告与每个文件的最终结果 / 错误在完成时立即落盘；
+  续跑时已完成的文件直接产出日志中的报告，其余文件复用已记录的静态结果与分块报告；
+- 启用跨文件去重时，批次内重复的函数区域只送审一次 (见 core.dedup)：owner 的请求全部返回后
+  立即发布结论，等待结论的文件在独立任务中汇总，不占用汇总 worker。
+"""
+import asyncio
+import contextlib
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from core.analyzer import AuditAnalyzer, AuditPlan
+from core.budget import CostLedger
+from core.dedup import RegionDeduplicator
+from core.journal import AuditJournal, job_key
+from core.diff import LineRange
+from core.metrics import FileMetrics, file_scope, timed
+from core.pydantic_schema import AuditReport, Vulnerability
+from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
+from static_analyzers.findings import StaticAnalysisResult
+
+
+@dataclass
+class BatchResult:
+    """单个文件的审计结果"""
+    file_path: str
+    project_type: str
+    report: Optional[AuditReport] = None
+    error: Optional[str] = None
+    metrics: Optional[FileMetrics] = None
+    # 续跑时直接取自结果日志 (上次运行已完成)
+    resumed: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class StaticJob:
+    """静态阶段的一个任务：单个文件，或同一项目根目录下共享一次编译的一组文件"""
+    project_type: str
+    file_paths: List[str]
+    root: Optional[str] = None
+
+
+@dataclass
+class FileWork:
+    """在流水线中流转的单个文件状态"""
+    file_path: str
+    project_type: str
+    analyzer: AuditAnalyzer
+    static_result: Optional[StaticAnalysisResult] = None
+    plan: Optional[AuditPlan] = None
+    reports: List[Optional[AuditReport]] = field(default_factory=list)
+    pending: int = 0
+    error: Optional[str] = None
+    metrics: Optional[FileMetrics] = None
+    # 所在静态任务开始的时刻 (time.perf_counter)，用于计算文件的墙钟耗时
+    started: float = 0.0
+    # 设置 max_cost 时为该文件占用的预估费用额度
+    reserved_cost: float = 0.0
+    # 已产出结果：每个文件恰好产出一次，run() 按产出数计数
+    emitted: bool = False
+
+
+def _run_static_job(static_analyzer: AbstractStaticAnalyzer, file_path: str) -> StaticAnalysisResult:
+    """进程池任务入口 (必须是模块级函数才能被 pickle)"""
+    return static_analyzer.run_analysis(file_path)
+
+
+def _run_project_job(
+    static_analyzer: AbstractStaticAnalyzer, root: str, file_paths: List[str]
+) -> Dict[str, StaticAnalysisResult]:
+    """进程池任务入口：对同一项目下的一组文件只运行一次分析"""
+    return static_analyzer.run_project_analysis(root, file_paths)
+
+
+def _error_text(e: BaseException) -> str:
+    return f"{type(e).__name__}: {e}"
+
+
+class AuditPipeline:
+    """
+    analyzers: 项目类型 -> AuditAnalyzer
+    static_workers: 同时运行的静态分析任务数；llm_concurrency: 同时在途的 LLM 请求数 (按分块计)
+    queue_size: 每个阶段间队列的容量
+    changed_ranges: 增量模式下 文件 -> 变更行区间 (None 表示新增文件)；为 None 时做全量审计
+    on_vulnerability: 传入时 LLM 阶段走流式接口，漏洞在其 JSON 对象闭合时即回调，不等整份报告
+    deduplicator: 跨文件去重的区域指纹表 (仅全量审计生效)；为 None 时不去重
+    max_cost: 整批的费用上限 (美元)；为 None 时不限制
+    cost_ledger: 外部提供的额度账本 (多个进程共享同一上限)；为 None 时每次 run() 按 max_cost 新建
+    journal: 结果日志；为 None 时不记录、不续跑
+    """
+
+    def __init__(
+        self,
+        analyzers: Dict[str, AuditAnalyzer],
+        static_workers: int,
+        llm_concurrency: int,
+        queue_size: int,
+        static_executor: str = "async",
+        project_mode: bool = True,
+        changed_ranges: Optional[Dict[str, Optional[List[LineRange]]]] = None,
+        on_vulnerability: Optional[Callable[[str, Vulnerability], None]] = None,
+        deduplicator: Optional[RegionDeduplicator] = None,
+        max_cost: Optional[float] = None,
+        cost_ledger: Optional[CostLedger] = None,
+        journal: Optional[AuditJournal] = None,
+    ):
+        if static_workers < 1 or llm_concurrency < 1 or queue_size < 1:
+            raise ValueError("static_workers / llm_concurrency / queue_size 必须 >= 1")
+        self.analyzers = analyzers
+        self.static_workers = static_workers
+        self.llm_concurrency = llm_concurrency
+        self.queue_size = queue_size
+        self.static_executor = static_executor
+        self.project_mode = project_mode
+        self.changed_ranges = changed_ranges
+        # 流式模式：每解析出一条漏洞立即以 (文件, 漏洞) 回调
+        self.on_vulnerability = on_vulnerability
+        self.deduplicator = deduplicator
+        self.max_cost = max_cost
+        self.cost_ledger = cost_ledger
+        self.journal = journal
+
+    def plan_static_jobs(self, files: List[Tuple[str, str]]) -> Tuple[List[StaticJob], List[BatchResult]]:
+        """把 (文件, 项目类型) 分组为静态任务；没有对应分析器的文件直接返回错误结果"""
+        jobs: List[StaticJob] = []
+        groups: Dict[Tuple[str, str], StaticJob] = {}
+        rejected: List[BatchResult] = []
+        for file_path, project_type in files:
+            analyzer = self.analyzers.get(project_type)
+            if analyzer is None:
+                rejected.append(BatchResult(
+                    file_path, project_type, error=f"项目类型 '{project_type}' 没有可用的分析器"
+                ))
+                continue
+            root = analyzer.static_analyzer.project_root(file_path) if self.project_mode else None
+            if root is None:
+                jobs.append(StaticJob(project_type, [file_path]))
+            elif (project_type, root) in groups:
+                groups[(project_type, root)].file_paths.append(file_path)
+            else:
+                groups[(project_type, root)] = StaticJob(project_type, [file_path], root)
+                jobs.append(groups[(project_type, root)])
+        return jobs, rejected
+
+    async def run(self, files: List[Tuple[str, str]]) -> AsyncIterator[BatchResult]:
+        """files 为 (文件路径, 项目类型) 列表，按完成顺序流式产出每个文件的审计结果"""
+        if self.journal is not None:
+            pending = []
+            for file_path, project_type in files:
+                record = self._journaled(file_path)
+                if record is None:
+                    pending.append((file_path, project_type))
+                    continue
+                yield BatchResult(
+                    file_path, project_type, report=AuditReport.model_validate(record["report"]),
+                    metrics=FileMetrics(file_path, project_type), resumed=True,
+                )
+            if len(pending) < len(files):
+                print(f"📒 [Journal] 跳过上次已完成的 {len(files) - len(pending)} 个文件，继续审计 {len(pending)} 个")
+            files = pending
+        static_jobs, rejected = self.plan_static_jobs(files)
+        for result in rejected:
+            result.metrics = FileMetrics(result.file_path, result.project_type, error=result.error)
+            yield result
+        expected = len(files) - len(rejected)
+        if expected == 0:
+            return
+
+        self._static_input: Deque[StaticJob] = deque(static_jobs)
+        self._prompt_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._llm_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._finish_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._output_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        # 等待其他文件发布重复区域结论的汇总任务
+        self._adopting: Set[asyncio.Task] = set()
+        # 已占用的费用额度：在途文件按预估值、已完成文件按实际值计
+        self._ledger = self.cost_ledger
+        if self._ledger is None and self.max_cost is not None:
+            self._ledger = CostLedger(self.max_cost)
+        self._unpriced_warned = False
+        if self.deduplicator is not None:
+            self.deduplicator.bind(asyncio.get_running_loop())
+
+        with contextlib.ExitStack() as stack:
+            self._static_pool = None
+            if self.static_executor == "process":
+                self._static_pool = stack.enter_context(ProcessPoolExecutor(max_workers=self.static_workers))
+
+            workers = [
+                *[asyncio.create_task(self._static_worker()) for _ in range(self.static_workers)],
+                asyncio.create_task(self._prompt_worker()),
+                *[asyncio.create_task(self._llm_worker()) for _ in range(self.llm_concurrency)],
+                asyncio.create_task(self._finish_worker()),
+            ]
+            try:
+                for _ in range(expected):
+                    yield await self._output_queue.get()
+            finally:
+                # 全部产出或调用方提前退出：取消所有 worker (异步静态任务会连带终止工具进程组)
+                tasks = [*workers, *self._adopting]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _journaled(self, file_path: str) -> Optional[dict]:
+        try:
+            return self.journal.completed(file_path)
+        except OSError:
+            return None
+
+    async def _emit(self, work: FileWork, report: Optional[AuditReport] = None, error: Optional[str] = None) -> None:
+        """产出文件结果；重复调用时忽略，记账与日志写入失败也不影响产出"""
+        if work.emitted:
+            return
+        work.emitted = True
+        if self._ledger is not None:
+            try:
+                self._ledger.settle(work.reserved_cost, work.metrics.usage.cost_usd)
+            except Exception as e:
+                print(f"⚠️ [Budget] {work.file_path}: 更新费用额度失败: {_error_text(e)}")
+        work.metrics.error = error
+        work.metrics.wall_seconds = time.perf_counter() - work.started
+        if self.journal is not None:
+            try:
+                if report is not None:
+                    self.journal.record_done(work.file_path, work.project_type, report, work.metrics.to_dict())
+                else:
+                    self.journal.record_failure(work.file_path, error)
+            except Exception as e:
+                print(f"⚠️ [Journal] {work.file_path}: 写入结果日志失败: {_error_text(e)}")
+        await self._output_queue.put(
+            BatchResult(work.file_path, work.project_type, report=report, error=error, metrics=work.metrics)
+        )
+
+    async def _fail(self, work: FileWork, error: str) -> None:
+        await self._emit(work, error=error)
+
+    # --- 阶段 1: 静态分析 ---
+
+    async def _run_static(self, job: StaticJob, static_analyzer: AbstractStaticAnalyzer) -> Dict[str, StaticAnalysisResult]:
+        loop = asyncio.get_running_loop()
+        if job.root is None:
+            file_path = job.file_paths[0]
+            if self._static_pool is None:
+                return {file_path: await static_analyzer.arun_analysis(file_path)}
+            return {file_path: await loop.run_in_executor(self._static_pool, _run_static_job, static_analyzer, file_path)}
+        if self._static_pool is None:
+            return await static_analyzer.arun_project_analysis(job.root, job.file_paths)
+        return await loop.run_in_executor(
+            self._static_pool, _run_project_job, static_analyzer, job.root, job.file_paths
+        )
+
+    @staticmethod
+    def _preflight(analyzer: AuditAnalyzer, file_paths: List[str]) -> Dict[str, str]:
+        """Prompt 预算预检 (同时检查文件可读、是合法 UTF-8)，返回 文件 -> 错误"""
+        errors = {}
+        for file_path in file_paths:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    analyzer.preflight(file_path, f.read())
+            except Exception as e:
+                errors[file_path] = _error_text(e)
+        return errors
+
+    def _journaled_static(self, job: StaticJob) -> Optional[Dict[str, StaticAnalysisResult]]:
+        """任务内全部文件都有已记录的静态结果时直接复用，不再启动工具"""
+        if self.journal is None:
+            return None
+        results = {file_path: self.journal.static_result(file_path) for file_path in job.file_paths}
+        return None if any(result is None for result in results.values()) else results
+
+    async def _static_worker(self) -> None:
+        while self._static_input:
+            job = self._static_input.popleft()
+            started = time.perf_counter()
+            # 每个文件恰好向下游交付一次 (送入 Prompt 队列或产出失败结果)
+            works = {
+                file_path: FileWork(
+                    file_path, job.project_type, self.analyzers.get(job.project_type),
+                    metrics=FileMetrics(file_path, job.project_type), started=started,
+                )
+                for file_path in job.file_paths
+            }
+            delivered: Set[str] = set()
+            try:
+                await self._run_static_stage(job, works, delivered)
+            except Exception as e:
+                for file_path, work in works.items():
+                    if file_path not in delivered:
+                        await self._fail(work, _error_text(e))
+
+    async def _run_static_stage(self, job: StaticJob, works: Dict[str, FileWork], delivered: Set[str]) -> None:
+        analyzer = self.analyzers[job.project_type]
+        # 代码本身超出 Prompt 预算 (或无法读取) 的文件不必等静态分析
+        for file_path, error in (await asyncio.to_thread(self._preflight, analyzer, job.file_paths)).items():
+            job.file_paths.remove(file_path)
+            delivered.add(file_path)
+            await self._fail(works[file_path], error)
+        if not job.file_paths:
+            return
+        # 一次静态任务可能覆盖多个文件：耗时与缓存命中先记在任务上，再均摊给各文件
+        job_metrics = FileMetrics(job.root or job.file_paths[0], job.project_type)
+        try:
+            results = self._journaled_static(job)
+            if results is None:
+                with file_scope(job_metrics), timed("static"):
+                    results = await self._run_static(job, analyzer.static_analyzer)
+                if self.journal is not None:
+                    for file_path, result in results.items():
+                        if file_path in job.file_paths:
+                            self.journal.record_static(file_path, result)
+            error = None
+        except Exception as e:
+            results, error = {}, _error_text(e)
+        share = len(job.file_paths)
+        for file_path in job.file_paths:
+            work = works[file_path]
+            work.metrics.stages["static"] = job_metrics.stages["static"] / share
+            work.metrics.static_cache_hits = 1 if job_metrics.static_cache_hits else 0
+            delivered.add(file_path)
+            if error or file_path not in results:
+                await self._fail(work, error or "静态分析未返回该文件的结果")
+                continue
+            work.static_result = results[file_path]
+            # 下游队列满时在这里阻塞，静态阶段不会无限领先于 LLM 阶段
+            await self._prompt_queue.put(work)
+
+    # --- 阶段 2: 读取源码并构建 Prompt (在线程中执行，避免 BM25 检索阻塞事件循环) ---
+
+    def _plan(self, work: FileWork) -> AuditPlan:
+        with open(work.file_path, 'r', encoding='utf-8') as f:
+            contract_code = f.read()
+        incremental = self.changed_ranges is not None
+        return work.analyzer.plan_audit(
+            contract_code,
+            work.static_result,
+            file_path=work.file_path,
+            incremental=incremental,
+            changed_ranges=self.changed_ranges.get(work.file_path) if incremental else None,
+            deduplicator=None if incremental else self.deduplicator,
+        )
+
+    async def _prompt_worker(self) -> None:
+        while True:
+            work: FileWork = await self._prompt_queue.get()
+            try:
+                error = await self._prepare(work)
+            except Exception as e:
+                error = _error_text(e)
+            if error:
+                await self._abandon(work, error)
+                continue
+            jobs = len(work.plan.jobs)
+            if jobs == 0:
+                # 增量模式下没有变更区域 / 所有区域都与其他文件重复：直接汇总复用的结论
+                await self._finish_queue.put((work, None, None))
+                continue
+            for index in range(jobs):
+                await self._llm_queue.put((work, index))
+
+    async def _prepare(self, work: FileWork) -> Optional[str]:
+        """构建 Prompt 并占用费用额度；超出费用上限时返回错误信息"""
+        # to_thread 继承当前上下文，Prompt 构建耗时计入该文件
+        with file_scope(work.metrics):
+            work.plan = await asyncio.to_thread(self._plan, work)
+        work.static_result = None
+        # 共享账本可能需要等待其他进程的数据库锁，不阻塞事件循环
+        error = await asyncio.to_thread(self._reserve_cost, work)
+        if error:
+            return error
+        work.reports = [None] * len(work.plan.jobs)
+        work.pending = len(work.plan.jobs)
+        return None
+
+    async def _abandon(self, work: FileWork, error: str) -> None:
+        """文件在送审前失败：通知等待其登记区域的文件，并产出失败结果"""
+        if work.plan is not None:
+            try:
+                work.analyzer.share_regions(work.plan, None)
+            except Exception as e:
+                print(f"⚠️ [Dedup] {work.file_path}: 发布区域结论失败: {_error_text(e)}")
+        await self._fail(work, error)
+
+    def _reserve_cost(self, work: FileWork) -> Optional[str]:
+        """按预估费用占用 max_cost 额度，超出时返回错误信息"""
+        if self._ledger is None or not work.plan.jobs:
+            return None
+        cost = work.plan.estimated_cost
+        if cost is None:
+            if not self._unpriced_warned:
+                self._unpriced_warned = True
+                print(f"⚠️ [Budget] 模型 {work.analyzer.prompt_budget.model_name} 不在价格表中，费用上限按 0 计")
+            return None
+        remaining = self._ledger.reserve(cost)
+        if remaining is not None:
+            return (
+                f"预计费用 ${cost:.4f} 超出费用上限的剩余额度 ${max(remaining, 0):.4f} "
+                f"(上限 ${self._ledger.max_cost:.2f})，未发送"
+            )
+        work.reserved_cost = cost
+        return None
+
+    # --- 阶段 3: LLM 调用、校验与修复 ---
+
+    async def _llm_worker(self) -> None:
+        while True:
+            work, index = await self._llm_queue.get()
+            report = None
+            # 同一文件的其他分块已失败时跳过剩余请求；无论成败每个分块都向汇总阶段交付一次
+            if not work.error:
+                try:
+                    report = await self._run_job(work, index)
+                except Exception as e:
+                    work.error = work.error or _error_text(e)
+                    report = None
+            await self._finish_queue.put((work, index, report))
+
+    async def _run_job(self, work: FileWork, index: int) -> AuditReport:
+        callback = None
+        if self.on_vulnerability is not None:
+            callback = lambda vul, path=work.file_path: self.on_vulnerability(path, vul)
+        job = work.plan.jobs[index]
+        key = job_key(job.system_prompt, job.user_prompt) if self.journal is not None else None
+        report = self.journal.chunk_report(work.file_path, key) if key else None
+        if report is None:
+            with file_scope(work.metrics):
+                report = await work.analyzer.arun_job(job, callback)
+            if key:
+                try:
+                    self.journal.record_chunk(work.file_path, key, report)
+                except Exception as e:
+                    print(f"⚠️ [Journal] {work.file_path}: 写入分块报告失败: {_error_text(e)}")
+        return report
+
+    # --- 阶段 4: 汇总 ---
+
+    async def _finish_worker(self) -> None:
+        while True:
+            work, index, report = await self._finish_queue.get()
+            if index is not None:
+                work.pending -= 1
+                work.reports[index] = report
+                if work.pending > 0:
+                    continue
+
+            try:
+                await self._conclude(work)
+            except Exception as e:
+                await self._abandon(work, work.error or _error_text(e))
+
+    async def _conclude(self, work: FileWork) -> None:
+        # 先发布本文件送审区域的结论，再等待别人的结论，互相重复的两个文件不会互相等待
+        work.analyzer.share_regions(work.plan, None if work.error else work.reports)
+        if work.error:
+            await self._fail(work, work.error)
+            return
+        if work.plan.borrowed:
+            task = asyncio.create_task(self._adopt_and_finish(work))
+            self._adopting.add(task)
+            task.add_done_callback(self._adopting.discard)
+            return
+        await self._finish(work)
+
+    async def _adopt_and_finish(self, work: FileWork) -> None:
+        try:
+            await asyncio.gather(*[group.future for _, group in work.plan.borrowed])
+            for vul in work.analyzer.adopt_regions(work.plan):
+                if self.on_vulnerability is not None:
+                    self.on_vulnerability(work.file_path, vul)
+        except Exception as e:
+            await self._fail(work, _error_text(e))
+            return
+        await self._finish(work)
+
+    async def _finish(self, work: FileWork) -> None:
+        try:
+            # 写区域缓存涉及磁盘 IO，放到线程中执行
+            report = await asyncio.to_thread(work.analyzer.finish_audit, work.plan, work.reports)
+        except Exception as e:
+            await self._fail(work, _error_text(e))
+            return
+        await self._emit(work, report=report)
@@ -0,0 +1,48 @@
+# core/prompts.py
+"""
+Prompt 组装：把每次调用都不变的内容 (角色说明、审计步骤、JSON Schema，以及不做检索时的整份知识库)
+放在字节级一致的 system prompt 前缀中，随文件变化的内容 (检索到的知识条目、静态发现、代码) 全部放在用户消息里。
+
+OpenAI / Gemini 的服务端 Prompt 缓存按前缀匹配：前缀一致时，批量运行中除第一次调用外，
+这部分 Token 都按缓存价格计费且不再重复预填充。
+"""
+import hashlib
+import json
+from typing import Any, Dict, Tuple
+
+from config import prompt_templates
+
+
+def stable_schema_json(schema: Dict[str, Any]) -> str:
+    """固定键顺序与缩进，保证同一 Schema 在不同进程 / 版本间序列化结果字节一致"""
+    return json.dumps(schema, indent=2, ensure_ascii=False, sort_keys=True)
+
+
+class PromptAssembler:
+    """
+    system prompt 在构造时生成一次，此后每次调用原样复用。
+    knowledge_base 非空时 (RAG_TOP_K=0) 整份知识库进入前缀，用户消息只保留一句引用说明。
+    """
+
+    def __init__(self, schema_json: str, knowledge_base: str = ""):
+        self.knowledge_base_in_prefix = bool(knowledge_base)
+        parts = [
+            prompt_templates.SYSTEM_PROMPT_TEMPLATE,
+            prompt_templates.AUDIT_INSTRUCTIONS_TEMPLATE.format(schema_json=schema_json),
+        ]
+        if knowledge_base:
+            parts.append(prompt_templates.KNOWLEDGE_BASE_TEMPLATE.format(best_practices_content=knowledge_base))
+        self.system_prompt = "\n".join(parts)
+        # 前缀指纹：服务端缓存提示 (如 OpenAI prompt_cache_key) 与日志使用
+        self.prefix_hash = hashlib.sha256(self.system_prompt.encode("utf-8")).hexdigest()[:16]
+
+    def build(self, rag_context: str, static_text: str, contract_code: str) -> Tuple[str, str]:
+        """返回 (system_prompt, user_prompt)，system_prompt 与其他调用完全相同"""
+        if self.knowledge_base_in_prefix:
+            rag_context = prompt_templates.KNOWLEDGE_BASE_IN_SYSTEM_PROMPT
+        user_prompt = prompt_templates.USER_PROMPT_TEMPLATE.format(
+            rag_context=rag_context,
+            static_analysis_result=static_text,
+            contract_code=contract_code,
+        )
+        return self.system_prompt, user_prompt
@@ -1,11 +1,21 @@
 # core/pydantic_schema.py
 from pydantic import BaseModel, Field, conlist
-from typing import Literal
+from typing import Any, Literal, Optional, Sequence
 
 from config.settings import llm_settings 
 
 # 使用配置中的风险等级
 SeverityType = Literal['High', 'Medium', 'Low', 'Informational']
+ConfidenceType = Literal['High', 'Medium', 'Low']
+# 置信度 / 严重度由低到高，级联路由、集成合并、静态发现过滤与合并报告时比较使用
+CONFIDENCE_ORDER = ['Low', 'Medium', 'High']
+SEVERITY_ORDER = ['Informational', 'Low', 'Medium', 'High']
+
+
+def rank(value: Any, order: Sequence[str], default: Optional[int] = None) -> Optional[int]:
+    """value 在由低到高的 order 中的位置；不在其中 (含缺失) 时返回 default"""
+    return order.index(value) if value in order else default
+
 
 class Vulnerability(BaseModel):
     """定义单个智能合约漏洞的结构化输出"""
@@ -19,4 +29,9 @@ class Vulnerability(BaseModel):
 class AuditReport(BaseModel):
     """定义最终的安全审计报告结构"""
     analysis_summary: str = Field(description="本次审计的总体摘要。")
-    vulnerabilities: conlist(Vulnerability, min_length=0)
\ No newline at end of file
+    vulnerabilities: conlist(Vulnerability, min_length=0)
+    # 级联路由据此决定是否升级到强模型；可省略
+    confidence: Optional[ConfidenceType] = Field(
+        default=None,
+        description="对本次审计结论完整性的整体置信度：High, Medium, Low 之一。代码逻辑复杂、上下文不足或不确定是否遗漏漏洞时填 Low。"
+    )
\ No newline at end of file
@@ -0,0 +1,182 @@
+# core/retrieval.py
+"""
+安全最佳实践知识库的本地检索索引 (BM25)。
+
+知识库按条目切分后建立倒排索引并持久化到磁盘，源文件内容不变时直接加载；
+每次审计只取与静态发现 + 代码最相关的 top-k 条目放进 Prompt，
+Prompt 大小不再随知识库线性增长。
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+INDEX_FORMAT_VERSION = 1
+
+_ASCII_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9]*|\d+")
+_CJK_RUN_RE = re.compile(r"[一-鿿]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_NUMBERED_RE = re.compile(r"^\s*(\d+[.)、]|[-*•])\s+")
+
+# 列表项 (首行) 长度中位数低于该值时不拆分段落
+MIN_SPLIT_ITEM_CHARS = 60
+
+# 代码中高频但对检索没有区分度的词
+STOPWORDS = {
+    "the", "a", "an", "of", "to", "in", "is", "and", "or", "for", "if", "be", "on", "it", "as",
+    "function", "public", "private", "internal", "external", "return", "returns", "uint256", "uint",
+    "memory", "storage", "let", "mut", "pub", "fn", "self", "use", "ok", "line", "global",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中英混合分词：英文标识符按 snake_case / camelCase 拆分并小写，
+    同时保留完整标识符；中文连续片段切成二元组 (单字片段保留单字)。
+    """
+    tokens: List[str] = []
+    for word in _ASCII_WORD_RE.findall(text):
+        parts = [p for p in _CAMEL_RE.split(word) if p]
+        lowered = word.lower()
+        if lowered not in STOPWORDS and len(lowered) > 1:
+            tokens.append(lowered)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts if len(p) > 1 and p.lower() not in STOPWORDS)
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def split_corpus(content: str) -> List[str]:
+    """
+    将知识库切分为独立条目：
+    - 以空行分隔段落；
+    - 段落内的编号 / 列表项足够长 (各自是一条完整规则) 时各自成为一条，并带上段落标题作为上下文；
+      较短的列表项 (如 CEI 的三个步骤) 通常需要放在一起理解，保留整段。
+    """
+    snippets: List[str] = []
+    for block in re.split(r"\n\s*\n", content):
+        lines = [line.rstrip() for line in block.strip().splitlines() if line.strip()]
+        if not lines:
+            continue
+        header: List[str] = []
+        items: List[List[str]] = []
+        for line in lines:
+            if _NUMBERED_RE.match(line):
+                items.append([line])
+            elif items:
+                items[-1].append(line)
+            else:
+                header.append(line)
+        item_lengths = sorted(len(item[0]) for item in items)
+        if len(items) < 2 or item_lengths[len(item_lengths) // 2] < MIN_SPLIT_ITEM_CHARS:
+            snippets.append("\n".join(lines))
+            continue
+        prefix = "\n".join(header)
+        for item in items:
+            body = "\n".join(item)
+            snippets.append(f"{prefix}\n{body}" if prefix else body)
+    return snippets
+
+
+class BM25Index:
+    """Okapi BM25 倒排索引"""
+
+    def __init__(self, snippets: List[str], source_hash: str = "", k1: float = 1.5, b: float = 0.75):
+        self.snippets = snippets
+        self.source_hash = source_hash
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, snippet in enumerate(snippets):
+            counts = Counter(tokenize(snippet))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.snippets)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """返回得分最高的 (条目下标, 得分)，按得分降序"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_doc_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+    # --- 持久化 ---
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_FORMAT_VERSION,
+            "source_hash": self.source_hash,
+            "k1": self.k1,
+            "b": self.b,
+            "snippets": self.snippets,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls.__new__(cls)
+        index.snippets = data["snippets"]
+        index.source_hash = data["source_hash"]
+        index.k1 = data["k1"]
+        index.b = data["b"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in plist] for term, plist in data["postings"].items()}
+        index.avg_doc_length = (sum(index.doc_lengths) / len(index.doc_lengths)) if index.doc_lengths else 0.0
+        return index
+
+    def save(self, index_path: str) -> None:
+        directory = os.path.dirname(index_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+
+def load_or_build_index(source_path: str, index_path: str) -> Optional[BM25Index]:
+    """源文件哈希与已持久化索引一致时直接加载，否则重建并写回磁盘。源文件不存在时返回 None。"""
+    try:
+        with open(source_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    source_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == INDEX_FORMAT_VERSION and data.get("source_hash") == source_hash:
+            return BM25Index.from_dict(data)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    print(f"📚 [RAG] 知识库已变更，重建检索索引: {source_path}")
+    index = BM25Index(split_corpus(content), source_hash=source_hash)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        print(f"⚠️ [RAG] 索引写入失败，本次仅使用内存索引: {e}")
+    return index
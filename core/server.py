@@ -0,0 +1,495 @@
+# core/server.py
+"""
+常驻审计服务 (python main.py --serve)：进程内保留已初始化的 LLM 客户端、分析器、RAG 索引与 Schema，
+通过本地 HTTP/JSON 接口接收审计任务，省去每次启动 python main.py 的初始化开销。
+
+接口：
+    POST   /jobs              提交任务 {"targets": [...], "sources": {"A.sol": "..."}, "priority": 0, "type": null}
+    GET    /jobs              任务列表
+    GET    /jobs/<id>         任务状态与已完成文件的结果 (轮询)
+    GET    /jobs/<id>/events  NDJSON 事件流：漏洞 / 文件结果 / 状态变化，任务结束时关闭连接
+    DELETE /jobs/<id>         取消排队中或运行中的任务
+    GET    /health            存活检查与队列长度
+    GET    /metrics           Prometheus 文本格式的累计指标
+
+- 任务按 priority 排队 (数值越大越先执行，同优先级先进先出)，最多 SERVER_MAX_JOBS 个任务同时运行，
+  每个任务内部复用批量流水线 (core.pipeline)；排队数超过 SERVER_MAX_QUEUED 时返回 503；
+- HTTP 请求在 ThreadingHTTPServer 的线程中处理，审计在后台线程的事件循环中运行，两者通过线程安全的调用交接。
+"""
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from config.settings import project_settings
+from core.analyzer import AuditAnalyzer
+from core.batch import EXTENSION_PROJECT_TYPES, BatchAuditRunner, collect_contract_files, detect_file_project_type
+from core.factories import ServiceFactory
+from core.metrics import MetricsCollector
+from core.pipeline import BatchResult
+
+# 请求体上限 (内联源码提交)
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class QueueFullError(RuntimeError):
+    """排队任务数已达 SERVER_MAX_QUEUED"""
+
+
+@dataclass
+class AuditJob:
+    """一个审计任务：一组文件共享一次批量流水线"""
+    id: str
+    files: List[str]
+    priority: int = 0
+    project_type: Optional[str] = None
+    # 内联源码写入的临时目录 (任务结束后删除)，结果中的路径相对该目录显示
+    workdir: Optional[str] = None
+    status: str = "queued"
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def finished_state(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def display_path(self, path: str) -> str:
+        return os.path.relpath(path, self.workdir) if self.workdir else path
+
+    def emit(self, event: str, **data) -> None:
+        """追加一条事件并唤醒所有事件流连接"""
+        with self.cond:
+            self.events.append({"event": event, **data})
+            self.cond.notify_all()
+
+    def set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        if status == "running":
+            self.started = time.time()
+        elif status in FINISHED_STATES:
+            self.finished = time.time()
+        self.emit("status", status=status, error=error)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "files": len(self.files),
+            "completed": len(self.results),
+            "failures": sum(1 for r in self.results if not r["ok"]),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.summary(), "results": list(self.results)}
+
+
+class AuditService:
+    """
+    持有常驻的 LLM 服务与各项目类型的 AuditAnalyzer，并在后台事件循环中按优先级调度任务。
+    max_jobs: 同时运行的任务数；max_queued: 排队上限；history: 保留的已结束任务数 (更早的被清理)
+    metrics_window: /metrics 分位数使用的最近文件数 (None 表示全部保留)
+    """
+
+    def __init__(
+        self,
+        max_jobs: int,
+        max_queued: int,
+        history: int,
+        static_workers: int,
+        llm_concurrency: int,
+        metrics_window: Optional[int] = None,
+    ):
+        if max_jobs < 1:
+            raise ValueError("SERVER_MAX_JOBS 必须 >= 1")
+        self.max_jobs = max_jobs
+        self.max_queued = max_queued
+        self.history = history
+        self.static_workers = static_workers
+        self.llm_concurrency = llm_concurrency
+        # 启动时即创建 LLM 客户端：缺少 API Key 等配置错误在启动阶段暴露
+        self.llm_service = ServiceFactory.get_llm_service()
+        self.region_cache = ServiceFactory.get_region_cache()
+        self.analyzers: Dict[str, AuditAnalyzer] = {}
+        self.jobs: Dict[str, AuditJob] = {}
+        self.metrics = MetricsCollector(window=metrics_window)
+        self.lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._seq = itertools.count()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="audit-service", daemon=True)
+
+    # --- 生命周期 ---
+
+    def start(self) -> None:
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        """取消运行中的任务并停止事件循环"""
+        if self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout=30)
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._main())
+        self.loop.close()
+
+    async def _main(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        self._stopping = asyncio.Event()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.max_jobs)]
+        self._ready.set()
+        await self._stopping.wait()
+        tasks = [job.task for job in list(self.jobs.values()) if job.task is not None and not job.task.done()]
+        for task in workers + tasks:
+            task.cancel()
+        await asyncio.gather(*workers, *tasks, return_exceptions=True)
+
+    # --- 任务提交 ---
+
+    def analyzer_for(self, project_type: str) -> Optional[AuditAnalyzer]:
+        """按项目类型复用已初始化的 AuditAnalyzer (首次使用时创建)；类型不受支持时返回 None"""
+        with self.lock:
+            if project_type not in self.analyzers:
+                try:
+                    static_analyzer = ServiceFactory.get_static_analyzer(project_type)
+                except NotImplementedError:
+                    return None
+                self.analyzers[project_type] = AuditAnalyzer(
+                    llm_service=self.llm_service,
+                    static_analyzer=static_analyzer,
+                    region_cache=self.region_cache,
+                )
+            return self.analyzers[project_type]
+
+    def submit(self, payload: Dict[str, Any]) -> AuditJob:
+        """校验请求并入队；请求不合法时抛出 ValueError，队列已满时抛出 QueueFullError"""
+        targets = payload.get("targets") or []
+        sources = payload.get("sources") or {}
+        if not isinstance(targets, list) or not all(isinstance(t, str) for t in targets):
+            raise ValueError("targets 必须是路径字符串列表")
+        if not isinstance(sources, dict) or not all(isinstance(c, str) for c in sources.values()):
+            raise ValueError("sources 必须是 {文件名: 源码} 对象")
+        try:
+            priority = int(payload.get("priority", 0))
+        except (TypeError, ValueError):
+            raise ValueError("priority 必须是整数")
+        project_type = payload.get("type")
+        if project_type is not None and project_type not in EXTENSION_PROJECT_TYPES.values():
+            raise ValueError(f"未知的项目类型: {project_type}")
+
+        files = collect_contract_files(targets)
+        missing = [f for f in files if not os.path.isfile(f)]
+        if missing:
+            raise ValueError(f"找不到文件: {', '.join(missing[:5])}")
+        if self._queued() >= self.max_queued:
+            # 快速拒绝，避免为注定被拒的请求写临时文件；是否入队以下面加锁后的检查为准
+            raise QueueFullError(f"排队任务已达上限 ({self.max_queued})")
+
+        workdir = None
+        if sources:
+            workdir = tempfile.mkdtemp(prefix="certi-job-")
+            files += self._write_sources(workdir, sources)
+        if not files:
+            raise ValueError("没有可审计的文件 (targets 与 sources 均为空)")
+
+        for file_type in {project_type or detect_file_project_type(f) for f in files}:
+            # 提前创建分析器，使首个任务的初始化开销不落在事件循环里；不支持的类型由流水线逐文件报错
+            self.analyzer_for(file_type)
+
+        job = AuditJob(uuid.uuid4().hex[:12], files, priority, project_type, workdir)
+        # 排队数检查与登记在同一把锁内完成，并发提交不会超出上限
+        with self.lock:
+            full = self._queued_locked() >= self.max_queued
+            if not full:
+                self.jobs[job.id] = job
+        if full:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+            raise QueueFullError(f"排队任务已达上限 ({self.max_queued})")
+        job.emit("status", status=job.status, error=None)
+        print(f"📥 [Server] 任务 {job.id} 已入队: {len(files)} 个文件，优先级 {priority}")
+        # PriorityQueue 取最小值：优先级取负，同优先级按提交顺序
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, (-priority, next(self._seq), job))
+        return job
+
+    @staticmethod
+    def _write_sources(workdir: str, sources: Dict[str, str]) -> List[str]:
+        paths = []
+        for name, code in sources.items():
+            path = os.path.normpath(os.path.join(workdir, name))
+            if os.path.isabs(name) or not path.startswith(workdir + os.sep):
+                shutil.rmtree(workdir, ignore_errors=True)
+                raise ValueError(f"sources 中的文件名必须是相对路径: {name}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(code)
+            paths.append(path)
+        return paths
+
+    def _queued_locked(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    def _queued(self) -> int:
+        with self.lock:
+            return self._queued_locked()
+
+    def get(self, job_id: str) -> Optional[AuditJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [job.summary() for job in self.jobs.values()]
+
+    def cancel(self, job_id: str) -> Optional[AuditJob]:
+        """
+        取消任务。状态判断与修改都交给事件循环线程执行 (任务的出队与启动也只在该线程发生)，
+        不会出现 HTTP 线程判定为排队中、同时 worker 已经开始运行的竞争。
+        """
+        job = self.get(job_id)
+        if job is None or job.finished_state:
+            return job
+        asyncio.run_coroutine_threadsafe(self._cancel(job), self.loop).result(timeout=30)
+        return job
+
+    async def _cancel(self, job: AuditJob) -> None:
+        """排队中的任务直接标记取消 (出队时跳过)；运行中的任务取消其协程"""
+        if job.status == "queued":
+            job.set_status("cancelled")
+            self._cleanup(job)
+        elif job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    def health(self) -> Dict[str, Any]:
+        with self.lock:
+            states = [job.status for job in self.jobs.values()]
+        return {
+            "status": "ok",
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            "max_jobs": self.max_jobs,
+            "uptime_seconds": round(time.perf_counter() - self.metrics.started, 1),
+        }
+
+    # --- 任务执行 ---
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status != "queued":
+                continue
+            # 与 _cancel 同在事件循环线程：标记运行与创建协程之间不会插入取消
+            job.set_status("running")
+            job.task = asyncio.create_task(self._run_job(job))
+            await asyncio.wait([job.task])
+            if not job.finished_state:
+                # 协程在开始执行前就被取消，_run_job 的 finally 没有机会运行
+                job.set_status("cancelled")
+                self._cleanup(job)
+
+    def _result_entry(self, job: AuditJob, result: BatchResult) -> Dict[str, Any]:
+        metrics = result.metrics.to_dict() if result.metrics else None
+        if metrics:
+            metrics["file_path"] = job.display_path(metrics["file_path"])
+        return {
+            "file": job.display_path(result.file_path),
+            "project_type": result.project_type,
+            "ok": result.ok,
+            "report": result.report.model_dump() if result.report else None,
+            "error": result.error,
+            "metrics": metrics,
+        }
+
+    async def _run_job(self, job: AuditJob) -> None:
+        print(f"🚀 [Server] 任务 {job.id} 开始运行")
+        with self.lock:
+            analyzers = dict(self.analyzers)
+        runner = BatchAuditRunner(
+            analyzers,
+            static_workers=self.static_workers,
+            llm_concurrency=self.llm_concurrency,
+            project_type_override=job.project_type,
+            project_mode=project_settings.STATIC_PROJECT_MODE,
+            static_executor=project_settings.BATCH_STATIC_EXECUTOR,
+            queue_size=project_settings.PIPELINE_QUEUE_SIZE,
+            on_vulnerability=lambda path, vul: job.emit(
+                "vulnerability", file=job.display_path(path), **vul.model_dump()
+            ),
+            dedup_min_lines=project_settings.DEDUP_MIN_LINES if project_settings.DEDUP_ENABLED else None,
+        )
+        try:
+            async for result in runner.run(job.files):
+                self.metrics.add(result.metrics)
+                entry = self._result_entry(job, result)
+                with job.cond:
+                    job.results.append(entry)
+                job.emit("file", **entry)
+            job.set_status("done")
+        except asyncio.CancelledError:
+            job.set_status("cancelled")
+            raise
+        except Exception as e:
+            job.set_status("failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            self._cleanup(job)
+            print(f"🏁 [Server] 任务 {job.id} 结束: {job.status} ({len(job.results)}/{len(job.files)} 个文件)")
+
+    def _cleanup(self, job: AuditJob) -> None:
+        """删除内联源码目录，并清理超出 history 的最早的已结束任务"""
+        if job.workdir:
+            shutil.rmtree(job.workdir, ignore_errors=True)
+        with self.lock:
+            finished = [job_id for job_id, j in self.jobs.items() if j.finished_state]
+            for job_id in finished[:max(len(finished) - self.history, 0)]:
+                del self.jobs[job_id]
+
+
+class AuditRequestHandler(BaseHTTPRequestHandler):
+    """把 HTTP 请求路由到 server.service (AuditService)"""
+
+    server_version = "CertiAudit/1.0"
+
+    @property
+    def service(self) -> AuditService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        print(f"🌐 [Server] {self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": message})
+
+    def _path_parts(self) -> List[str]:
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ["health"]:
+            return self._send_json(200, self.service.health())
+        if parts == ["metrics"]:
+            body = self.service.metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if parts == ["jobs"]:
+            return self._send_json(200, {"jobs": self.service.list_jobs()})
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_error(404, f"任务不存在: {parts[1]}")
+            if len(parts) == 2:
+                with job.cond:
+                    return self._send_json(200, job.to_dict())
+            if parts[2] == "events":
+                return self._stream_events(job)
+        self._send_error(404, f"未知路径: {self.path}")
+
+    def do_POST(self):
+        if self._path_parts() != ["jobs"]:
+            return self._send_error(404, f"未知路径: {self.path}")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            return self._send_error(413, f"请求体超过 {MAX_BODY_BYTES // (1024 * 1024)} MB")
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是 JSON 对象")
+            job = self.service.submit(payload)
+        except QueueFullError as e:
+            return self._send_error(503, str(e))
+        except ValueError as e:
+            return self._send_error(400, str(e))
+        self._send_json(202, job.summary())
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._send_error(404, f"未知路径: {self.path}")
+        job = self.service.cancel(parts[1])
+        if job is None:
+            return self._send_error(404, f"任务不存在: {parts[1]}")
+        self._send_json(200, job.summary())
+
+    def _stream_events(self, job: AuditJob) -> None:
+        """逐行写出任务事件 (从第一条开始回放)，任务结束且事件发完后关闭连接"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                with job.cond:
+                    while sent == len(job.events) and not job.finished_state:
+                        job.cond.wait(timeout=15)
+                    events = job.events[sent:]
+                    finished = job.finished_state
+                for event in events:
+                    self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                sent += len(events)
+                if finished and sent == len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开不影响任务本身
+            return
+
+
+def serve(host: str, port: int) -> None:
+    """启动常驻服务，直到 Ctrl+C"""
+    service = AuditService(
+        max_jobs=project_settings.SERVER_MAX_JOBS,
+        max_queued=project_settings.SERVER_MAX_QUEUED,
+        history=project_settings.SERVER_JOB_HISTORY,
+        static_workers=project_settings.BATCH_STATIC_WORKERS,
+        llm_concurrency=project_settings.BATCH_LLM_CONCURRENCY,
+        metrics_window=project_settings.SERVER_METRICS_WINDOW,
+    )
+    service.start()
+    httpd = ThreadingHTTPServer((host, port), AuditRequestHandler)
+    httpd.service = service
+    print(f"🛰️  [Server] 审计服务已启动: http://{host}:{port} (并发任务 {service.max_jobs})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 [Server] 正在停止...")
+    finally:
+        httpd.server_close()
+        service.stop()
@@ -0,0 +1,212 @@
+# core/watch.py
+"""
+监听模式 (--watch)：本地迭代时保存即审计。
+
+- 轮询目标目录下合约文件的 (mtime, size)，检测到变化后等待 debounce 秒内不再有新的保存再开始一轮，
+  编辑器连续写盘 / 批量替换只触发一次审计；
+- 每轮只对变化的文件重新运行静态分析，文件内只有规范化内容 (去注释、折叠空白) 变化的函数区域
+  发送给 LLM，其余区域沿用上一轮的结论；只改了注释或格式的文件整轮跳过；
+- 新的漏洞在模型输出解析出来时立即流式打印，不必等整份报告。
+
+使用标准库轮询而不是 inotify：不增加依赖，也能用于网络文件系统与容器挂载目录。
+"""
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from core.batch import BatchAuditRunner, collect_contract_files, detect_file_project_type
+from core.cache import RegionResultCache, ResultCache, sha256_text
+from core.chunker import CodeChunk, detect_language, split_units
+from core.dedup import normalize_code
+from core.diff import LineRange
+from core.pipeline import BatchResult
+from core.pydantic_schema import AuditReport, Vulnerability
+
+# 文件标识：(修改时间 ns, 字节数)
+FileStamp = Tuple[int, int]
+
+
+def scan_files(targets: Sequence[str]) -> Dict[str, FileStamp]:
+    """展开目标并记录每个合约文件的 (mtime, size)；扫描期间被删除的文件忽略"""
+    stamps: Dict[str, FileStamp] = {}
+    for file_path in collect_contract_files(targets):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        stamps[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+def changed_regions(old_code: str, new_code: str, language: str) -> List[LineRange]:
+    """
+    新版本中规范化内容在旧版本里找不到的函数区域 (新行号区间)。
+    只移动位置、只改注释或空白的区域不算变更；删除的区域不需要重新审计。
+    """
+    previous: Dict[str, int] = {}
+    for unit in split_units(old_code, language):
+        text = normalize_code(unit.code, language)[0]
+        previous[text] = previous.get(text, 0) + 1
+    ranges: List[LineRange] = []
+    for unit in split_units(new_code, language):
+        text = normalize_code(unit.code, language)[0]
+        if previous.get(text):
+            previous[text] -= 1
+        else:
+            ranges.append((unit.start_line, unit.end_line))
+    return ranges
+
+
+class NormalizedRegionCache:
+    """
+    监听会话内的区域结论：按规范化代码索引，只改了注释或格式的函数在增量轮次中仍能复用上一轮的结论
+    (持久化的 RegionResultCache 按原始代码哈希索引，这种情况下会未命中)。
+    未命中时回落到持久化缓存，写入时两边都写。
+    """
+
+    def __init__(self, persistent: Optional[RegionResultCache] = None):
+        self.persistent = persistent
+        self._regions: Dict[str, List[dict]] = {}
+
+    @staticmethod
+    def _key(model_name: str, unit: CodeChunk) -> str:
+        # 区域不携带语言信息：只把双引号视为字符串定界符 (对两种语言都安全)
+        return ResultCache.make_key("region", model_name, sha256_text(normalize_code(unit.code, "")[0]))
+
+    def store(self, model_name: str, units: List[CodeChunk], report: AuditReport) -> None:
+        for unit in units:
+            self._regions[self._key(model_name, unit)] = [
+                vul.model_copy(update={"line": vul.line - unit.start_line + 1}).model_dump()
+                for vul in report.vulnerabilities
+                if unit.contains(vul.line)
+            ]
+        if self.persistent is not None:
+            self.persistent.store(model_name, units, report)
+
+    def lookup(self, model_name: str, unit: CodeChunk) -> Optional[List[Vulnerability]]:
+        cached = self._regions.get(self._key(model_name, unit))
+        if cached is None:
+            return self.persistent.lookup(model_name, unit) if self.persistent is not None else None
+        # 只差注释 / 空行时区域长度可能变化，行号不超出区域末尾
+        return [
+            Vulnerability(**{**item, "line": min(unit.start_line + item["line"] - 1, unit.end_line)})
+            for item in cached
+        ]
+
+
+class ContractWatcher:
+    """
+    targets: 监听的文件 / 目录 / glob；runner: 每轮复用的批量编排器 (只修改其 changed_ranges)
+    interval: 轮询间隔 (秒)；debounce: 最后一次保存后等待多久才开始审计 (秒)
+    on_result: 每个文件审计完成时的回调 (轮次编号, 结果)
+    """
+
+    def __init__(
+        self,
+        targets: Sequence[str],
+        runner: BatchAuditRunner,
+        interval: float = 0.5,
+        debounce: float = 1.0,
+        on_result: Optional[Callable[[int, BatchResult], None]] = None,
+    ):
+        self.targets = list(targets)
+        self.runner = runner
+        self.interval = interval
+        self.debounce = debounce
+        self.on_result = on_result
+        self.rounds = 0
+        # 上一次审计时的文件标识与源码 (计算区域变更的基线)
+        self.stamps: Dict[str, FileStamp] = {}
+        self.sources: Dict[str, str] = {}
+
+    async def run(self) -> None:
+        """先完整审计一遍作为基线，然后持续监听，直到被取消 (Ctrl-C)"""
+        self.stamps = scan_files(self.targets)
+        if not self.stamps:
+            raise FileNotFoundError(f"❌ 错误: 在 {self.targets} 中没有找到可审计的合约文件")
+        print(f"👀 [Watch] 监听 {len(self.stamps)} 个文件，先完整审计一遍作为基线...")
+        for file_path in self.stamps:
+            self._remember(file_path)
+        await self._audit(list(self.stamps), None)
+        while True:
+            print(f"👀 [Watch] 等待文件保存 (Ctrl-C 退出)...", flush=True)
+            changed, removed = await self.wait_for_changes()
+            for file_path in removed:
+                self.sources.pop(file_path, None)
+                print(f"🗑️  [Watch] {file_path} 已删除")
+            changed_ranges = self.plan_round(changed)
+            if changed_ranges:
+                await self._audit(list(changed_ranges), changed_ranges)
+
+    async def wait_for_changes(self) -> Tuple[List[str], List[str]]:
+        """阻塞到有文件变化，并在连续保存停止 debounce 秒后返回 (新增或修改的文件, 删除的文件)"""
+        while True:
+            await asyncio.sleep(self.interval)
+            current = scan_files(self.targets)
+            if current != self.stamps:
+                break
+        # 去抖：快照在 debounce 秒内保持不变才认为保存结束
+        settled_at = time.monotonic()
+        while time.monotonic() - settled_at < self.debounce:
+            await asyncio.sleep(min(self.interval, self.debounce))
+            latest = scan_files(self.targets)
+            if latest != current:
+                current, settled_at = latest, time.monotonic()
+        changed = [path for path, stamp in current.items() if self.stamps.get(path) != stamp]
+        removed = [path for path in self.stamps if path not in current]
+        self.stamps = current
+        return changed, removed
+
+    def plan_round(self, changed: List[str]) -> Dict[str, Optional[List[LineRange]]]:
+        """对比上一次审计时的源码，返回 文件 -> 需要重新审计的行区间 (None 表示新文件，整体审计)"""
+        changed_ranges: Dict[str, Optional[List[LineRange]]] = {}
+        for file_path in changed:
+            project_type = self.runner.project_type_override or detect_file_project_type(file_path)
+            if project_type not in self.runner.analyzers:
+                print(f"⚠️ [Watch] {file_path}: 启动时没有 {project_type} 类型的文件，未加载对应分析器，请重启监听")
+                continue
+            previous = self.sources.get(file_path)
+            code = self._remember(file_path)
+            if code is None:
+                continue
+            if previous is None:
+                print(f"🆕 [Watch] {file_path}: 新文件")
+                changed_ranges[file_path] = None
+                continue
+            ranges = changed_regions(previous, code, detect_language(file_path, code))
+            if ranges:
+                print(f"✏️  [Watch] {file_path}: {len(ranges)} 个函数区域有变更")
+                changed_ranges[file_path] = ranges
+            elif previous != code:
+                print(f"💤 [Watch] {file_path}: 只有注释 / 空白变化，跳过")
+        return changed_ranges
+
+    def _remember(self, file_path: str) -> Optional[str]:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                code = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            # 编辑器写到一半 / 文件刚被删除 / 编码错误：保留文件标识，内容不变不会再次触发，等下一次保存
+            print(f"⚠️ [Watch] 无法读取 {file_path}: {e}")
+            return None
+        self.sources[file_path] = code
+        return code
+
+    async def _audit(self, files: List[str], changed_ranges: Optional[Dict[str, Optional[List[LineRange]]]]) -> None:
+        self.rounds += 1
+        self.runner.changed_ranges = changed_ranges
+        started = time.perf_counter()
+        failures = 0
+        async for result in self.runner.run(files):
+            if not result.ok:
+                # 失败文件没有可复用的区域结论：下次保存时整体重新审计
+                failures += 1
+                self.sources.pop(result.file_path, None)
+            if self.on_result is not None:
+                self.on_result(self.rounds, result)
+        print(
+            f"⏱️  [Watch] 第 {self.rounds} 轮完成: {len(files)} 个文件"
+            + (f"，失败 {failures} 个" if failures else "")
+            + f"，耗时 {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,427 @@
+# core/workqueue.py
+"""
+多进程 / 多机分片审计：基于 SQLite 的本地工作队列。
+
+    coordinator (python main.py contracts/ --queue q.db)  →  jobs 表 (每个文件一行)
+    worker × N  (python main.py --worker --queue q.db)    →  租约领取 → 批量流水线 → 回写报告
+
+- 协调者把文件列表写入队列，可按需在本机启动若干 worker 进程，等待全部完成后汇总为一份报告；
+- worker 可以运行在共享同一文件系统的其他机器上，各自使用本机 .env 中的 LLM 凭据与并发配置；
+- worker 每次领取一小批文件并持有租约 (QUEUE_LEASE_SECONDS)，运行期间定期心跳续约；
+  worker 崩溃 / 失联后租约过期，文件回到队列由其他 worker 重新领取 (最多 QUEUE_MAX_ATTEMPTS 次)；
+  租约已被他人接手的 worker 回写结果时被忽略，不会覆盖新的结论；
+- 设置费用上限时，全部 worker 共享 meta 表中的一份额度账本 (QueueCostLedger)，
+  在同一个 BEGIN IMMEDIATE 事务中检查并占用额度，N 个 worker 合计不会超出上限；
+  崩溃 worker 占用的预估额度不会释放 (偏保守)；
+- 每个操作使用独立连接与 BEGIN IMMEDIATE 事务，不启用 WAL (WAL 依赖共享内存，不适用于网络文件系统)。
+"""
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from core.batch import BatchAuditRunner
+from core.budget import CostLedger
+from core.diff import LineRange
+from core.metrics import MetricsCollector
+from core.pipeline import BatchResult
+from core.pydantic_schema import AuditReport
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL UNIQUE,
+    project_type TEXT NOT NULL,
+    -- 增量模式下的变更行区间 (JSON)，NULL 表示整个文件
+    ranges TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    report TEXT,
+    metrics TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    model TEXT,
+    heartbeat REAL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 文件状态：排队中 / 已被 worker 领取 / 完成 / 多次失败后放弃
+STATUSES = ("pending", "leased", "done", "failed")
+
+
+@dataclass
+class QueueJob:
+    id: int
+    file_path: str
+    project_type: str
+    ranges: Optional[List[LineRange]]
+    attempts: int
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+
+
+class WorkQueue:
+    """
+    path: SQLite 数据库文件 (多台机器共享时放在共享文件系统上)
+    max_attempts: 单个文件最多被领取的次数 (审计失败或租约过期都计一次)
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, busy_timeout: float = 30.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.busy_timeout = busy_timeout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # executescript 自行提交，不放在 BEGIN IMMEDIATE 事务内
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # --- 协调者 ---
+
+    def enqueue(
+        self,
+        files: Sequence[Tuple[str, str]],
+        changed_ranges: Optional[Dict[str, Optional[List[LineRange]]]] = None,
+        project_type_override: Optional[str] = None,
+        resume: bool = False,
+        max_cost: Optional[float] = None,
+    ) -> int:
+        """
+        写入 (文件, 项目类型) 列表，返回需要审计的文件数。
+        resume=False 时清空旧队列与已用额度；resume=True 时保留已完成的文件 (及其费用)，失败的文件重新排队。
+        max_cost: 全部 worker 共享的费用上限 (美元)，None 表示不限制
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if not resume:
+                conn.execute("DELETE FROM jobs")
+                conn.execute("DELETE FROM workers")
+                conn.execute("DELETE FROM meta WHERE key = 'committed_cost'")
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'pending', attempts = 0, error = NULL, updated_at = ? "
+                    "WHERE status = 'failed'", (now,)
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('config', ?)",
+                (json.dumps({
+                    "incremental": changed_ranges is not None, "type": project_type_override, "max_cost": max_cost,
+                }),),
+            )
+            for file_path, project_type in files:
+                ranges = changed_ranges.get(file_path) if changed_ranges is not None else None
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (file_path, project_type, ranges, updated_at) VALUES (?, ?, ?, ?)",
+                    (os.path.abspath(file_path), project_type, json.dumps(ranges), now),
+                )
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status != 'done'").fetchone()[0]
+
+    def config(self) -> Dict[str, Any]:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        return json.loads(row[0]) if row else {"incremental": False, "type": None, "max_cost": None}
+
+    def project_types(self) -> List[str]:
+        with self._transaction() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT project_type FROM jobs ORDER BY project_type")]
+
+    def counts(self) -> Dict[str, int]:
+        with self._transaction() as conn:
+            self._reap(conn)
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def outstanding(self) -> int:
+        """尚未结束 (排队中或已被领取) 的文件数"""
+        counts = self.counts()
+        return counts["pending"] + counts["leased"]
+
+    def workers(self, within: Optional[float] = None) -> List[Dict[str, Any]]:
+        """已注册的 worker 及其完成数；传入 within 时只返回 within 秒内有心跳的"""
+        since = time.time() - within if within is not None else 0
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT worker, host, pid, model, heartbeat, done, failed FROM workers WHERE heartbeat >= ? "
+                "ORDER BY worker", (since,),
+            ).fetchall()
+        keys = ("worker", "host", "pid", "model", "heartbeat", "done", "failed")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def results(self) -> List[Dict[str, Any]]:
+        """已结束的文件：file_path / project_type / status / report / metrics / error / worker"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT file_path, project_type, status, report, metrics, error, worker FROM jobs "
+                "WHERE status IN ('done', 'failed') ORDER BY id"
+            ).fetchall()
+        return [
+            {
+                "file_path": file_path, "project_type": project_type, "status": status,
+                "report": json.loads(report) if report else None,
+                "metrics": json.loads(metrics) if metrics else None,
+                "error": error, "worker": worker,
+            }
+            for file_path, project_type, status, report, metrics, error, worker in rows
+        ]
+
+    def committed_cost(self) -> float:
+        with self._transaction() as conn:
+            return self._committed_cost(conn)
+
+    @staticmethod
+    def _committed_cost(conn: sqlite3.Connection) -> float:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'committed_cost'").fetchone()
+        return float(row[0]) if row else 0.0
+
+    def reserve_cost(self, max_cost: float, cost: float) -> Optional[float]:
+        """在共享额度中占用 cost；额度不足时不占用并返回剩余额度"""
+        with self._transaction() as conn:
+            committed = self._committed_cost(conn)
+            if cost > max_cost - committed:
+                return max_cost - committed
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('committed_cost', ?)", (str(committed + cost),)
+            )
+        return None
+
+    def settle_cost(self, reserved: float, actual: float) -> None:
+        with self._transaction() as conn:
+            committed = self._committed_cost(conn) + actual - reserved
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('committed_cost', ?)", (str(committed),))
+
+    # --- worker ---
+
+    def register(self, worker: str, model: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker, host, pid, model, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (worker, socket.gethostname(), os.getpid(), model, time.time()),
+            )
+
+    def _reap(self, conn: sqlite3.Connection) -> None:
+        """租约过期且已用完领取次数的文件记为失败 (worker 多次在处理该文件时崩溃)"""
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (f"租约过期 {self.max_attempts} 次 (worker 崩溃或失联)", time.time(), time.time(), self.max_attempts),
+        )
+
+    def lease(self, worker: str, limit: int, lease_seconds: float) -> List[QueueJob]:
+        """领取至多 limit 个排队中 (或租约已过期) 的文件"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._reap(conn)
+            rows = conn.execute(
+                "SELECT id, file_path, project_type, ranges, attempts FROM jobs "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE id = ?",
+                    (worker, now + lease_seconds, now, row[0]),
+                )
+            conn.execute("UPDATE workers SET heartbeat = ? WHERE worker = ?", (now, worker))
+        return [
+            QueueJob(job_id, file_path, project_type, json.loads(ranges) if ranges else None, attempts + 1)
+            for job_id, file_path, project_type, ranges, attempts in rows
+        ]
+
+    def heartbeat(self, worker: str, job_ids: Sequence[int], lease_seconds: float) -> int:
+        """为仍由本 worker 持有的文件续约，返回续约成功的数量"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE workers SET heartbeat = ? WHERE worker = ?", (now, worker))
+            if not job_ids:
+                return 0
+            placeholders = ",".join("?" * len(job_ids))
+            return conn.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE worker = ? AND status = 'leased' AND id IN ({placeholders})",
+                (now + lease_seconds, worker, *job_ids),
+            ).rowcount
+
+    def complete(self, worker: str, job: QueueJob, report: AuditReport, metrics: Optional[Dict[str, Any]]) -> bool:
+        """回写审计报告；租约已被其他 worker 接手时返回 False (结果丢弃)"""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'done', report = ?, metrics = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (report.model_dump_json(), json.dumps(metrics or {}), time.time(), job.id, worker),
+            ).rowcount
+            conn.execute("UPDATE workers SET done = done + ? WHERE worker = ?", (updated, worker))
+        return updated == 1
+
+    def fail(self, worker: str, job: QueueJob, error: str, metrics: Optional[Dict[str, Any]] = None) -> bool:
+        """记录失败：还有领取次数时重新排队 (可能由其他 worker 重试)，否则记为失败"""
+        status = "failed" if job.attempts >= self.max_attempts else "pending"
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, metrics = ?, worker = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (status, error, json.dumps(metrics or {}), time.time(), job.id, worker),
+            ).rowcount
+            conn.execute(
+                "UPDATE workers SET failed = failed + ? WHERE worker = ?", (updated if status == "failed" else 0, worker)
+            )
+        return updated == 1
+
+
+class QueueCostLedger(CostLedger):
+    """保存在工作队列数据库中的额度账本：多个 worker 进程 (可能在不同机器上) 共享同一费用上限"""
+
+    def __init__(self, queue: WorkQueue, max_cost: float):
+        # 已用额度只保存在数据库中，不使用基类的进程内计数
+        self.queue = queue
+        self.max_cost = max_cost
+
+    @property
+    def committed(self) -> float:
+        return self.queue.committed_cost()
+
+    def reserve(self, cost: float) -> Optional[float]:
+        return self.queue.reserve_cost(self.max_cost, cost)
+
+    def settle(self, reserved: float, actual: float) -> None:
+        self.queue.settle_cost(reserved, actual)
+
+
+class QueueWorker:
+    """
+    从队列领取文件并交给批量流水线审计，直到队列中没有未结束的文件。
+    batch_size: 每次领取的文件数 (一批内共享静态分析、跨文件去重与 LLM 并发)
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        runner: BatchAuditRunner,
+        worker_id: Optional[str] = None,
+        batch_size: int = 4,
+        lease_seconds: float = 120.0,
+        poll_interval: float = 2.0,
+    ):
+        self.queue = queue
+        self.runner = runner
+        self.worker_id = worker_id or default_worker_id()
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.done = 0
+        self.failed = 0
+        # 本 worker 处理过的文件指标 (--worker --metrics-out 时导出)
+        self.collector = MetricsCollector()
+
+    async def run(self, model: str = "") -> None:
+        config = self.queue.config()
+        self.runner.project_type_override = config.get("type")
+        self.queue.register(self.worker_id, model)
+        print(f"🛠️  [Worker {self.worker_id}] 已连接队列 {self.queue.path}")
+        while True:
+            jobs = await asyncio.to_thread(self.queue.lease, self.worker_id, self.batch_size, self.lease_seconds)
+            if jobs:
+                await self._run_jobs(jobs, config.get("incremental", False))
+                continue
+            # 其他 worker 仍持有租约：等待其完成或租约过期后接手
+            if await asyncio.to_thread(self.queue.outstanding) == 0:
+                break
+            await asyncio.sleep(self.poll_interval)
+        print(f"🏁 [Worker {self.worker_id}] 队列已清空: 完成 {self.done} 个文件，失败 {self.failed} 个")
+
+    async def _run_jobs(self, jobs: List[QueueJob], incremental: bool) -> None:
+        by_path = {job.file_path: job for job in jobs}
+        self.runner.changed_ranges = {job.file_path: job.ranges for job in jobs} if incremental else None
+        heartbeat = asyncio.create_task(self._heartbeat([job.id for job in jobs]))
+        try:
+            async for result in self.runner.run(list(by_path)):
+                # SQLite 写入可能等待其他进程的锁，不阻塞事件循环
+                await asyncio.to_thread(self._record, by_path[result.file_path], result)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+    def _record(self, job: QueueJob, result: BatchResult) -> None:
+        metrics = result.metrics.to_dict() if result.metrics else None
+        if result.metrics:
+            self.collector.add(result.metrics)
+        if result.ok:
+            kept = self.queue.complete(self.worker_id, job, result.report, metrics)
+            self.done += 1 if kept else 0
+            status = "✅" if kept else "⚠️ 租约已被接手，结果丢弃"
+        else:
+            kept = self.queue.fail(self.worker_id, job, result.error, metrics)
+            self.failed += 1 if kept and job.attempts >= self.queue.max_attempts else 0
+            status = f"❌ {result.error}" + (" (将重试)" if job.attempts < self.queue.max_attempts else "")
+        print(f"   [Worker {self.worker_id}] {job.file_path}: {status}", flush=True)
+
+    async def _heartbeat(self, job_ids: List[int]) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            renewed = await asyncio.to_thread(self.queue.heartbeat, self.worker_id, job_ids, self.lease_seconds)
+            if renewed < len(job_ids):
+                print(f"⚠️ [Worker {self.worker_id}] {len(job_ids) - renewed} 个文件的租约已失效 (处理过慢?)")
+
+
+def aggregate_report(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把各 worker 回写的结果合并为一份报告：按文件列出漏洞，附失败文件与总计"""
+    files, failed = {}, {}
+    severities: Dict[str, int] = {}
+    for item in results:
+        if item["status"] == "done":
+            files[item["file_path"]] = item["report"]
+            for vul in item["report"]["vulnerabilities"]:
+                severities[vul["severity"]] = severities.get(vul["severity"], 0) + 1
+        else:
+            failed[item["file_path"]] = item["error"]
+    return {
+        "summary": {
+            "files": len(results),
+            "audited": len(files),
+            "failed": len(failed),
+            "vulnerabilities": sum(severities.values()),
+            "by_severity": severities,
+        },
+        "files": files,
+        "failed": failed,
+    }
@@ -1,6 +1,17 @@
 # llm_services/abstract_service.py
+import asyncio
+import json
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+
+class LLMOutputError(RuntimeError):
+    """模型已返回内容但无法解析为 JSON；raw_output 保留原文，供调用方发起修复请求而不是整体重跑"""
+
+    def __init__(self, message: str, raw_output: str):
+        super().__init__(message)
+        self.raw_output = raw_output
+
 
 class AbstractLLMService(ABC):
     """LLM 服务抽象基类，定义了所有服务必须实现的方法"""
@@ -11,4 +22,49 @@ class AbstractLLMService(ABC):
         根据输入 Prompt 生成响应。
         返回结果必须是经过解析的 Python 字典。
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        """
+        generate_response 的异步版本。
+        默认放到线程中执行同步实现；支持原生异步客户端的服务应覆写此方法。
+        """
+        return await asyncio.to_thread(self.generate_response, system_prompt, user_prompt, **kwargs)
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        流式生成，逐段产出模型输出的原始文本 (拼接后即完整的 JSON 字符串)。
+        默认退化为一次性返回完整结果；支持流式接口的服务应覆写此方法。
+        """
+        result = await self.agenerate_response(system_prompt, user_prompt, **kwargs)
+        yield json.dumps(result, ensure_ascii=False)
+
+    @staticmethod
+    async def peek_stream(stream: AsyncIterator[Any]) -> Tuple[AsyncIterator[Any], Optional[Any]]:
+        """
+        取出流的首个片段。放在重试范围内调用：连接、限流等错误会在输出任何内容之前暴露并重试，
+        一旦开始向调用方产出片段就不再重试。
+        """
+        iterator = stream.__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return iterator, first
+
+    @staticmethod
+    def parse_json_output(llm_output_str: str) -> Dict[str, Any]:
+        """
+        解析模型输出的 JSON，兼容被 Markdown 代码块 (```json ... ```) 包裹的情况。
+        解析失败时抛出 LLMOutputError (携带原文)。
+        """
+        raw_output = llm_output_str
+        llm_output_str = llm_output_str.strip()
+        if llm_output_str.startswith("```json"):
+            llm_output_str = llm_output_str.strip("```json").strip("```").strip()
+        elif llm_output_str.startswith("```"):
+            llm_output_str = llm_output_str.strip("```").strip()
+        try:
+            return json.loads(llm_output_str)
+        except json.JSONDecodeError as e:
+            raise LLMOutputError(f"模型输出不是合法 JSON: {e}", raw_output) from e
@@ -1,55 +1,110 @@
 # llm_services/gemini_service.py
-import json
 from google import genai
 from google.genai import types
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, Optional
 
-from llm_services.abstract_service import AbstractLLMService
-from config.settings import llm_settings, project_settings 
+from llm_services.abstract_service import AbstractLLMService, LLMOutputError
+from llm_services.rate_limit import CallPolicy, estimate_tokens
+from llm_services.usage import record_gemini_usage
+from config.settings import llm_settings, project_settings
 
 class GeminiService(AbstractLLMService):
-    
-    def __init__(self):
-        # 初始化客户端
-        self.client = genai.Client(api_key=project_settings.GEMINI_API_KEY)
-        self.model_name = llm_settings.MODEL_NAME  
+
+    def __init__(self, model_name: Optional[str] = None):
+        # 初始化客户端 (client.aio 复用同一客户端内部的异步 HTTP 连接池)
+        http_options = types.HttpOptions(base_url=llm_settings.BASE_URL) if llm_settings.BASE_URL else None
+        self.client = genai.Client(api_key=project_settings.GEMINI_API_KEY, http_options=http_options)
+        self.model_name = model_name or llm_settings.MODEL_NAME
         self.temperature = llm_settings.TEMPERATURE
+        self.call_policy = CallPolicy.from_settings(llm_settings)
 
-    def generate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
-        
+    def _build_config(self, system_prompt: str) -> types.GenerateContentConfig:
         # 1. 动态构建 Config，将 system_instruction 放入其中
         # 這是解决 'unexpected keyword argument' 错误的关键
-        config = types.GenerateContentConfig(
+        return types.GenerateContentConfig(
             temperature=self.temperature,
             response_mime_type="application/json", # 强制 JSON
             system_instruction=system_prompt       # <--- 移动到这里！
+            # system_instruction 位于请求最前：各次调用前缀一致时 Gemini 2.5 的隐式缓存自动生效，
+            # 命中的 Token 数见 usage_metadata.cached_content_token_count
         )
-        
+
+    def generate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+
+        config = self._build_config(system_prompt)
+
         # 2. 简化的 contents 构造
         # 直接传入字符串列表，SDK 会自动处理，避免 Part.from_text 的错误
         contents = [user_prompt]
-        
+
         try:
             # 3. 调用 API
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=contents,
-                config=config 
+                config=config
             )
-            
+
             # 解析响应
-            llm_output_str = response.text.strip()
-            
             # 处理可能的 Markdown 代码块包裹 (```json ... ```)
             # 有些模型虽然指定了 JSON 模式，仍可能加上 Markdown 标记
-            if llm_output_str.startswith("```json"):
-                llm_output_str = llm_output_str.strip("```json").strip("```").strip()
-            elif llm_output_str.startswith("```"):
-                llm_output_str = llm_output_str.strip("```").strip()
-
-            return json.loads(llm_output_str)
+            record_gemini_usage(self.model_name, getattr(response, "usage_metadata", None))
+            return self.parse_json_output(response.text)
 
+        except LLMOutputError:
+            # 输出不是合法 JSON：原样抛出，由上层发起修复请求
+            raise
         except Exception as e:
             # 增加打印原始响应以便调试
             print(f"DEBUG: Gemini API 调用出错。")
-            raise RuntimeError(f"Gemini API 调用失败或解析错误: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Gemini API 调用失败或解析错误: {e}")
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        config = self._build_config(system_prompt)
+
+        async def _call():
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=[user_prompt],
+                config=config
+            )
+            usage = getattr(response, "usage_metadata", None)
+            return response, getattr(usage, "total_token_count", None)
+
+        try:
+            response = await self.call_policy.run(
+                "Gemini", estimate_tokens(system_prompt, user_prompt), _call
+            )
+            record_gemini_usage(self.model_name, getattr(response, "usage_metadata", None))
+            return self.parse_json_output(response.text)
+        except LLMOutputError:
+            # 输出不是合法 JSON：原样抛出，由上层发起修复请求
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Gemini API 调用失败或解析错误: {e}")
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        config = self._build_config(system_prompt)
+
+        async def _open():
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=[user_prompt],
+                config=config
+            )
+            return await self.peek_stream(stream), None
+
+        try:
+            stream, first = await self.call_policy.run(
+                "Gemini", estimate_tokens(system_prompt, user_prompt), _open
+            )
+            chunk, usage = first, None
+            while chunk is not None:
+                if chunk.text:
+                    yield chunk.text
+                # 每个片段的 usage_metadata 都是累计值，只记录最后一个
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                chunk = await anext(stream, None)
+            record_gemini_usage(self.model_name, usage)
+        except Exception as e:
+            raise RuntimeError(f"Gemini API 流式调用失败: {e}")
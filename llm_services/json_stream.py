@@ -0,0 +1,89 @@
+# llm_services/json_stream.py
+"""
+流式响应的增量 JSON 解析。
+
+模型按 AuditReport 的结构逐字输出 {"analysis_summary": ..., "vulnerabilities": [{...}, {...}]}。
+IncrementalArrayParser 边接收文本边跟踪括号 / 字符串状态，顶层对象中指定数组的某个元素
+一闭合就把它的原始文本交给调用方，不必等整份响应生成完毕。
+"""
+from typing import List, Optional
+
+
+class IncrementalArrayParser:
+    """
+    增量提取顶层 JSON 对象中 array_key 数组的元素。
+    feed() 返回本次新闭合的元素原文 (尚未 json.loads)；text 为目前为止收到的全部文本，
+    结束后交给 parse_json_output 做完整解析。代码块围栏等 JSON 之外的字符会被忽略。
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self._buffer = ""
+        self._pos = 0
+        # 括号栈 ("{" / "[")、字符串状态与顶层对象中的最近一个 key
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._last_key: Optional[str] = None
+        # 目标数组所在的栈深度，以及当前元素的起始位置
+        self._array_depth: Optional[int] = None
+        self._element_start: Optional[int] = None
+        self._done = False
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        elements: List[str] = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            i = self._pos
+            self._pos += 1
+            if self._done:
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._expect_key:
+                        self._last_key = buffer[self._string_start:i]
+                        self._expect_key = False
+                continue
+
+            if ch == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = i + 1
+            elif ch in "{[":
+                if ch == "{" and self._array_depth is not None and len(self._stack) == self._array_depth:
+                    self._element_start = i
+                self._stack.append(ch)
+                if len(self._stack) == 1:
+                    self._expect_key = ch == "{"
+                elif (ch == "[" and len(self._stack) == 2 and self._stack[0] == "{"
+                      and self._last_key == self.array_key):
+                    self._array_depth = 2
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if (ch == "}" and self._element_start is not None
+                        and self._array_depth is not None and len(self._stack) == self._array_depth):
+                    elements.append(buffer[self._element_start:i + 1])
+                    self._element_start = None
+                elif ch == "]" and self._array_depth is not None and len(self._stack) == self._array_depth - 1:
+                    self._array_depth = None
+                if not self._stack:
+                    self._done = True
+            elif ch == "," and len(self._stack) == 1:
+                self._expect_key = True
+        return elements
@@ -1,35 +1,116 @@
 # llm_services/openai_service.py
-import json
-from openai import OpenAI
-from typing import Dict, Any
+import asyncio
+import hashlib
+from openai import OpenAI, AsyncOpenAI
+from typing import Any, AsyncIterator, Dict, Optional
 
-from llm_services.abstract_service import AbstractLLMService
-from config.settings import llm_settings, project_settings 
+from llm_services.abstract_service import AbstractLLMService, LLMOutputError
+from llm_services.rate_limit import CallPolicy, estimate_tokens
+from llm_services.usage import record_openai_usage
+from config.settings import llm_settings, project_settings
 
 class OpenAIService(AbstractLLMService):
-    
-    def __init__(self):
-        self.client = OpenAI(api_key=project_settings.OPENAI_API_KEY)
-        self.model_name = llm_settings.MODEL_NAME
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.client = OpenAI(api_key=project_settings.OPENAI_API_KEY, base_url=llm_settings.BASE_URL or None)
+        # 级联 / 集成路由会为不同模型各建一个实例，未指定时使用 LLM_MODEL_NAME
+        self.model_name = model_name or llm_settings.MODEL_NAME
         self.temperature = llm_settings.TEMPERATURE
         self.timeout = llm_settings.TIMEOUT
+        # 异步路径：连接池化的客户端按事件循环懒加载，重试与限流由 CallPolicy 统一负责
+        self.call_policy = CallPolicy.from_settings(llm_settings)
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _build_request(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        request = dict(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=self.temperature,
+            timeout=self.timeout,
+            response_format={"type": "json_object"}
+        )
+        if llm_settings.PROMPT_CACHE:
+            # 相同 system prompt 前缀的请求路由到同一缓存分片，提高前缀缓存命中率
+            digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+            request["prompt_cache_key"] = f"certi-audit-{digest}"
+        return request
 
     def generate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
-        
+
         try:
             response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=self.temperature,
-                timeout=self.timeout,
-                response_format={"type": "json_object"} 
+                **self._build_request(system_prompt, user_prompt)
             )
-            
+
+            record_openai_usage(self.model_name, getattr(response, "usage", None))
             llm_output_str = response.choices[0].message.content.strip()
-            return json.loads(llm_output_str)
+            return self.parse_json_output(llm_output_str)
+
+        except LLMOutputError:
+            # 输出不是合法 JSON：原样抛出，由上层发起修复请求
+            raise
+        except Exception as e:
+            raise RuntimeError(f"OpenAI API 调用失败或解析错误: {e}")
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """同一事件循环内复用一个 AsyncOpenAI (内部持有 HTTP 连接池)"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            # 关闭 SDK 自带重试，避免与 CallPolicy 的退避叠加
+            self._async_client = AsyncOpenAI(
+                api_key=project_settings.OPENAI_API_KEY,
+                max_retries=0,
+                base_url=llm_settings.BASE_URL or None,
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        client = self._get_async_client()
+        request = self._build_request(system_prompt, user_prompt)
 
+        async def _call():
+            response = await client.chat.completions.create(**request)
+            usage = getattr(response, "usage", None)
+            return response, getattr(usage, "total_tokens", None)
+
+        try:
+            response = await self.call_policy.run(
+                "OpenAI", estimate_tokens(system_prompt, user_prompt), _call
+            )
+            record_openai_usage(self.model_name, getattr(response, "usage", None))
+            return self.parse_json_output(response.choices[0].message.content)
+        except LLMOutputError:
+            # 输出不是合法 JSON：原样抛出，由上层发起修复请求
+            raise
+        except Exception as e:
+            raise RuntimeError(f"OpenAI API 调用失败或解析错误: {e}")
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        client = self._get_async_client()
+        # include_usage：流的最后一个片段携带 usage (含缓存命中的 Token 数)
+        request = dict(
+            self._build_request(system_prompt, user_prompt), stream=True, stream_options={"include_usage": True}
+        )
+
+        async def _open():
+            stream = await client.chat.completions.create(**request)
+            return await self.peek_stream(stream), None
+
+        try:
+            stream, first = await self.call_policy.run(
+                "OpenAI", estimate_tokens(system_prompt, user_prompt), _open
+            )
+            chunk = first
+            while chunk is not None:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None) is not None:
+                    record_openai_usage(self.model_name, chunk.usage)
+                chunk = await anext(stream, None)
         except Exception as e:
-            raise RuntimeError(f"OpenAI API 调用失败或解析错误: {e}")
\ No newline at end of file
+            raise RuntimeError(f"OpenAI API 流式调用失败: {e}")
@@ -0,0 +1,60 @@
+# llm_services/pricing.py
+"""
+模型价格表 (美元 / 百万 Token)，用于按实际用量估算费用。
+按模型名前缀匹配 (取最长的匹配项)，未收录的模型不估算费用。价格会随服务商调整，以官方价目为准。
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    input: float
+    cached_input: float
+    output: float
+
+
+MODEL_PRICES: Dict[str, ModelPrice] = {
+    "gpt-4o": ModelPrice(2.50, 1.25, 10.00),
+    "gpt-4o-mini": ModelPrice(0.15, 0.075, 0.60),
+    "gpt-4.1": ModelPrice(2.00, 0.50, 8.00),
+    "gpt-4.1-mini": ModelPrice(0.40, 0.10, 1.60),
+    "gpt-4.1-nano": ModelPrice(0.10, 0.025, 0.40),
+    "gemini-2.0-flash": ModelPrice(0.10, 0.025, 0.40),
+    "gemini-2.5-flash": ModelPrice(0.30, 0.075, 2.50),
+    "gemini-2.5-pro": ModelPrice(1.25, 0.31, 10.00),
+}
+
+
+def get_model_price(model: str) -> Optional[ModelPrice]:
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> Optional[float]:
+    """按输入 (未命中缓存部分按全价) / 缓存命中 / 输出 Token 估算费用，未知模型返回 None"""
+    price = get_model_price(model)
+    if price is None:
+        return None
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * price.input + cached_tokens * price.cached_input + completion_tokens * price.output) / 1_000_000
+
+
+def split_model_names(model: str) -> List[str]:
+    """拆开级联 ("fast>strong") / 集成 ("a+b") 服务的组合模型名"""
+    return [name for name in re.split(r"[>+]", model) if name] or [model]
+
+
+def estimate_worst_case_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    发送前的保守估算：不计服务端缓存折扣；级联 / 集成按每个成员模型都调用一次计。
+    任一成员模型未收录时返回 None。
+    """
+    total = 0.0
+    for name in split_model_names(model):
+        cost = estimate_cost(name, prompt_tokens, 0, completion_tokens)
+        if cost is None:
+            return None
+        total += cost
+    return total
@@ -0,0 +1,210 @@
+# llm_services/rate_limit.py
+"""
+异步 LLM 调用的流控工具：
+- RateLimiter: 基于 60 秒滑动窗口的 RPM / TPM 预算 + 在途请求上限
+- retry_with_backoff: 针对 429 / 5xx / 网络错误的抖动指数退避重试
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Tuple, TypeVar
+
+from llm_services.usage import usage_tracker
+
+T = TypeVar("T")
+
+# 粗略估算：平均 4 个字符约等于 1 个 Token (仅用于 TPM 预算占位)
+CHARS_PER_TOKEN = 4
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(t) for t in texts) // CHARS_PER_TOKEN + 1
+
+
+class _Reservation:
+    """一次请求在滑动窗口中的占位，响应返回后可用真实 Token 数修正"""
+    __slots__ = ("timestamp", "tokens")
+
+    def __init__(self, timestamp: float, tokens: int):
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+
+class RateLimiter:
+    """
+    RPM / TPM 预算控制。0 表示不限制。
+    所有并发请求共享同一个实例，因此批量运行可以贴近配额而不触发限流。
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, max_concurrency: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self._window: Deque[_Reservation] = deque()
+        self._lock: Optional[asyncio.Lock] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        # asyncio 原语与事件循环绑定，跨 asyncio.run 调用时需要重建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0].timestamp >= self.WINDOW_SECONDS:
+            self._window.popleft()
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        """当前窗口放不下这次请求时，返回需要等待的秒数"""
+        waits: List[float] = []
+        if self.requests_per_minute > 0 and len(self._window) >= self.requests_per_minute:
+            oldest = self._window[len(self._window) - self.requests_per_minute]
+            waits.append(oldest.timestamp + self.WINDOW_SECONDS - now)
+        if self.tokens_per_minute > 0:
+            used = sum(r.tokens for r in self._window)
+            # 单次请求超过整个 TPM 预算时，只要窗口清空就放行，避免永久阻塞
+            if used > 0 and used + tokens > self.tokens_per_minute:
+                freed = 0
+                for r in self._window:
+                    freed += r.tokens
+                    if used - freed + tokens <= self.tokens_per_minute or freed == used:
+                        waits.append(r.timestamp + self.WINDOW_SECONDS - now)
+                        break
+        return max(waits, default=0.0)
+
+    async def acquire(self, estimated_tokens: int) -> _Reservation:
+        self._bind_loop()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._wait_time(now, estimated_tokens)
+                if wait <= 0:
+                    reservation = _Reservation(now, estimated_tokens)
+                    self._window.append(reservation)
+                    return reservation
+                await asyncio.sleep(wait)
+
+    async def run(self, estimated_tokens: int, call: Callable[[], Awaitable[Tuple[T, Optional[int]]]]) -> T:
+        """
+        在预算与并发限制内执行一次调用。
+        call 返回 (结果, 真实 Token 用量)，用量用于修正窗口中的预估占位。
+        """
+        reservation = await self.acquire(estimated_tokens)
+        if self._semaphore is None:
+            result, actual_tokens = await call()
+        else:
+            async with self._semaphore:
+                result, actual_tokens = await call()
+        if actual_tokens:
+            reservation.tokens = actual_tokens
+        return result
+
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """兼容 OpenAI (status_code) 与 google-genai (code) 的 HTTP 状态码提取"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    # 没有状态码：连接失败 / 超时等网络层错误
+    name = type(error).__name__
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or \
+        "Timeout" in name or "Connection" in name or "Transport" in name
+
+
+async def retry_with_backoff(
+    call: Callable[[], Awaitable[T]],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float,
+    on_retry: Optional[Callable[[int, BaseException, float], Any]] = None,
+) -> T:
+    """
+    执行 call，遇到可重试错误时按 "full jitter" 指数退避重试。
+    服务端返回 Retry-After 时以其为下限。
+    """
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, max_delay))
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay)
+
+
+class CallPolicy:
+    """组合 RateLimiter 与重试策略，供各 LLM 服务的异步路径复用"""
+
+    def __init__(self, limiter: RateLimiter, max_retries: int, base_delay: float, max_delay: float):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "CallPolicy":
+        return cls(
+            limiter=RateLimiter(
+                requests_per_minute=settings.REQUESTS_PER_MINUTE,
+                tokens_per_minute=settings.TOKENS_PER_MINUTE,
+                max_concurrency=settings.MAX_CONCURRENCY,
+            ),
+            max_retries=settings.MAX_RETRIES,
+            base_delay=settings.RETRY_BASE_DELAY,
+            max_delay=settings.RETRY_MAX_DELAY,
+        )
+
+    def _on_retry(self, label: str):
+        def _log(attempt: int, error: BaseException, delay: float):
+            self.retries += 1
+            usage_tracker.record_retry()
+            status = get_status_code(error)
+            reason = f"HTTP {status}" if status is not None else type(error).__name__
+            print(f"⏳ [{label}] {reason}，{delay:.1f}s 后第 {attempt}/{self.max_retries} 次重试...")
+        return _log
+
+    async def run(self, label: str, estimated_tokens: int, call: Callable[[], Awaitable[Tuple[T, Optional[int]]]]) -> T:
+        return await retry_with_backoff(
+            lambda: self.limiter.run(estimated_tokens, call),
+            max_retries=self.max_retries,
+            base_delay=self.base_delay,
+            max_delay=self.max_delay,
+            on_retry=self._on_retry(label),
+        )
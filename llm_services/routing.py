@@ -0,0 +1,189 @@
+# llm_services/routing.py
+"""
+多模型路由 (实现同一个 AbstractLLMService 接口，对 AuditAnalyzer 透明)：
+
+- CascadeLLMService: 先用廉价 / 快速模型，只在需要时升级到强模型：
+  调用方传入 escalate=True (静态分析报告了高影响发现) 时直接使用强模型；
+  否则先调用快速模型，输出不是合法 JSON、或自评置信度 (报告的 confidence 字段) 低于阈值时再调用强模型。
+- EnsembleLLMService: 并行调用多个模型 (可跨 OpenAI / Gemini)，合并各自的漏洞列表并去重。
+  单个模型失败时使用其余模型的结果，全部失败才抛出。
+
+两者可以组合：集成作为级联的强模型一级。各级模型由工厂分别包上结果缓存，缓存键对应真实模型。
+"""
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from core.pydantic_schema import CONFIDENCE_ORDER, SEVERITY_ORDER, rank
+from llm_services.abstract_service import AbstractLLMService, LLMOutputError
+
+
+class CascadeLLMService(AbstractLLMService):
+    """
+    fast: 廉价模型；strong: 强模型 (或集成)；min_confidence: 快速模型自评置信度低于该值时升级。
+    未给出 confidence 的输出按低置信度处理，宁可多花一次调用也不漏报。
+    """
+
+    def __init__(self, fast: AbstractLLMService, strong: AbstractLLMService, min_confidence: str = "Medium"):
+        self.fast = fast
+        self.strong = strong
+        self.min_confidence = min_confidence
+        self.model_name = f"{fast.model_name}>{strong.model_name}"
+        self.temperature = getattr(strong, "temperature", None)
+
+    def confident(self, result: Any) -> bool:
+        # 缺失或未知的置信度视为最低
+        return isinstance(result, dict) and rank(result.get("confidence"), CONFIDENCE_ORDER, -1) >= rank(
+            self.min_confidence, CONFIDENCE_ORDER, -1
+        )
+
+    def _escalate(self, result: Any = None) -> None:
+        if result is None:
+            reason = "输出不是合法 JSON"
+        else:
+            reason = f"置信度不足 ({result.get('confidence') if isinstance(result, dict) else None})"
+        print(f"⤴️  [Cascade] {self.fast.model_name} {reason}，升级到 {self.strong.model_name}")
+
+    def generate_response(self, system_prompt: str, user_prompt: str, escalate: bool = False, **kwargs) -> Dict[str, Any]:
+        if not escalate:
+            try:
+                result = self.fast.generate_response(system_prompt, user_prompt, **kwargs)
+            except LLMOutputError:
+                self._escalate()
+            else:
+                if self.confident(result):
+                    return result
+                self._escalate(result)
+        return self.strong.generate_response(system_prompt, user_prompt, **kwargs)
+
+    async def agenerate_response(
+        self, system_prompt: str, user_prompt: str, escalate: bool = False, **kwargs
+    ) -> Dict[str, Any]:
+        if not escalate:
+            try:
+                result = await self.fast.agenerate_response(system_prompt, user_prompt, **kwargs)
+            except LLMOutputError:
+                self._escalate()
+            else:
+                if self.confident(result):
+                    return result
+                self._escalate(result)
+        return await self.strong.agenerate_response(system_prompt, user_prompt, **kwargs)
+
+    async def astream_response(
+        self, system_prompt: str, user_prompt: str, escalate: bool = False, **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        升级时直接流式转发强模型的输出；快速模型的输出要先看完置信度才能决定是否采用，
+        因此整段缓冲后一次产出 (避免先流出快速模型的漏洞、随后又被强模型的结果替换)。
+        """
+        if not escalate:
+            pieces = []
+            async for delta in self.fast.astream_response(system_prompt, user_prompt, **kwargs):
+                pieces.append(delta)
+            text = "".join(pieces)
+            try:
+                result = self.parse_json_output(text)
+            except LLMOutputError:
+                self._escalate()
+            else:
+                if self.confident(result):
+                    yield text
+                    return
+                self._escalate(result)
+        async for delta in self.strong.astream_response(system_prompt, user_prompt, **kwargs):
+            yield delta
+
+
+def _normalize_name(name: Any) -> str:
+    return re.sub(r"[\s_\-]+", "", str(name).lower())
+
+
+def _same_finding(a: Dict[str, Any], b: Dict[str, Any], line_tolerance: int) -> bool:
+    """同名 (忽略大小写 / 空白 / 连字符) 且行号相差不超过 line_tolerance 视为同一漏洞"""
+    if _normalize_name(a.get("name")) != _normalize_name(b.get("name")):
+        return False
+    line_a, line_b = a.get("line"), b.get("line")
+    if not isinstance(line_a, int) or not isinstance(line_b, int):
+        return line_a == line_b
+    return abs(line_a - line_b) <= line_tolerance
+
+
+def merge_outputs(outputs: Sequence[Tuple[str, Dict[str, Any]]], line_tolerance: int = 3) -> Dict[str, Any]:
+    """
+    合并多个模型的原始输出 (尚未校验)：摘要按模型拼接；漏洞去重，重复时保留严重度更高的一条；
+    置信度取各模型的最低值。非对象的漏洞条目直接丢弃，其余仍交由调用方做 Schema 校验。
+    """
+    summaries: List[str] = []
+    merged: List[Dict[str, Any]] = []
+    confidences: List[str] = []
+    for model, output in outputs:
+        summaries.append(f"[{model}] {output.get('analysis_summary', '')}")
+        if output.get("confidence") in CONFIDENCE_ORDER:
+            confidences.append(output["confidence"])
+        items = output.get("vulnerabilities")
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            for index, existing in enumerate(merged):
+                if _same_finding(existing, item, line_tolerance):
+                    if rank(item.get("severity"), SEVERITY_ORDER, -1) > rank(existing.get("severity"), SEVERITY_ORDER, -1):
+                        merged[index] = item
+                    break
+            else:
+                merged.append(item)
+    merged.sort(key=lambda item: item.get("line") if isinstance(item.get("line"), int) else 0)
+    result: Dict[str, Any] = {"analysis_summary": "\n".join(summaries), "vulnerabilities": merged}
+    if confidences:
+        result["confidence"] = min(confidences, key=CONFIDENCE_ORDER.index)
+    return result
+
+
+class EnsembleLLMService(AbstractLLMService):
+    """
+    members: 参与集成的模型服务；line_tolerance: 去重时允许的行号偏差。
+    流式接口沿用基类的默认实现 (各模型都返回后一次产出合并结果)。
+    """
+
+    def __init__(self, members: Sequence[AbstractLLMService], line_tolerance: int = 3):
+        if len(members) < 2:
+            raise ValueError("集成至少需要两个模型")
+        self.members = list(members)
+        self.line_tolerance = line_tolerance
+        self.model_name = "+".join(member.model_name for member in self.members)
+        self.temperature = getattr(self.members[0], "temperature", None)
+
+    def _combine(self, results: List[Any]) -> Dict[str, Any]:
+        outputs, errors = [], []
+        for member, result in zip(self.members, results):
+            if not isinstance(result, dict):
+                error = result if isinstance(result, BaseException) else RuntimeError(f"输出不是 JSON 对象: {result!r:.80}")
+                print(f"⚠️ [Ensemble] {member.model_name} 调用失败，使用其余模型的结果: {error}")
+                errors.append(error)
+            else:
+                outputs.append((member.model_name, result))
+        if not outputs:
+            raise errors[0]
+        return merge_outputs(outputs, self.line_tolerance)
+
+    def generate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        def _call(member: AbstractLLMService) -> Any:
+            try:
+                return member.generate_response(system_prompt, user_prompt, **kwargs)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=len(self.members)) as pool:
+            return self._combine(list(pool.map(_call, self.members)))
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        results = await asyncio.gather(
+            *[member.agenerate_response(system_prompt, user_prompt, **kwargs) for member in self.members],
+            return_exceptions=True,
+        )
+        # 取消不是单个模型的失败，必须向上传播
+        for result in results:
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+        return self._combine(list(results))
@@ -0,0 +1,59 @@
+# llm_services/tokens.py
+"""
+本地 Token 估算 (不调用服务端计数接口、不依赖 tiktoken)：
+按模型家族的分词特点，分别统计 ASCII 文本 / 代码与 CJK 字符并换算为 Token 数，
+用于发送前的 Prompt 预算与费用预估。误差通常在 ±15% 以内，预算本身应留有余量。
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict
+
+from llm_services.pricing import split_model_names
+
+
+@dataclass(frozen=True)
+class TokenProfile:
+    # 上下文窗口 (输入 + 输出 Token)
+    context_window: int
+    # 平均每个 Token 对应的 ASCII 字符数 (英文 / 代码) 与 CJK 字符数
+    chars_per_token: float
+    cjk_chars_per_token: float
+
+
+# 按模型名前缀匹配 (取最长的匹配项)
+MODEL_TOKEN_PROFILES: Dict[str, TokenProfile] = {
+    "gpt-4o": TokenProfile(128_000, 3.8, 1.1),
+    "gpt-4.1": TokenProfile(1_047_576, 3.8, 1.1),
+    "gpt-4-turbo": TokenProfile(128_000, 3.6, 0.8),
+    "gemini": TokenProfile(1_048_576, 4.0, 1.5),
+}
+
+# 未收录的模型：较小的窗口、偏保守的换算比例 (宁可高估)
+DEFAULT_TOKEN_PROFILE = TokenProfile(128_000, 3.4, 0.8)
+
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def get_token_profile(model: str) -> TokenProfile:
+    """
+    级联 / 集成服务的组合名 ("a>b" / "a+b") 取各成员中最小的窗口与最保守的换算比例，
+    保证同一份 Prompt 对每个成员模型都在预算之内。
+    """
+    profiles = []
+    for name in split_model_names(model):
+        matches = [prefix for prefix in MODEL_TOKEN_PROFILES if name.lower().startswith(prefix)]
+        profiles.append(MODEL_TOKEN_PROFILES[max(matches, key=len)] if matches else DEFAULT_TOKEN_PROFILE)
+    if len(profiles) == 1:
+        return profiles[0]
+    return TokenProfile(
+        min(p.context_window for p in profiles),
+        min(p.chars_per_token for p in profiles),
+        min(p.cjk_chars_per_token for p in profiles),
+    )
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    profile = get_token_profile(model)
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil((len(text) - cjk) / profile.chars_per_token + cjk / profile.cjk_chars_per_token)
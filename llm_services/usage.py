@@ -0,0 +1,129 @@
+# llm_services/usage.py
+"""
+Token 用量统计：按模型累计请求数、输入 / 缓存命中 / 输出 Token、重试次数与本地响应缓存命中数。
+各服务在拿到响应 (或流的最后一个片段) 的 usage 后调用 record()，运行结束时打印汇总，
+用于观察服务端 Prompt 缓存的命中情况。
+
+调用方可以用 usage_scope() 为当前上下文 (协程 / 线程) 额外挂一个 TokenUsage，
+同一时间段内的用量会同时计入该对象，批量模式借此把 Token 归属到具体文件。
+"""
+import contextlib
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+from llm_services.pricing import estimate_cost
+
+
+@dataclass
+class TokenUsage:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    # CallPolicy 的退避重试次数 / 命中本地 LLM 响应缓存的次数
+    retries: int = 0
+    cache_hits: int = 0
+    # 按 pricing 价格表估算的费用 (美元)，未收录的模型不计
+    cost_usd: float = 0.0
+
+    def add(self, other: "TokenUsage") -> None:
+        for name in vars(other):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def cache_ratio(self) -> float:
+        """输入 Token 中命中服务端缓存的比例"""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+# 当前上下文额外计入的 TokenUsage (见 usage_scope)
+_current_scope: ContextVar[Optional[TokenUsage]] = ContextVar("usage_scope", default=None)
+
+
+class UsageTracker:
+    """线程安全的全局计数器 (批量模式下多个协程 / 线程同时写入)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_model: Dict[str, TokenUsage] = {}
+
+    def _update(self, model: Optional[str], **deltas: int) -> None:
+        scoped = _current_scope.get()
+        with self._lock:
+            targets = [scoped] if scoped is not None else []
+            if model is not None:
+                targets.append(self._by_model.setdefault(model, TokenUsage()))
+            for usage in targets:
+                for name, value in deltas.items():
+                    setattr(usage, name, getattr(usage, name) + (value or 0))
+
+    def record(self, model: str, prompt_tokens: int = 0, cached_tokens: int = 0, completion_tokens: int = 0) -> None:
+        prompt_tokens, cached_tokens, completion_tokens = prompt_tokens or 0, cached_tokens or 0, completion_tokens or 0
+        self._update(
+            model, requests=1, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens) or 0.0,
+        )
+
+    def record_retry(self, model: Optional[str] = None) -> None:
+        self._update(model, retries=1)
+
+    def record_cache_hit(self, model: str) -> None:
+        self._update(model, cache_hits=1)
+
+    def snapshot(self) -> Dict[str, TokenUsage]:
+        with self._lock:
+            return {model: TokenUsage(**vars(usage)) for model, usage in self._by_model.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_model.clear()
+
+    def summary_lines(self) -> Iterator[str]:
+        for model, usage in self.snapshot().items():
+            yield (
+                f"📊 [Usage] {model}: {usage.requests} 次请求，输入 {usage.prompt_tokens} Token "
+                f"(缓存命中 {usage.cached_tokens}，{usage.cache_ratio:.0%})，输出 {usage.completion_tokens} Token"
+                + (f"，约 ${usage.cost_usd:.4f}" if usage.cost_usd else "")
+                + (f"，本地缓存命中 {usage.cache_hits} 次" if usage.cache_hits else "")
+            )
+
+
+usage_tracker = UsageTracker()
+
+
+@contextlib.contextmanager
+def usage_scope(usage: TokenUsage) -> Iterator[TokenUsage]:
+    """在 with 块内把用量同时计入 usage (asyncio 任务与 to_thread 会继承当前上下文)"""
+    token = _current_scope.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_scope.reset(token)
+
+
+def record_openai_usage(model: str, usage: Optional[Any]) -> None:
+    """OpenAI: usage.prompt_tokens_details.cached_tokens 为命中前缀缓存的 Token 数"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    usage_tracker.record(
+        model,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0),
+        cached_tokens=getattr(details, "cached_tokens", 0) if details is not None else 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0),
+    )
+
+
+def record_gemini_usage(model: str, usage: Optional[Any]) -> None:
+    """Gemini: usage_metadata.cached_content_token_count 为隐式 / 显式缓存命中的 Token 数"""
+    if usage is None:
+        return
+    usage_tracker.record(
+        model,
+        prompt_tokens=getattr(usage, "prompt_token_count", 0),
+        cached_tokens=getattr(usage, "cached_content_token_count", 0),
+        completion_tokens=getattr(usage, "candidates_token_count", 0),
+    )
@@ -1,16 +1,28 @@
 # main.py
 import argparse
+import asyncio
+import glob
+import json
 import os
 import sys
+import time
+from typing import Callable, Optional
 from dotenv import load_dotenv
 
 # 加载环境
 load_dotenv()
 
 from core.analyzer import AuditAnalyzer
-from core.pydantic_schema import AuditReport
+from core.batch import BatchAuditRunner, collect_contract_files, detect_file_project_type
+from core.budget import PromptBudgetError
+from core.diff import changed_line_ranges, collect_changed_ranges
+from core.journal import AuditJournal, JournalInUseError
+from core.watch import ContractWatcher, NormalizedRegionCache
+from core.pydantic_schema import AuditReport, Vulnerability
 from core.factories import ServiceFactory
+from core.metrics import METRICS_FORMATS, FileMetrics, MetricsCollector, file_scope
 from config.settings import project_settings
+from llm_services.usage import usage_tracker
 
 def parse_arguments():
     """解析命令行参数"""
@@ -18,11 +30,12 @@ def parse_arguments():
         description="Certi-Audit AI Agent: 基于 LLM 和静态分析的智能合约审计工具"
     )
     
-    # 必须参数：目标文件
+    # 必须参数：目标文件 (传入目录 / glob / 多个文件时自动进入批量模式)
     parser.add_argument(
-        "file", 
-        type=str, 
-        help="待审计的智能合约文件路径 (例如: contracts/Token.sol)"
+        "targets",
+        nargs="*",
+        type=str,
+        help="待审计的智能合约文件、目录或 glob (例如: contracts/Token.sol, contracts/, 'src/**/*.rs')"
     )
     
     # 可选参数：覆盖项目类型 (EVM, SOLANA)
@@ -34,17 +47,180 @@ def parse_arguments():
         help="覆盖 .env 中的项目类型配置"
     )
 
+    # 批量模式并发参数
+    parser.add_argument(
+        "--static-workers",
+        type=int,
+        default=project_settings.BATCH_STATIC_WORKERS,
+        help="批量模式下同时运行的静态分析工具数"
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=project_settings.BATCH_LLM_CONCURRENCY,
+        help="批量模式下 LLM 并发请求上限"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="批量模式下关闭跨文件去重 (重复的函数区域在每个文件中各自送审)"
+    )
+    parser.add_argument(
+        "--no-project-mode",
+        action="store_true",
+        help="批量模式下逐个文件运行静态分析，不合并为项目级分析"
+    )
+
+    # 费用上限
+    parser.add_argument(
+        "--max-cost",
+        type=float,
+        default=project_settings.BATCH_MAX_COST_USD,
+        metavar="USD",
+        help="批量模式的费用上限 (美元)：按发送前预估累计，超出后剩余文件不再发送给 LLM (0 表示不限制)"
+    )
+
+    # 断点续跑
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="批量模式下从结果日志续跑：跳过上次已完成的文件，只重试失败或未完成的文件"
+    )
+    parser.add_argument(
+        "--journal",
+        type=str,
+        default=project_settings.JOURNAL_PATH,
+        metavar="FILE",
+        help="批量模式的结果日志路径 (默认取 .env 中的 JOURNAL_PATH，空字符串表示不记录)"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="不续跑时丢弃旧结果日志，即使其中还有失败或未完成的文件 (默认拒绝清空并提示 --resume)"
+    )
+
+    # 增量审计 (PR / CI)
+    parser.add_argument(
+        "--diff-base",
+        type=str,
+        default=None,
+        metavar="REF",
+        help="只审计相对该 git ref 变更的文件与函数 (例如: origin/main)，未改动区域复用缓存结论"
+    )
+
+    # 监听模式
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="监听目标目录，保存后只对有变更的函数重新审计，新发现流式输出 (隐含 --stream)"
+    )
+
+    # 流式输出
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="流式调用模型：每解析出一条漏洞立即输出，不等整份报告生成完毕"
+    )
+    parser.add_argument(
+        "--stream-out",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="流式模式下把每条漏洞追加写入该 JSONL 文件 (隐含 --stream)"
+    )
+
+    # 指标导出
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="把每个文件的阶段耗时、Token、费用、重试与缓存命中写入该文件"
+    )
+    parser.add_argument(
+        "--metrics-format",
+        type=str,
+        choices=METRICS_FORMATS,
+        default="jsonl",
+        help="指标文件格式：jsonl (每个文件一行) 或 prometheus (文本格式，汇总值)"
+    )
+
+    # 常驻服务模式
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="以常驻服务运行，通过本地 HTTP/JSON 接口接收审计任务 (不需要目标文件)"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=project_settings.SERVER_HOST,
+        help="--serve 模式的监听地址"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=project_settings.SERVER_PORT,
+        help="--serve 模式的监听端口"
+    )
+
+    # 多进程 / 多机分片
+    parser.add_argument(
+        "--queue",
+        type=str,
+        default=None,
+        metavar="DB",
+        help="分片模式的 SQLite 工作队列：传入目标时作为协调者写入文件并汇总结果，配合 --worker 时领取任务"
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="作为 worker 从 --queue 领取文件审计，直到队列清空 (可在共享文件系统的多台机器上运行)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=project_settings.QUEUE_LOCAL_WORKERS,
+        help="协调者在本机启动的 worker 进程数 (0 表示只等待其他机器上的 worker)"
+    )
+    parser.add_argument(
+        "--report-out",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="分片模式下把汇总报告 (按文件列出的漏洞与失败原因) 写入该 JSON 文件"
+    )
+
+    # 结果缓存控制
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="本次运行绕过静态分析与 LLM 结果缓存"
+    )
+    parser.add_argument(
+        "--purge-cache",
+        action="store_true",
+        help="运行前清空结果缓存 (不传目标文件时只清空缓存)"
+    )
+
     return parser.parse_args()
 
+def is_batch_mode(targets) -> bool:
+    """多个目标、目录或 glob 都视为批量模式"""
+    if len(targets) > 1:
+        return True
+    target = targets[0]
+    return os.path.isdir(target) or glob.has_magic(target)
+
 def load_contract_code(file_path: str) -> str:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"❌ 错误: 找不到文件 '{file_path}'")
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read()
 
-def print_report(report: AuditReport):
+def print_report(report: AuditReport, file_path: str = None):
     print("\n" + "="*70)
-    print(f"✅ 审计报告生成完成")
+    print(f"✅ 审计报告生成完成" + (f": {file_path}" if file_path else ""))
     print("="*70)
     print(f"**摘要:** {report.analysis_summary}\n")
 
@@ -59,6 +235,29 @@ def print_report(report: AuditReport):
         print(f"   🛠️ 建议: {vul.fix_suggestion}")
         print("-" * 30)
 
+def make_vulnerability_sink(args) -> Optional[Callable[[str, Vulnerability], None]]:
+    """流式模式下的漏洞回调：立即打印，并按需追加写入 JSONL 文件"""
+    if not (args.stream or args.stream_out):
+        return None
+
+    def _sink(file_path: str, vul: Vulnerability):
+        print(f"⚡ [流式] {file_path}:{vul.line} {vul.name} ({vul.severity})", flush=True)
+        if args.stream_out:
+            with open(args.stream_out, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"file": file_path, **vul.model_dump()}, ensure_ascii=False) + "\n")
+
+    return _sink
+
+def print_usage():
+    """打印本次运行的 Token 用量与服务端 Prompt 缓存命中情况 (全部命中本地缓存时没有输出)"""
+    for line in usage_tracker.summary_lines():
+        print(line)
+
+def export_metrics(args, collector: MetricsCollector):
+    if args.metrics_out:
+        collector.write(args.metrics_out, args.metrics_format)
+        print(f"📈 指标已写入 {args.metrics_out} ({args.metrics_format})")
+
 def detect_project_type(file_path: str, explicit_type: str = None) -> str:
     """
     智能推断项目类型
@@ -76,36 +275,418 @@ def detect_project_type(file_path: str, explicit_type: str = None) -> str:
         
     return "EVM" # 默认回退
 
+def open_journal(args, config: dict) -> AuditJournal:
+    """打开结果日志；旧日志中还有失败或未完成的文件时，交互终端询问是否丢弃，非交互环境直接报错"""
+    try:
+        return AuditJournal(args.journal, config, resume=args.resume, overwrite=args.fresh)
+    except JournalInUseError as e:
+        if not sys.stdin.isatty():
+            raise
+        answer = input(f"⚠️  {e}\n   丢弃旧日志并重新开始? [y/N] ").strip().lower()
+        if answer not in ("y", "yes"):
+            raise
+        return AuditJournal(args.journal, config, resume=False, overwrite=True)
+
+
+async def run_batch(args) -> int:
+    """批量模式：并发审计，按完成顺序流式输出，返回失败文件数"""
+    files = collect_contract_files(args.targets)
+    if not files:
+        raise FileNotFoundError(f"❌ 错误: 在 {args.targets} 中没有找到可审计的合约文件")
+
+    changed_ranges = None
+    if args.diff_base:
+        changed_ranges = collect_changed_ranges(args.diff_base, files)
+        print(f"🔀 增量模式: 相对 {args.diff_base} 有变更的文件 {len(changed_ranges)} / {len(files)}")
+        files = [f for f in files if f in changed_ranges]
+        if not files:
+            print("🎉 没有需要重新审计的文件。")
+            return 0
+
+    project_types = sorted({args.type or detect_file_project_type(f) for f in files})
+    print(f"📂 批量模式: 共 {len(files)} 个文件，类型 {project_types}")
+    print(f"⚙️  并发: 静态分析 {args.static_workers} / LLM 请求 {args.llm_concurrency}")
+
+    # 所有分析器共享同一个 LLM 服务实例
+    llm_service = ServiceFactory.get_llm_service()
+    region_cache = ServiceFactory.get_region_cache()
+    analyzers = {
+        project_type: AuditAnalyzer(
+            llm_service=llm_service,
+            static_analyzer=ServiceFactory.get_static_analyzer(project_type),
+            region_cache=region_cache,
+        )
+        for project_type in project_types
+    }
+    journal = None
+    if args.journal:
+        # 模型与增量 base 不同时，上次的 LLM 结论不能复用
+        journal = open_journal(args, {"model": llm_service.model_name, "diff_base": args.diff_base})
+    elif args.resume:
+        raise ValueError("--resume 需要结果日志，请通过 --journal 或 JOURNAL_PATH 指定路径")
+    runner = BatchAuditRunner(
+        analyzers,
+        static_workers=args.static_workers,
+        llm_concurrency=args.llm_concurrency,
+        project_type_override=args.type,
+        changed_ranges=changed_ranges,
+        project_mode=project_settings.STATIC_PROJECT_MODE and not args.no_project_mode,
+        static_executor=project_settings.BATCH_STATIC_EXECUTOR,
+        queue_size=project_settings.PIPELINE_QUEUE_SIZE,
+        on_vulnerability=make_vulnerability_sink(args),
+        dedup_min_lines=(
+            project_settings.DEDUP_MIN_LINES if project_settings.DEDUP_ENABLED and not args.no_dedup else None
+        ),
+        max_cost=args.max_cost or None,
+        journal=journal,
+    )
+
+    failures = 0
+    done = 0
+    resumed = 0
+    collector = MetricsCollector()
+    try:
+        async for result in runner.run(files):
+            done += 1
+            if result.resumed:
+                resumed += 1
+            else:
+                collector.add(result.metrics)
+            if result.ok:
+                print_report(result.report, file_path=result.file_path)
+            else:
+                failures += 1
+                print(f"\n❌ [{done}/{len(files)}] {result.file_path} 审计失败: {result.error}")
+    finally:
+        if journal is not None:
+            journal.close()
+            if done < len(files):
+                print(f"\n💾 已完成的进度已写入 {args.journal}，使用 --resume 继续")
+
+    print("\n" + "="*70)
+    print(f"📊 批量审计完成: 成功 {len(files) - failures} / 失败 {failures} / 共 {len(files)}"
+          + (f" (其中 {resumed} 个复用上次运行的结果)" if resumed else ""))
+    if failures and journal is not None:
+        print(f"💾 失败文件已记录在 {args.journal}，使用 --resume 只重试这些文件")
+    print(collector.summary_table())
+    if runner.deduplicator is not None:
+        for line in runner.deduplicator.summary_lines():
+            print(line)
+    print_usage()
+    export_metrics(args, collector)
+    return failures
+
+async def run_watch(args) -> None:
+    """监听模式：完整审计一遍后持续监听，每次保存只重新审计变更的函数区域"""
+    files = collect_contract_files(args.targets)
+    project_types = sorted({args.type or detect_file_project_type(f) for f in files})
+    llm_service = ServiceFactory.get_llm_service()
+    # 按规范化代码复用区域结论：只改注释 / 格式的函数不会丢失上一轮的结论
+    region_cache = NormalizedRegionCache(ServiceFactory.get_region_cache())
+    analyzers = {
+        project_type: AuditAnalyzer(
+            llm_service=llm_service,
+            static_analyzer=ServiceFactory.get_static_analyzer(project_type),
+            region_cache=region_cache,
+        )
+        for project_type in project_types
+    }
+    runner = BatchAuditRunner(
+        analyzers,
+        static_workers=args.static_workers,
+        llm_concurrency=args.llm_concurrency,
+        project_type_override=args.type,
+        project_mode=project_settings.STATIC_PROJECT_MODE and not args.no_project_mode,
+        static_executor=project_settings.BATCH_STATIC_EXECUTOR,
+        queue_size=project_settings.PIPELINE_QUEUE_SIZE,
+        on_vulnerability=make_vulnerability_sink(args),
+    )
+
+    def _on_result(round_number: int, result):
+        if not result.ok:
+            print(f"\n❌ {result.file_path} 审计失败: {result.error}")
+        elif round_number == 1:
+            print_report(result.report, file_path=result.file_path)
+        else:
+            print(f"📄 {result.file_path}: 当前共 {len(result.report.vulnerabilities)} 条漏洞")
+
+    watcher = ContractWatcher(
+        args.targets, runner,
+        interval=project_settings.WATCH_POLL_INTERVAL,
+        debounce=project_settings.WATCH_DEBOUNCE_SECONDS,
+        on_result=_on_result,
+    )
+    await watcher.run()
+
+def worker_command(args) -> list:
+    """
+    协调者在本机启动 worker 时使用的命令行 (沿用本次的并发、开关与流式输出参数)。
+    --metrics-out 不转发：协调者从队列汇总全部 worker 的指标后写入，worker 各自写同一文件会互相覆盖。
+    """
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", "--queue", args.queue,
+        "--static-workers", str(args.static_workers), "--llm-concurrency", str(args.llm_concurrency),
+        "--max-cost", str(args.max_cost),
+    ]
+    for flag in ("no_cache", "no_dedup", "no_project_mode", "stream"):
+        if getattr(args, flag):
+            command.append("--" + flag.replace("_", "-"))
+    if args.stream_out:
+        # 多个 worker 逐行追加到同一个 JSONL 文件
+        command += ["--stream-out", os.path.abspath(args.stream_out)]
+    return command
+
+
+def run_coordinator(args) -> int:
+    """分片模式的协调者：写入工作队列，启动本机 worker，等待全部完成后汇总，返回失败文件数"""
+    import subprocess
+    from core.workqueue import WorkQueue, aggregate_report
+
+    files = collect_contract_files(args.targets)
+    if not files:
+        raise FileNotFoundError(f"❌ 错误: 在 {args.targets} 中没有找到可审计的合约文件")
+    changed_ranges = None
+    if args.diff_base:
+        changed_ranges = collect_changed_ranges(args.diff_base, files)
+        print(f"🔀 增量模式: 相对 {args.diff_base} 有变更的文件 {len(changed_ranges)} / {len(files)}")
+        files = [f for f in files if f in changed_ranges]
+
+    queue = WorkQueue(args.queue, max_attempts=project_settings.QUEUE_MAX_ATTEMPTS)
+    pending = queue.enqueue(
+        [(f, args.type or detect_file_project_type(f)) for f in files],
+        changed_ranges=changed_ranges, project_type_override=args.type, resume=args.resume,
+        max_cost=args.max_cost or None,
+    )
+    print(f"🗂️  [Queue] {len(files)} 个文件写入 {args.queue}，待审计 {pending} 个")
+    workers = []
+    if pending:
+        workers = [subprocess.Popen(worker_command(args)) for _ in range(args.workers)]
+        print(f"🛠️  [Queue] 本机启动 {len(workers)} 个 worker；其他机器可加入: "
+              f"python main.py --worker --queue {os.path.abspath(args.queue)}")
+
+    last = None
+    try:
+        while True:
+            counts = queue.counts()
+            if counts != last:
+                print(f"📦 [Queue] 排队 {counts['pending']} / 处理中 {counts['leased']} / "
+                      f"完成 {counts['done']} / 失败 {counts['failed']}", flush=True)
+                last = counts
+            if counts["pending"] + counts["leased"] == 0:
+                break
+            if workers and all(p.poll() is not None for p in workers) \
+                    and not queue.workers(project_settings.QUEUE_LEASE_SECONDS):
+                print("⚠️ [Queue] 本机 worker 已全部退出且没有其他存活的 worker，停止等待 (可用 --resume 继续)")
+                break
+            time.sleep(project_settings.QUEUE_POLL_INTERVAL)
+    finally:
+        for process in workers:
+            if process.poll() is None and queue.outstanding() == 0:
+                process.wait()
+            elif process.poll() is None:
+                process.terminate()
+
+    results = queue.results()
+    collector = MetricsCollector()
+    failures = 0
+    for item in results:
+        if item["metrics"]:
+            collector.add(FileMetrics.from_dict(item["metrics"]))
+        if item["status"] == "done":
+            print_report(AuditReport.model_validate(item["report"]), file_path=item["file_path"])
+        else:
+            failures += 1
+            print(f"\n❌ {item['file_path']} 审计失败: {item['error']}")
+
+    aggregated = aggregate_report(results)
+    print("\n" + "="*70)
+    print(f"📊 分片审计完成: 成功 {aggregated['summary']['audited']} / 失败 {failures} / 共 {len(files)}，"
+          f"漏洞 {aggregated['summary']['vulnerabilities']} 条 {aggregated['summary']['by_severity']}")
+    print(collector.summary_table())
+    for worker in queue.workers():
+        print(f"   • worker {worker['worker']} ({worker['model']}): 完成 {worker['done']} / 失败 {worker['failed']}")
+    if args.report_out:
+        with open(args.report_out, "w", encoding="utf-8") as f:
+            json.dump(aggregated, f, ensure_ascii=False, indent=2)
+        print(f"📝 汇总报告已写入 {args.report_out}")
+    export_metrics(args, collector)
+    return failures + len(files) - len(results)
+
+async def run_worker(args) -> None:
+    """分片模式的 worker：使用本机的 LLM 凭据与并发配置，从队列领取文件直到清空"""
+    from core.workqueue import QueueCostLedger, QueueWorker, WorkQueue
+
+    queue = WorkQueue(args.queue, max_attempts=project_settings.QUEUE_MAX_ATTEMPTS)
+    # 费用上限由全部 worker 共享 (协调者写入队列)；队列未设置时使用本机传入的上限，同样记在队列中
+    max_cost = queue.config().get("max_cost") or args.max_cost or None
+    llm_service = ServiceFactory.get_llm_service()
+    region_cache = ServiceFactory.get_region_cache()
+    analyzers = {
+        project_type: AuditAnalyzer(
+            llm_service=llm_service,
+            static_analyzer=ServiceFactory.get_static_analyzer(project_type),
+            region_cache=region_cache,
+        )
+        for project_type in queue.project_types()
+    }
+    runner = BatchAuditRunner(
+        analyzers,
+        static_workers=args.static_workers,
+        llm_concurrency=args.llm_concurrency,
+        project_mode=project_settings.STATIC_PROJECT_MODE and not args.no_project_mode,
+        static_executor=project_settings.BATCH_STATIC_EXECUTOR,
+        queue_size=project_settings.PIPELINE_QUEUE_SIZE,
+        dedup_min_lines=(
+            project_settings.DEDUP_MIN_LINES if project_settings.DEDUP_ENABLED and not args.no_dedup else None
+        ),
+        cost_ledger=QueueCostLedger(queue, max_cost) if max_cost else None,
+        on_vulnerability=make_vulnerability_sink(args),
+    )
+    worker = QueueWorker(
+        queue, runner,
+        batch_size=project_settings.QUEUE_LEASE_BATCH,
+        lease_seconds=project_settings.QUEUE_LEASE_SECONDS,
+        poll_interval=project_settings.QUEUE_POLL_INTERVAL,
+    )
+    await worker.run(model=llm_service.model_name)
+    print_usage()
+    # 单独运行的 worker 导出本机处理的文件指标 (协调者启动的 worker 不带 --metrics-out)
+    export_metrics(args, worker.collector)
+
 def main():
     # 1. 解析参数
     args = parse_arguments()
-    
+
+    if args.purge_cache:
+        removed = ServiceFactory.purge_caches()
+        print(f"🧹 已清空结果缓存 ({removed} 条)")
+        if not args.targets and not args.serve:
+            return
+    if args.no_cache:
+        project_settings.CACHE_ENABLED = False
+    if args.serve:
+        # 常驻服务才需要 http.server 等模块，按需导入
+        from core.server import serve
+        try:
+            serve(args.host, args.port)
+        except ValueError as e:
+            print(f"❌ 配置错误: {e}")
+            sys.exit(1)
+        return
+    if args.worker:
+        if not args.queue:
+            print("❌ 错误: --worker 需要通过 --queue 指定工作队列")
+            sys.exit(2)
+        try:
+            asyncio.run(run_worker(args))
+        except KeyboardInterrupt:
+            # 已领取的文件在租约过期后由其他 worker 接手
+            print("\n⛔ worker 已中断")
+            sys.exit(130)
+        except ValueError as e:
+            print(f"❌ 配置错误: {e}")
+            sys.exit(1)
+        return
+    if not args.targets:
+        print("❌ 错误: 请至少指定一个待审计的文件、目录或 glob")
+        sys.exit(2)
+
+    print(f"🚀 启动 Certi-Audit Agent...")
+
+    if args.queue:
+        try:
+            failures = run_coordinator(args)
+        except KeyboardInterrupt:
+            print(f"\n⛔ 协调者已中断，队列保留在 {args.queue}，使用 --resume 继续")
+            sys.exit(130)
+        except FileNotFoundError as e:
+            print(e)
+            sys.exit(1)
+        except ValueError as e:
+            print(f"❌ 配置错误: {e}")
+            sys.exit(1)
+        sys.exit(1 if failures else 0)
+
+    if args.watch:
+        # 新发现在模型输出解析出来时立即打印
+        args.stream = True
+        try:
+            asyncio.run(run_watch(args))
+        except KeyboardInterrupt:
+            print("\n👋 已退出监听")
+            print_usage()
+        except FileNotFoundError as e:
+            print(e)
+            sys.exit(1)
+        except ValueError as e:
+            print(f"❌ 配置错误: {e}")
+            sys.exit(1)
+        return
+
+    if is_batch_mode(args.targets):
+        try:
+            failures = asyncio.run(run_batch(args))
+        except KeyboardInterrupt:
+            print("\n⛔ 批量审计已中断")
+            sys.exit(130)
+        except FileNotFoundError as e:
+            print(e)
+            sys.exit(1)
+        except ValueError as e:
+            print(f"❌ 配置错误: {e}")
+            sys.exit(1)
+        sys.exit(1 if failures else 0)
+
+    file_path = args.targets[0]
+
     # [✨] 智能类型检测
-    detected_type = detect_project_type(args.file, args.type)
-    
+    detected_type = detect_project_type(file_path, args.type)
+
     project_settings.PROJECT_TYPE = detected_type
 
-    print(f"🚀 启动 Certi-Audit Agent...")
-    print(f"📂 目标文件: {args.file}")
+    print(f"📂 目标文件: {file_path}")
     print(f"🔧 审计模式: {detected_type}") # 打印当前模式
-    
+
     try:
         # 2. [✨] 使用工厂组装依赖 (Dependency Injection)
         llm_service = ServiceFactory.get_llm_service()
         static_analyzer = ServiceFactory.get_static_analyzer()
         
         # 3. 大语言模型服务 + 注入分析器
-        analyzer = AuditAnalyzer(llm_service=llm_service, static_analyzer=static_analyzer)
+        analyzer = AuditAnalyzer(
+            llm_service=llm_service,
+            static_analyzer=static_analyzer,
+            region_cache=ServiceFactory.get_region_cache(),
+        )
 
         # 4. 执行业务逻辑
-        contract_code = load_contract_code(args.file)
-        report = analyzer.analyze(file_path=args.file, contract_code=contract_code)
+        contract_code = load_contract_code(file_path)
+        sink = make_vulnerability_sink(args)
+        on_vulnerability = (lambda vul: sink(file_path, vul)) if sink else None
+        metrics = FileMetrics(file_path, detected_type)
+        started = time.perf_counter()
+        with file_scope(metrics):
+            if args.diff_base:
+                ranges = changed_line_ranges(args.diff_base, file_path)
+                report = analyzer.analyze_diff(file_path, contract_code, ranges, on_vulnerability=on_vulnerability)
+            else:
+                report = analyzer.analyze(
+                    file_path=file_path, contract_code=contract_code, on_vulnerability=on_vulnerability
+                )
+        metrics.wall_seconds = time.perf_counter() - started
         
         print_report(report)
+        print_usage()
+        collector = MetricsCollector()
+        collector.add(metrics)
+        export_metrics(args, collector)
 
     except FileNotFoundError as e:
         print(e)
         sys.exit(1)
+    except PromptBudgetError as e:
+        print(f"❌ Prompt 超出预算: {e}")
+        sys.exit(1)
     except ValueError as e:
         print(f"❌ 配置错误: {e}")
         sys.exit(1)
@@ -1,19 +1,139 @@
 # static_analyzers/abstract_analyzer.py
+import asyncio
+import hashlib
+import os
+import subprocess
 from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from static_analyzers.findings import StaticAnalysisResult
+from static_analyzers.tool_runner import ToolLimits
 
 class AbstractStaticAnalyzer(ABC):
     """
     静态分析器抽象基类 (Strategy Interface)
     """
-    
+
+    def __init__(self, limits: Optional[ToolLimits] = None):
+        # 子进程的超时 / 内存 / CPU 限制，由 ServiceFactory 按工具从配置注入
+        self.limits = limits or ToolLimits()
+
     @abstractmethod
     def check_installed(self) -> bool:
         """检查底层工具是否安装"""
         pass
 
     @abstractmethod
-    def run_analysis(self, file_path: str) -> str:
+    def run_analysis(self, file_path: str) -> StaticAnalysisResult:
+        """
+        运行分析并返回结构化的发现列表。
+        渲染为 LLM 文本、按严重度过滤等由 static_analyzers.findings 统一处理。
+        """
+        pass
+
+    # --- 异步执行路径 ---
+    # 默认在线程中执行同步版本；基于子进程的分析器应覆写为 tool_runner.arun_tool，
+    # 使编排器可以在同一个事件循环里并发调度多个工具，并在取消时杀掉子进程组。
+
+    async def arun_analysis(self, file_path: str) -> StaticAnalysisResult:
+        return await asyncio.to_thread(self.run_analysis, file_path)
+
+    async def arun_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        return await asyncio.to_thread(self.run_project_analysis, root, file_paths)
+
+    async def arun_workspace_analysis(self, root: str) -> StaticAnalysisResult:
+        return await asyncio.to_thread(self.run_workspace_analysis, root)
+
+    def timeout_error(self, tool: str) -> str:
+        return f"⏱️ {tool} 执行超过 {self.limits.timeout:g} 秒，已终止其整个进程组。"
+
+    # 计算项目指纹时纳入的源码后缀 / 配置文件，以及跳过的依赖 / 构建目录
+    SOURCE_EXTENSIONS: Tuple[str, ...] = ()
+    PROJECT_CONFIG_FILES: Tuple[str, ...] = ()
+    FINGERPRINT_IGNORED_DIRS = {".git", "node_modules", "out", "cache", "artifacts", "target", "crytic-export"}
+
+    def project_root(self, file_path: str) -> Optional[str]:
         """
-        运行分析并返回对 LLM 友好的摘要字符串。
+        文件所属的项目根目录 (支持项目级分析的工具才返回)。
+        返回 None 表示该文件只能单独分析。
         """
-        pass
\ No newline at end of file
+        return None
+
+    def run_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        """
+        对同一项目下的一组文件运行分析，返回 文件路径 -> 结果。
+        默认逐个调用 run_analysis；能一次编译整个项目的工具应覆写此方法。
+        """
+        return {path: self.run_analysis(path) for path in file_paths}
+
+    # 工具是否总是分析整个项目 (例如 Soteria 只能在 Cargo workspace 根目录运行)。
+    # 为 True 时单文件分析也从整个项目的一次运行结果中取出对应文件的发现
+    WHOLE_PROJECT = False
+
+    def run_workspace_analysis(self, root: str) -> StaticAnalysisResult:
+        """对整个项目运行一次分析，发现中的 file 为相对 root 的路径。WHOLE_PROJECT 工具需要实现。"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持整项目分析")
+
+    @staticmethod
+    def split_by_file(
+        root: str, result: StaticAnalysisResult, file_paths: List[str]
+    ) -> Dict[str, StaticAnalysisResult]:
+        """
+        把整个项目的分析结果按文件拆分：发现的 file 相对 root 解析后与目标文件比较，
+        无法定位文件的发现以及 error / notes 分给每个文件。
+        """
+        targets = [os.path.normpath(os.path.abspath(path)) for path in file_paths]
+        by_file: Dict[str, list] = {}
+        shared = []
+        for finding in result.findings:
+            if not finding.file:
+                shared.append(finding)
+                continue
+            resolved = os.path.normpath(os.path.join(root, finding.file))
+            if resolved not in targets and not os.path.isabs(finding.file):
+                # 工具报告的路径可能相对于上层 workspace 而不是 root，按路径后缀匹配
+                suffix = os.sep + os.path.normpath(finding.file)
+                resolved = next((t for t in targets if t.endswith(suffix)), resolved)
+            by_file.setdefault(resolved, []).append(finding)
+        return {
+            path: result.model_copy(update={"findings": by_file.get(target, []) + shared})
+            for path, target in zip(file_paths, targets)
+        }
+
+    def project_fingerprint(self, root: str) -> str:
+        """项目内全部源码与配置文件的内容哈希 (项目级分析结果的缓存 key)"""
+        digest = hashlib.sha256()
+        for directory, dirs, names in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if d not in self.FINGERPRINT_IGNORED_DIRS)
+            for name in sorted(names):
+                if not (name.endswith(self.SOURCE_EXTENSIONS) or name in self.PROJECT_CONFIG_FILES):
+                    continue
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode("utf-8"))
+                digest.update(self.content_fingerprint(path).encode("utf-8"))
+        return digest.hexdigest()
+
+    def tool_version(self) -> str:
+        """底层工具版本号，作为结果缓存 key 的一部分。默认未知。"""
+        return "unknown"
+
+    def content_fingerprint(self, file_path: str) -> str:
+        """
+        分析结果所依赖输入的内容哈希，作为结果缓存 key 的一部分。
+        默认只依赖单个文件内容；按项目整体分析的工具应覆写此方法。
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _probe_version(command: List[str]) -> str:
+        """执行 `<tool> --version` 一类命令并返回首行输出"""
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=False, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return "unknown"
+        output = (result.stdout or result.stderr).strip()
+        return output.splitlines()[0] if output else "unknown"
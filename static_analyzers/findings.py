@@ -0,0 +1,141 @@
+# static_analyzers/findings.py
+"""
+静态分析发现的结构化模型与 LLM 渲染。
+
+分析器只负责把工具输出解析成 StaticAnalysisResult；
+过滤 (严重度 / 置信度)、去重与压缩成 Prompt 文本统一在这里完成，
+分块路由、增量过滤等环节直接基于行号区间工作，不再解析文本。
+"""
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from core.pydantic_schema import CONFIDENCE_ORDER, rank
+
+LineSpan = Tuple[int, int]
+
+# 静态分析工具的严重度由低到高排序 (比 LLM 报告多一级 Optimization)；未知的严重度 / 置信度不参与过滤
+IMPACT_ORDER = ["Optimization", "Informational", "Low", "Medium", "High"]
+
+
+def compress_lines(lines: Iterable[int]) -> List[LineSpan]:
+    """把 [3, 4, 5, 9, 4] 这样的行号列表去重并压缩为 [(3, 5), (9, 9)]"""
+    spans: List[LineSpan] = []
+    for line in sorted(set(lines)):
+        if spans and line == spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], line)
+        else:
+            spans.append((line, line))
+    return spans
+
+
+def format_spans(spans: Sequence[LineSpan]) -> str:
+    if not spans:
+        return "Global"
+    return "L" + ",".join(f"{a}-{b}" if a != b else f"{a}" for a, b in spans)
+
+
+class StaticFinding(BaseModel):
+    """单条静态分析发现"""
+    check: str = Field(description="检测器 / 规则 ID，例如 'reentrancy-eth'")
+    impact: str = Field(default="Unknown", description="严重度: High / Medium / Low / Informational / Optimization")
+    confidence: str = Field(default="Unknown", description="置信度: High / Medium / Low")
+    file: str = Field(default="", description="发现所在的源文件")
+    lines: List[LineSpan] = Field(default_factory=list, description="压缩后的行号区间 (闭区间)；为空表示无法定位")
+    description: str = ""
+
+    def touches(self, predicate: Callable[[int, int], bool]) -> bool:
+        """任一行号区间满足 predicate(start, end)"""
+        return any(predicate(start, end) for start, end in self.lines)
+
+    def dedup_key(self) -> tuple:
+        return (self.check, self.file, tuple(self.lines), self.description.strip())
+
+
+class StaticAnalysisResult(BaseModel):
+    """一次静态分析的结构化结果"""
+    tool: str
+    findings: List[StaticFinding] = Field(default_factory=list)
+    # 工具未安装 / 执行失败时的说明；非空表示结果不可信，不应被缓存
+    error: Optional[str] = None
+    # 无法结构化解析时保留的原始输出片段
+    notes: str = ""
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    def filter(self, keep: Callable[[StaticFinding], bool]) -> "StaticAnalysisResult":
+        """按谓词筛选发现，保留 error / notes"""
+        return self.model_copy(update={"findings": [f for f in self.findings if keep(f)]})
+
+    def deduplicated(self) -> "StaticAnalysisResult":
+        seen = set()
+        unique = []
+        for finding in self.findings:
+            key = finding.dedup_key()
+            if key not in seen:
+                seen.add(key)
+                unique.append(finding)
+        return self.model_copy(update={"findings": unique})
+
+    def summary_line(self) -> str:
+        if self.error:
+            return self.error
+        return f"{self.tool}: {len(self.findings)} 条发现"
+
+
+def passes_thresholds(finding: StaticFinding, min_impact: str, min_confidence: str) -> bool:
+    impact_rank = rank(finding.impact, IMPACT_ORDER)
+    if impact_rank is not None and impact_rank < IMPACT_ORDER.index(min_impact):
+        return False
+    confidence_rank = rank(finding.confidence, CONFIDENCE_ORDER)
+    if confidence_rank is not None and confidence_rank < CONFIDENCE_ORDER.index(min_confidence):
+        return False
+    return True
+
+
+def select_findings(
+    result: StaticAnalysisResult, min_impact: str = "Optimization", min_confidence: str = "Low"
+) -> List[StaticFinding]:
+    """去重并按阈值过滤，按严重度降序排列 (即进入 Prompt 的顺序，预算不足时从末尾裁剪)"""
+    findings = [
+        f for f in result.deduplicated().findings
+        if passes_thresholds(f, min_impact, min_confidence)
+    ]
+    findings.sort(key=lambda f: (-(rank(f.impact, IMPACT_ORDER) or 0), f.lines[:1], f.check))
+    return findings
+
+
+def render_findings(
+    result: StaticAnalysisResult,
+    min_impact: str = "Optimization",
+    min_confidence: str = "Low",
+    empty_message: Optional[str] = None,
+    limit: Optional[int] = None,
+    notes_chars: Optional[int] = None,
+) -> str:
+    """
+    渲染为紧凑的 LLM 文本：按严重度降序，每条一行，行号压缩为区间。
+    limit / notes_chars: Prompt 预算不足时只保留前 limit 条发现、未结构化输出的前 notes_chars 个字符。
+    """
+    if result.error:
+        return result.error
+
+    findings = select_findings(result, min_impact, min_confidence)
+
+    if not findings and not result.notes:
+        return empty_message or f"✅ {result.tool} 分析完成：未发现已知的漏洞模式。"
+
+    summary = [f"### 🔍 {result.tool} 静态分析报告 ({len(findings)} 条):"]
+    shown = findings if limit is None else findings[:limit]
+    for i, f in enumerate(shown):
+        description = " ".join(f.description.split())
+        summary.append(f"{i + 1}. [{f.impact}/{f.confidence}] {f.check} @ {format_spans(f.lines)}: {description}")
+    if len(shown) < len(findings):
+        summary.append(f"...(受 Prompt 预算限制，省略 {len(findings) - len(shown)} 条较低严重度的发现)")
+    notes = result.notes if notes_chars is None else result.notes[:notes_chars]
+    if notes:
+        summary.append("未结构化的工具输出 (节选):")
+        summary.append(notes + ("\n...(输出截断)..." if len(notes) < len(result.notes) else ""))
+    return "\n".join(summary)
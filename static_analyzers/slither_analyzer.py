@@ -1,67 +1,157 @@
 # static_analyzers/slither_analyzer.py
 import json
-import subprocess
+import re
 import shutil
 import os
+from typing import Any, Dict, List, Optional, Tuple
+
 from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
+from static_analyzers.findings import StaticAnalysisResult, StaticFinding, compress_lines
+from static_analyzers.tool_runner import ToolRun, arun_tool, run_tool
+
+# Slither 的描述里会反复出现完整路径 "(contracts/a/b/Token.sol#17-27)"，只保留文件名
+_SOURCE_REF_RE = re.compile(r"\((?:[^()\s]*/)?([^()/\s]+\.sol#[\d-]+)\)")
+
 
 class SlitherAnalyzer(AbstractStaticAnalyzer):
     """
     针对 EVM/Solidity 的分析器实现，底层使用 Slither
     """
-    
+
+    TOOL_NAME = "Slither"
+
+    SOURCE_EXTENSIONS = (".sol",)
+    # 识别 Foundry / Hardhat / Truffle / Brownie 项目根目录的标志文件
+    PROJECT_CONFIG_FILES = (
+        "foundry.toml", "hardhat.config.js", "hardhat.config.ts", "hardhat.config.cjs",
+        "truffle-config.js", "brownie-config.yaml", "remappings.txt",
+    )
+    PROJECT_MARKERS = PROJECT_CONFIG_FILES[:-1]
+
     def check_installed(self) -> bool:
         return shutil.which("slither") is not None
 
-    def run_analysis(self, file_path: str) -> str:
+    def tool_version(self) -> str:
+        if not self.check_installed():
+            return "unknown"
+        return self._probe_version(["slither", "--version"])
+
+    @staticmethod
+    def parse_detector(det: Dict[str, Any]) -> StaticFinding:
+        """把 Slither JSON 中的一个 detector 结果转换为 StaticFinding"""
+        lines: List[int] = []
+        primary_file = ""
+        for elem in det.get("elements") or []:
+            mapping = elem.get("source_mapping") or {}
+            filename = mapping.get("filename_relative") or mapping.get("filename_absolute") or ""
+            if not primary_file:
+                primary_file = filename
+            # 只合并与主元素同一文件的行号，避免把依赖库中的行号混进来
+            if filename == primary_file:
+                lines.extend(mapping.get("lines") or [])
+
+        description = _SOURCE_REF_RE.sub(r"(\1)", det.get("description", "No description"))
+        return StaticFinding(
+            check=det.get("check", "Unknown"),
+            impact=det.get("impact", "Unknown"),
+            confidence=det.get("confidence", "Unknown"),
+            file=primary_file,
+            lines=compress_lines(lines),
+            description=description.strip(),
+        )
+
+    def project_root(self, file_path: str) -> Optional[str]:
+        """向上查找 Foundry / Hardhat 等框架的配置文件，找到则返回项目根目录"""
+        directory = os.path.dirname(os.path.abspath(file_path))
+        while True:
+            if any(os.path.exists(os.path.join(directory, marker)) for marker in self.PROJECT_MARKERS):
+                return directory
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+
+    def _command(self, target: str) -> List[str]:
+        return ["slither", target, "--json", "-"]
+
+    def _parse_run(self, run: ToolRun) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        """解析 slither 的 JSON 输出，返回 (detectors, 错误信息)"""
+        if run.timed_out:
+            return None, self.timeout_error(self.TOOL_NAME)
+
+        raw_output = run.stdout.strip()
+        if not raw_output:
+            return None, f"Slither 未返回输出。Stderr: {run.stderr.strip()}"
+
+        # 解析 JSON
+        try:
+            data = json.loads(raw_output)
+        except json.JSONDecodeError:
+            return None, f"Slither 输出非标准 JSON，跳过解析。\n片段: {raw_output[:200]}..."
+
+        return data.get("results", {}).get("detectors", []), None
+
+    def _run_slither(self, target: str, cwd: Optional[str] = None) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        return self._parse_run(run_tool(self._command(target), cwd=cwd, limits=self.limits))
+
+    async def _arun_slither(self, target: str, cwd: Optional[str] = None) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        return self._parse_run(await arun_tool(self._command(target), cwd=cwd, limits=self.limits))
+
+    def _precheck(self, file_path: str) -> Optional[StaticAnalysisResult]:
         if not self.check_installed():
-            return "⚠️ 警告: 系统未检测到 'slither' 命令。"
-        
+            return StaticAnalysisResult(tool=self.TOOL_NAME, error="⚠️ 警告: 系统未检测到 'slither' 命令。")
         if not os.path.exists(file_path):
-            return f"错误: 文件不存在 {file_path}"
+            return StaticAnalysisResult(tool=self.TOOL_NAME, error=f"错误: 文件不存在 {file_path}")
+        return None
+
+    def _to_result(self, detectors: Optional[List[Dict[str, Any]]], error: Optional[str]) -> StaticAnalysisResult:
+        if error:
+            return StaticAnalysisResult(tool=self.TOOL_NAME, error=error)
+        return StaticAnalysisResult(
+            tool=self.TOOL_NAME,
+            findings=[self.parse_detector(det) for det in detectors],
+        )
+
+    def run_analysis(self, file_path: str) -> StaticAnalysisResult:
+        precheck = self._precheck(file_path)
+        if precheck:
+            return precheck
+        try:
+            return self._to_result(*self._run_slither(file_path))
+        except Exception as e:
+            return StaticAnalysisResult(tool=self.TOOL_NAME, error=f"❌ Slither 分析器执行异常: {str(e)}")
+
+    async def arun_analysis(self, file_path: str) -> StaticAnalysisResult:
+        precheck = self._precheck(file_path)
+        if precheck:
+            return precheck
+        try:
+            return self._to_result(*await self._arun_slither(file_path))
+        except Exception as e:
+            return StaticAnalysisResult(tool=self.TOOL_NAME, error=f"❌ Slither 分析器执行异常: {str(e)}")
+
+    def run_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        """
+        在项目根目录只运行一次 Slither (crytic-compile 一次编译整个依赖图)，
+        再按 source_mapping 中的文件名把检测结果拆分给各个文件。
+        """
+        if not self.check_installed():
+            return {path: self.run_analysis(path) for path in file_paths}
 
+        print(f"🔍 [Slither] 项目级分析: {root} ({len(file_paths)} 个文件共享一次编译)")
         try:
-            # 执行命令
-            result = subprocess.run(
-                ["slither", file_path, "--json", "-"],
-                capture_output=True,
-                text=True,
-                check=False 
-            )
-            
-            raw_output = result.stdout.strip()
-            if not raw_output:
-                 return f"Slither 未返回输出。Stderr: {result.stderr.strip()}"
-
-            # 解析 JSON
-            try:
-                data = json.loads(raw_output)
-            except json.JSONDecodeError:
-                return f"Slither 输出非标准 JSON，跳过解析。\n片段: {raw_output[:200]}..."
-
-            detectors = data.get("results", {}).get("detectors", [])
-            
-            if not detectors:
-                return "✅ Slither 分析完成：未发现已知的高危漏洞模式。"
-
-            # 构建摘要
-            summary = ["### 🔍 Slither 静态分析报告 (EVM):"]
-            for i, det in enumerate(detectors):
-                check_id = det.get("check", "Unknown")
-                description = det.get("description", "No description")
-                impact = det.get("impact", "Unknown")
-                
-                lines = []
-                if det.get("elements"):
-                    for elem in det["elements"]:
-                        if "source_mapping" in elem and "lines" in elem["source_mapping"]:
-                            lines.extend(elem["source_mapping"]["lines"])
-                
-                line_str = f"Line {lines}" if lines else "Global"
-                summary.append(f"{i+1}. [{impact}] **{check_id}** ({line_str})")
-                summary.append(f"   - 详情: {description}")
-
-            return "\n".join(summary)
+            result = self._to_result(*self._run_slither(".", cwd=root))
+        except Exception as e:
+            result = StaticAnalysisResult(tool=self.TOOL_NAME, error=f"❌ Slither 分析器执行异常: {str(e)}")
+        return self.split_by_file(root, result, file_paths)
+
+    async def arun_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        if not self.check_installed():
+            return {path: await self.arun_analysis(path) for path in file_paths}
 
+        print(f"🔍 [Slither] 项目级分析: {root} ({len(file_paths)} 个文件共享一次编译)")
+        try:
+            result = self._to_result(*await self._arun_slither(".", cwd=root))
         except Exception as e:
-            return f"❌ Slither 分析器执行异常: {str(e)}"
\ No newline at end of file
+            result = StaticAnalysisResult(tool=self.TOOL_NAME, error=f"❌ Slither 分析器执行异常: {str(e)}")
+        return self.split_by_file(root, result, file_paths)
@@ -1,82 +1,183 @@
 # static_analyzers/soteria_analyzer.py
-import subprocess
+import asyncio
+import re
 import shutil
 import os
+from typing import Dict, List, Optional, Tuple
+
 from static_analyzers.abstract_analyzer import AbstractStaticAnalyzer
+from static_analyzers.findings import StaticAnalysisResult, StaticFinding, compress_lines
+from static_analyzers.tool_runner import ToolRun, arun_tool, run_tool
+
+_VULN_HEADER_RE = re.compile(r"VULNERABLE:\s*(.+?)!?\s*=*\s*$")
+_LOCATION_RE = re.compile(r"at line (\d+), column \d+ in (\S+)")
+# 代码摘录行，例如 " 16|    pub fn ..." 或 ">22|  ..."
+_EXCERPT_RE = re.compile(r"^\s*>?\s*\d+\|")
+
+# (workspace 根目录, 源码树指纹) -> 整个 workspace 的分析结果 (进程内复用；跨运行由结果缓存负责)
+_WORKSPACE_RUNS: Dict[Tuple[str, str], StaticAnalysisResult] = {}
 
 class SoteriaAnalyzer(AbstractStaticAnalyzer):
     """
     针对 Solana/Rust 的分析器实现，底层使用 Soteria
     """
-    
+
+    TOOL_NAME = "Soteria"
+    WHOLE_PROJECT = True
+
+    SOURCE_EXTENSIONS = (".rs",)
+    PROJECT_CONFIG_FILES = ("Cargo.toml", "Cargo.lock", "Anchor.toml", "Xargo.toml")
+    # 无法结构化解析时保留的原始日志上限：只防异常的超长日志，
+    # 实际进入 Prompt 的长度由 core.budget 按剩余 Token 预算裁剪
+    MAX_NOTES_CHARS = 200_000
+
     def check_installed(self) -> bool:
         # 检查 soteria 命令是否存在
         return shutil.which("soteria") is not None
 
-    def run_analysis(self, file_path: str) -> str:
+    def tool_version(self) -> str:
+        if not self.check_installed():
+            return "unknown"
+        return self._probe_version(["soteria", "--version"])
+
+    def project_root(self, file_path: str) -> Optional[str]:
         """
-        运行 Soteria 分析。
-        注意：Soteria 通常在项目根目录运行，而不是针对单个文件。
-        我们会尝试从 file_path 推断项目根目录。
+        推断 Cargo workspace 目录：假设 file_path 是 src/lib.rs，向上查找 Cargo.toml (最多找3层)。
+        找不到时就在文件所在目录运行。
         """
-        if not self.check_installed():
-            return "⚠️ 警告: 系统未检测到 'soteria' 命令。请参考 Veridise 文档安装 Soteria。"
-        
-        # 推断项目目录：假设 file_path 是 src/lib.rs，我们需要向上找 Cargo.toml
         abs_path = os.path.abspath(file_path)
         project_dir = os.path.dirname(abs_path)
-        
-        # 简单的向上查找 Cargo.toml 的逻辑 (最多找3层)
         for _ in range(3):
             if os.path.exists(os.path.join(project_dir, "Cargo.toml")):
-                break
+                return project_dir
             project_dir = os.path.dirname(project_dir)
-        else:
-            # 如果找不到 Cargo.toml，就默认在文件所在目录跑
-            project_dir = os.path.dirname(abs_path)
+        return os.path.dirname(abs_path)
+
+    def run_analysis(self, file_path: str) -> StaticAnalysisResult:
+        """
+        运行 Soteria 分析。
+        注意：Soteria 在项目根目录分析整个 workspace，而不是针对单个文件；
+        同一 workspace 的运行结果按源码树指纹复用，这里只取出归属于当前文件的发现。
+        """
+        root = self.project_root(file_path)
+        return self.split_by_file(root, self.run_workspace_analysis(root), [file_path])[file_path]
+
+    async def arun_analysis(self, file_path: str) -> StaticAnalysisResult:
+        root = self.project_root(file_path)
+        return self.split_by_file(root, await self.arun_workspace_analysis(root), [file_path])[file_path]
+
+    def run_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        return self.split_by_file(root, self.run_workspace_analysis(root), file_paths)
+
+    async def arun_project_analysis(self, root: str, file_paths: List[str]) -> Dict[str, StaticAnalysisResult]:
+        return self.split_by_file(root, await self.arun_workspace_analysis(root), file_paths)
+
+    def _missing_tool(self) -> StaticAnalysisResult:
+        return StaticAnalysisResult(
+            tool=self.TOOL_NAME, error="⚠️ 警告: 系统未检测到 'soteria' 命令。请参考 Veridise 文档安装 Soteria。"
+        )
+
+    def run_workspace_analysis(self, root: str) -> StaticAnalysisResult:
+        if not self.check_installed():
+            return self._missing_tool()
 
+        # 进程内复用：同一 workspace 源码未变时不再重复启动 soteria
+        memo_key = (os.path.abspath(root), self.project_fingerprint(root))
+        if memo_key in _WORKSPACE_RUNS:
+            return _WORKSPACE_RUNS[memo_key]
+
+        print(f"🔍 [Soteria] 分析 workspace: {root}")
         try:
             # 执行命令: soteria . (在项目目录下)
             # Soteria 的输出通常是文本格式，不是 JSON，我们需要捕获 stdout
-            result = subprocess.run(
-                ["soteria", "."],
-                cwd=project_dir, # 切换工作目录
-                capture_output=True,
-                text=True,
-                check=False 
-            )
-            
-            raw_output = result.stdout.strip()
-            stderr_output = result.stderr.strip()
-            
-            # Soteria 如果没发现漏洞，通常输出包含 "No vulnerabilities found"
-            if "No vulnerabilities found" in raw_output:
-                return "✅ Soteria 分析完成：未发现已知的高危漏洞模式。"
-            
-            # 如果输出为空但有报错
-            if not raw_output and stderr_output:
-                return f"Soteria 运行出错 (Stderr): {stderr_output[:300]}..."
-
-            # 截取关键输出 (Soteria 输出可能很长，只取前 2000 字符给 LLM)
-            # 这里的清洗逻辑可以根据 Soteria 实际输出格式精修
-            summary = [
-                "### 🔍 Soteria 静态分析报告 (Solana):",
-                "注意：以下是工具扫描的原始日志，请重点关注 'VULNERABILITY' 关键词。",
-                "---"
-            ]
-            
-            # 简单的日志清洗，去除进度条等噪音
-            lines = raw_output.split('\n')
-            relevant_lines = [line for line in lines if "Checking" not in line and "Compiling" not in line]
-            
-            # 限制长度以防爆 Token
-            content_str = "\n".join(relevant_lines)
-            if len(content_str) > 2000:
-                content_str = content_str[:2000] + "\n...(输出截断)..."
-                
-            summary.append(content_str)
-
-            return "\n".join(summary)
+            result = self._parse_run(run_tool(["soteria", "."], cwd=root, limits=self.limits))
+        except Exception as e:
+            result = StaticAnalysisResult(tool=self.TOOL_NAME, error=f"❌ Soteria 分析器执行异常: {str(e)}")
+        if not result.failed:
+            _WORKSPACE_RUNS[memo_key] = result
+        return result
+
+    async def arun_workspace_analysis(self, root: str) -> StaticAnalysisResult:
+        if not self.check_installed():
+            return self._missing_tool()
 
+        memo_key = (os.path.abspath(root), await asyncio.to_thread(self.project_fingerprint, root))
+        if memo_key in _WORKSPACE_RUNS:
+            return _WORKSPACE_RUNS[memo_key]
+
+        print(f"🔍 [Soteria] 分析 workspace: {root}")
+        try:
+            result = self._parse_run(await arun_tool(["soteria", "."], cwd=root, limits=self.limits))
         except Exception as e:
-            return f"❌ Soteria 分析器执行异常: {str(e)}"
\ No newline at end of file
+            result = StaticAnalysisResult(tool=self.TOOL_NAME, error=f"❌ Soteria 分析器执行异常: {str(e)}")
+        if not result.failed:
+            _WORKSPACE_RUNS[memo_key] = result
+        return result
+
+    def _parse_run(self, run: ToolRun) -> StaticAnalysisResult:
+        if run.timed_out:
+            return StaticAnalysisResult(tool=self.TOOL_NAME, error=self.timeout_error(self.TOOL_NAME))
+
+        raw_output = run.stdout.strip()
+        stderr_output = run.stderr.strip()
+
+        # Soteria 如果没发现漏洞，通常输出包含 "No vulnerabilities found"
+        if "No vulnerabilities found" in raw_output:
+            return StaticAnalysisResult(tool=self.TOOL_NAME)
+
+        # 如果输出为空但有报错
+        if not raw_output and stderr_output:
+            return StaticAnalysisResult(
+                tool=self.TOOL_NAME, error=f"Soteria 运行出错 (Stderr): {stderr_output[:300]}..."
+            )
+
+        # 保留整个 workspace 的发现 (file 为相对 project_dir 的路径)，由 split_by_file 归属到各文件
+        findings = self.parse_output(raw_output)
+        if findings or _VULN_HEADER_RE.search(raw_output):
+            return StaticAnalysisResult(tool=self.TOOL_NAME, findings=findings)
+
+        # 无法结构化解析时退回原始日志：去除进度条等噪音 (长度由 Prompt 预算裁剪)
+        lines = raw_output.split('\n')
+        relevant_lines = [line for line in lines if "Checking" not in line and "Compiling" not in line]
+        content_str = "\n".join(relevant_lines)
+        if len(content_str) > self.MAX_NOTES_CHARS:
+            content_str = content_str[:self.MAX_NOTES_CHARS] + "\n...(输出截断)..."
+        return StaticAnalysisResult(tool=self.TOOL_NAME, notes=content_str)
+
+    @staticmethod
+    def parse_output(raw_output: str) -> List[StaticFinding]:
+        """
+        解析 Soteria 文本报告。每个漏洞块形如:
+            ==============VULNERABLE: Missing Signer Check!============
+            Found a potential vulnerability at line 22, column 5 in programs/x/src/lib.rs
+            The account info is not trustful:
+             16|    pub fn withdraw(...)
+            >22|        ...
+        代码摘录行不保留 (LLM 会直接看到源码)，只保留规则名、位置与说明。
+        """
+        findings: List[StaticFinding] = []
+        current = None
+        for line in raw_output.splitlines():
+            header = _VULN_HEADER_RE.search(line)
+            if header:
+                current = {"check": header.group(1).strip(), "file": "", "lines": [], "description": []}
+                findings.append(current)
+                continue
+            if current is None:
+                continue
+            location = _LOCATION_RE.search(line)
+            if location:
+                current["lines"].append(int(location.group(1)))
+                current["file"] = current["file"] or location.group(2)
+            elif line.strip() and not _EXCERPT_RE.match(line) and not line.startswith("For more info"):
+                current["description"].append(line.strip())
+
+        return [
+            StaticFinding(
+                check=item["check"],
+                file=item["file"],
+                lines=compress_lines(item["lines"]),
+                description=" ".join(item["description"]),
+            )
+            for item in findings
+        ]
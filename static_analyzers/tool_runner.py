@@ -0,0 +1,120 @@
+# static_analyzers/tool_runner.py
+"""
+静态分析工具子进程的统一执行入口：墙钟超时、取消时整组杀进程、可选的内存 / CPU rlimit。
+
+工具 (slither → crytic-compile → solc，soteria → cargo) 会派生子进程，
+因此每次都在新的进程组 (session) 中启动，超时或取消时向整个进程组发送 SIGKILL，
+避免残留的编译进程继续占用 CPU。同步版本供进程池 / 单文件模式使用，异步版本供编排器并发调度。
+"""
+import asyncio
+import os
+import signal
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，rlimit 不生效
+    resource = None
+
+
+@dataclass
+class ToolLimits:
+    """单个工具的资源限制，0 表示不限制"""
+    timeout: float = 0
+    memory_mb: int = 0
+    cpu_seconds: int = 0
+
+
+@dataclass
+class ToolRun:
+    """一次工具执行的结果"""
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+
+
+def _preexec(limits: ToolLimits) -> Optional[Callable[[], None]]:
+    """在子进程 exec 之前设置 rlimit (仅 POSIX)"""
+    if resource is None or not (limits.memory_mb or limits.cpu_seconds):
+        return None
+
+    def _apply():
+        if limits.memory_mb:
+            size = limits.memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (size, size))
+        if limits.cpu_seconds:
+            resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds))
+
+    return _apply
+
+
+def _kill_group(pid: int, fallback: Callable[[], None]) -> None:
+    """向以 pid 为组长的进程组发送 SIGKILL；不支持进程组的平台退回只杀子进程本身"""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            fallback()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_tool(command: List[str], cwd: Optional[str] = None, limits: Optional[ToolLimits] = None) -> ToolRun:
+    """同步执行工具命令，超时或被中断时杀掉整个进程组"""
+    limits = limits or ToolLimits()
+    proc = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+        preexec_fn=_preexec(limits),
+    )
+    try:
+        stdout, stderr = proc.communicate(timeout=limits.timeout or None)
+        return ToolRun(proc.returncode, stdout, stderr)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc.pid, proc.kill)
+        stdout, stderr = proc.communicate()
+        return ToolRun(proc.returncode, stdout or "", stderr or "", timed_out=True)
+    except BaseException:
+        # KeyboardInterrupt / 进程池关闭等情况下也不留下孤儿进程
+        _kill_group(proc.pid, proc.kill)
+        proc.wait()
+        raise
+
+
+async def arun_tool(command: List[str], cwd: Optional[str] = None, limits: Optional[ToolLimits] = None) -> ToolRun:
+    """异步执行工具命令：不占用事件循环线程，任务被取消时杀掉整个进程组后再传播取消"""
+    limits = limits or ToolLimits()
+    spawn = asyncio.ensure_future(asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+        preexec_fn=_preexec(limits),
+    ))
+    try:
+        proc = await asyncio.shield(spawn)
+    except asyncio.CancelledError:
+        # 取消发生在进程启动过程中：等启动完成后再杀掉整个进程组，避免留下孤儿进程
+        proc = await spawn
+        _kill_group(proc.pid, proc.kill)
+        await proc.wait()
+        raise
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=limits.timeout or None)
+        return ToolRun(proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace"))
+    except asyncio.TimeoutError:
+        _kill_group(proc.pid, proc.kill)
+        await proc.wait()
+        return ToolRun(proc.returncode, "", "", timed_out=True)
+    except BaseException:
+        _kill_group(proc.pid, proc.kill)
+        await proc.wait()
+        raise
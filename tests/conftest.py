@@ -0,0 +1,21 @@
+# tests/conftest.py
+"""
+pytest 公共配置：把仓库根目录加入 sys.path (与 python main.py 的导入方式一致)，
+并让每个用例使用临时目录中的缓存 / RAG 索引，不读写仓库下的 .audit_cache。
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from config.settings import project_settings  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(project_settings, "CACHE_ENABLED", False)
+    monkeypatch.setattr(project_settings, "RAG_INDEX_PATH", str(tmp_path / "rag_index.json"))
@@ -0,0 +1,120 @@
+# tests/test_budget.py
+"""
+Prompt 预算与费用上限：超出预算时按 检索条目 → 未结构化输出 → 静态发现 的顺序压缩；
+预估费用超出剩余额度的文件直接失败，不发送任何请求。
+"""
+import asyncio
+from collections import Counter
+from typing import List, Tuple
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from core.analyzer import AuditAnalyzer
+from core.batch import BatchAuditRunner
+from core.budget import CostLedger, PromptAllocation, PromptBudget, PromptBudgetError
+
+FULL = PromptAllocation(rag_items=4, static_items=6, notes_chars=800)
+
+
+class Renderer:
+    """按规模拼出 Prompt 并记录每次渲染的规模"""
+
+    def __init__(self, code_words: int = 200):
+        self.code = "contract " * code_words
+        self.calls: List[PromptAllocation] = []
+
+    def __call__(self, allocation: PromptAllocation) -> Tuple[str, str]:
+        self.calls.append(allocation)
+        user_prompt = "\n".join([
+            *("best practice snippet " * 40 for _ in range(allocation.rag_items)),
+            *(f"finding {i} reentrancy in withdraw " * 10 for i in range(allocation.static_items)),
+            "tool output line " * (allocation.notes_chars // 17),
+            self.code,
+        ])
+        return "system", user_prompt
+
+
+def _budget_for(allocation: PromptAllocation, slack: int = 0) -> PromptBudget:
+    budget = PromptBudget("gpt-4o")
+    budget.max_prompt_tokens = budget.count(*Renderer()(allocation)) + slack
+    return budget
+
+
+def _phase(allocation: PromptAllocation) -> int:
+    """0: 压缩检索条目；1: 压缩未结构化输出；2: 裁剪静态发现"""
+    if allocation.rag_items > 0 or allocation.notes_chars == FULL.notes_chars \
+            and allocation.static_items == FULL.static_items:
+        return 0
+    return 1 if allocation.static_items == FULL.static_items else 2
+
+
+def test_allocate_shrinks_rag_then_notes_then_static():
+    budget = _budget_for(PromptAllocation(rag_items=0, static_items=2, notes_chars=0), slack=5)
+    render = Renderer()
+    _, _, allocation = budget.allocate(render, FULL)
+    assert allocation == PromptAllocation(rag_items=0, static_items=2, notes_chars=0)
+
+    # 检索条目先减到 0，期间其余部分保持完整；之后才截断工具输出，最后裁剪静态发现
+    phases = [_phase(call) for call in render.calls]
+    assert phases == sorted(phases)
+    assert set(phases) == {0, 1, 2}
+    assert all(call.rag_items == 0 for call in render.calls if _phase(call) > 0)
+    assert all(call.notes_chars == 0 for call in render.calls if _phase(call) == 2)
+
+
+def test_allocate_stops_as_soon_as_prompt_fits():
+    budget = _budget_for(PromptAllocation(rag_items=2, static_items=6, notes_chars=800))
+    _, _, allocation = budget.allocate(Renderer(), FULL)
+    # 只需要去掉两条检索条目，工具输出与静态发现不受影响
+    assert allocation == PromptAllocation(rag_items=2, static_items=6, notes_chars=800)
+
+
+def test_allocate_raises_when_code_alone_does_not_fit():
+    budget = _budget_for(PromptAllocation(rag_items=0, static_items=0, notes_chars=0), slack=-1)
+    with pytest.raises(PromptBudgetError):
+        budget.allocate(Renderer(), FULL)
+
+
+class CountingLLMService(FakeLLMService):
+    def __init__(self):
+        super().__init__(latency=0, tokens_per_second=0, model_name="gpt-4o")
+        self.calls = Counter()
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs):
+        self.calls["llm"] += 1
+        return await super().agenerate_response(system_prompt, user_prompt, **kwargs)
+
+
+def _run(files: List[str], ledger: CostLedger, llm: CountingLLMService):
+    analyzer = AuditAnalyzer(llm, ReplayStaticAnalyzer.for_project_type("EVM"))
+    runner = BatchAuditRunner(
+        {"EVM": analyzer}, static_workers=1, llm_concurrency=1, project_mode=False, cost_ledger=ledger,
+    )
+
+    async def _collect():
+        return [result async for result in runner.run(files)]
+    return asyncio.run(_collect())
+
+
+def test_file_over_remaining_cost_fails_without_llm_call(tmp_path):
+    files = generate_corpus(str(tmp_path), 1, "small")
+    # 其他文件 (或其他 worker) 已占用了几乎全部额度
+    ledger = CostLedger(max_cost=1.0)
+    ledger.committed = 1.0 - 1e-7
+    llm = CountingLLMService()
+
+    result, = _run(files, ledger, llm)
+    assert not result.ok
+    assert "超出费用上限的剩余额度" in result.error
+    assert llm.calls["llm"] == 0
+    assert ledger.committed == pytest.approx(1.0 - 1e-7)
+
+    # 额度足够时照常送审，结束后按实际费用结算
+    ledger = CostLedger(max_cost=1.0)
+    result, = _run(files, ledger, llm)
+    assert result.ok
+    assert llm.calls["llm"] == 1
+    assert 0 < ledger.committed < 1.0
@@ -0,0 +1,92 @@
+# tests/test_chunker.py
+"""
+分块审计的行号约定：路由到分块的静态发现与模型输出都使用块内相对行号，合并时只平移一次。
+"""
+import re
+from typing import Any, Dict
+
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from config.settings import project_settings
+from core.analyzer import AuditAnalyzer
+from core.chunker import relative_static_findings, split_source
+from static_analyzers.findings import StaticAnalysisResult, StaticFinding
+
+
+def _big_contract(functions: int = 12) -> str:
+    lines = ["pragma solidity ^0.8.0;", "", "contract Big {"]
+    for i in range(functions):
+        lines += [
+            f"    function f{i}(uint256 amount) external {{",
+            f"        require(amount > {i});",
+            "        uint256 before = address(this).balance;",
+            "        (bool ok, ) = msg.sender.call{value: amount}(\"\");",
+            "        require(ok);",
+            "        balances[msg.sender] -= amount;",
+            "        emit Done(before);",
+            "    }",
+            "",
+        ]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+class EchoLLMService(FakeLLMService):
+    """照抄 Prompt 中静态发现的行号作为漏洞行号 (模型常见的行为)"""
+
+    def build_report(self, user_prompt: str) -> Dict[str, Any]:
+        return {
+            "analysis_summary": "echo",
+            "vulnerabilities": [
+                {
+                    "name": "Reentrancy", "line": int(line), "severity": "High",
+                    "description": "echo", "fix_suggestion": "echo", "fixed_code_snippet": "// fixed",
+                }
+                for line in re.findall(r"reentrancy-eth @ L(\d+)", user_prompt)
+            ],
+        }
+
+
+def _static_result(line: int) -> StaticAnalysisResult:
+    return StaticAnalysisResult(tool="Slither", findings=[
+        StaticFinding(check="reentrancy-eth", impact="High", confidence="Medium", lines=[(line, line)],
+                      description="Reentrancy in Big"),
+        StaticFinding(check="solc-version", impact="Informational", confidence="High", description="global"),
+    ])
+
+
+def test_relative_static_findings_clips_and_shifts():
+    code = _big_contract()
+    chunk = split_source(code, "solidity", 40)[1]
+    result = StaticAnalysisResult(tool="Slither", findings=[
+        StaticFinding(check="a", lines=[(chunk.start_line - 2, chunk.start_line + 1), (chunk.end_line + 5, chunk.end_line + 6)]),
+        StaticFinding(check="b", description="global"),
+    ])
+    relative = relative_static_findings(result, chunk)
+    assert relative.findings[0].lines == [(1, 2)]
+    assert relative.findings[1].lines == []
+    # 原结果不被修改
+    assert result.findings[0].lines[0] == (chunk.start_line - 2, chunk.start_line + 1)
+
+
+def test_static_finding_in_second_chunk_keeps_absolute_line(monkeypatch):
+    monkeypatch.setattr(project_settings, "CHUNK_MAX_LINES", 40)
+    code = _big_contract()
+    analyzer = AuditAnalyzer(
+        EchoLLMService(latency=0, tokens_per_second=0), ReplayStaticAnalyzer("Slither (replay)", [])
+    )
+    chunks = analyzer.plan_chunks("Big.sol", code)
+    assert len(chunks) >= 3
+    second = chunks[1]
+    # 第二块深处的外部调用行
+    absolute = second.end_line - 5
+    assert "msg.sender.call" in code.splitlines()[absolute - 1]
+    relative = absolute - second.start_line + 1
+
+    plan = analyzer.plan_audit(code, _static_result(absolute), file_path="Big.sol")
+    assert f"reentrancy-eth @ L{relative}:" in plan.jobs[1].user_prompt
+    assert f"reentrancy-eth @ L{absolute}:" not in plan.jobs[1].user_prompt
+    assert all("reentrancy-eth" not in job.user_prompt for i, job in enumerate(plan.jobs) if i != 1)
+
+    report = analyzer.analyze_with_static(code, _static_result(absolute), file_path="Big.sol")
+    assert [vul.line for vul in report.vulnerabilities] == [absolute]
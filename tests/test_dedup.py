@@ -0,0 +1,112 @@
+# tests/test_dedup.py
+"""
+跨文件去重：两个文件含有只差注释与空白的相同函数，该函数只送审一次，
+owner 的结论按有效代码行映射到另一个文件中的绝对行号 (注释与空行的位置可以不同)。
+"""
+import asyncio
+from typing import Any, Dict, List
+
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from core.analyzer import AuditAnalyzer
+from core.batch import BatchAuditRunner
+from core.dedup import normalize_code
+from core.pipeline import BatchResult
+
+VAULT = """pragma solidity ^0.8.0;
+
+contract Vault {
+    mapping(address => uint256) balances;
+
+    function withdraw(uint256 amount) external {
+        (bool ok, ) = msg.sender.call{value: amount}("");
+        require(ok);
+        balances[msg.sender] -= amount;
+    }
+}
+"""
+
+# 头部更长 (函数整体下移)，函数体只多了注释、缩进与空行不同
+FORKED_VAULT = """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+/// @title 从 Vault 复制的分叉版本
+contract ForkedVault {
+    mapping(address => uint256) balances;
+    address public owner;
+
+    function withdraw(uint256 amount) external {
+      // 先转账再记账
+      (bool ok, ) = msg.sender.call{value: amount}("");  /* 外部调用 */
+
+      require(ok);
+      balances[msg.sender] -= amount;
+    }
+}
+"""
+
+MARKER = "msg.sender.call"
+CODE_START = "待分析的代码：\n    ---\n"
+
+
+class EchoLLMService(FakeLLMService):
+    """在送审代码中外部调用所在的行 (相对 Prompt 中的代码) 报告一个重入漏洞，并记录每次的代码"""
+
+    def __init__(self):
+        super().__init__(latency=0, tokens_per_second=0)
+        self.codes: List[str] = []
+
+    def build_report(self, user_prompt: str) -> Dict[str, Any]:
+        code = user_prompt.split(CODE_START, 1)[1].rsplit("\n    ---", 1)[0]
+        self.codes.append(code)
+        return {
+            "analysis_summary": "echo",
+            "vulnerabilities": [
+                {
+                    "name": "Reentrancy", "line": number, "severity": "High",
+                    "description": "echo", "fix_suggestion": "echo", "fixed_code_snippet": "// fixed",
+                }
+                for number, line in enumerate(code.splitlines(), 1) if MARKER in line
+            ],
+        }
+
+
+def _line_of(code: str, marker: str) -> int:
+    return next(number for number, line in enumerate(code.splitlines(), 1) if marker in line)
+
+
+def test_identical_function_is_audited_once_across_files(tmp_path):
+    vault, forked = tmp_path / "Vault.sol", tmp_path / "ForkedVault.sol"
+    vault.write_text(VAULT)
+    forked.write_text(FORKED_VAULT)
+    # 前提：两个 withdraw 规范化后相同，但所在行号不同
+    assert normalize_code(VAULT.split("    function")[1], "solidity") == \
+        normalize_code(FORKED_VAULT.split("    function")[1], "solidity")
+    assert _line_of(VAULT, MARKER) != _line_of(FORKED_VAULT, MARKER)
+
+    llm = EchoLLMService()
+    analyzer = AuditAnalyzer(llm, ReplayStaticAnalyzer("Slither (replay)", []))
+    runner = BatchAuditRunner(
+        {"EVM": analyzer}, static_workers=1, llm_concurrency=1, project_mode=False, dedup_min_lines=1,
+    )
+
+    async def _run() -> Dict[str, BatchResult]:
+        return {result.file_path: result async for result in runner.run([str(vault), str(forked)])}
+
+    results = asyncio.run(_run())
+    assert all(result.ok for result in results.values())
+    # 相同的函数只发送给 LLM 一次；ForkedVault 只送审自己不同的头部声明
+    assert sum(MARKER in code for code in llm.codes) == 1
+    assert len(llm.codes) == 2
+
+    for path, source in [(vault, VAULT), (forked, FORKED_VAULT)]:
+        report = results[str(path)].report
+        assert [(vul.name, vul.line) for vul in report.vulnerabilities] == [("Reentrancy", _line_of(source, MARKER))]
+
+    # pragma 头部与 withdraw 各成一组
+    groups = {tuple(group.names): group for group in runner.deduplicator.duplicate_groups()}
+    assert sorted(groups) == [(), ("withdraw",)]
+    group = groups[("withdraw",)]
+    assert group.owner.file_path in {str(vault), str(forked)}
+    assert {occurrence.file_path for occurrence in group.occurrences} == {str(vault), str(forked)}
+    assert [vul.name for vul in group.conclusions] == ["Reentrancy"]
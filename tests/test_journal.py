@@ -0,0 +1,133 @@
+# tests/test_journal.py
+"""
+结果日志与 --resume：批量运行中途中断后续跑，只重新审计失败、缺失与内容已变化的文件；
+写到一半的最后一行被忽略；旧日志还有未完成的工作时，不带 --resume 的运行拒绝清空。
+"""
+import asyncio
+import re
+from collections import Counter
+from typing import Dict, List
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from core.analyzer import AuditAnalyzer
+from core.batch import BatchAuditRunner
+from core.journal import AuditJournal, JournalInUseError, journal_backlog
+from core.pipeline import BatchResult
+
+CONFIG = {"model": "fake-llm", "diff_base": None}
+
+
+class RecordingLLMService(FakeLLMService):
+    """按合约名记录 LLM 调用；Prompt 中出现 fail_contract 时报错"""
+
+    def __init__(self, fail_contract: str = ""):
+        super().__init__(latency=0, tokens_per_second=0)
+        self.fail_contract = fail_contract
+        self.calls: Counter = Counter()
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs):
+        name = re.search(r"contract (\w+)", user_prompt).group(1)
+        self.calls[name] += 1
+        if name == self.fail_contract:
+            raise RuntimeError("HTTP 500 from stub")
+        return await super().agenerate_response(system_prompt, user_prompt, **kwargs)
+
+
+def _runner(llm: FakeLLMService, journal: AuditJournal) -> BatchAuditRunner:
+    analyzer = AuditAnalyzer(llm, ReplayStaticAnalyzer.for_project_type("EVM"))
+    return BatchAuditRunner(
+        {"EVM": analyzer}, static_workers=1, llm_concurrency=1, queue_size=1, project_mode=False, journal=journal,
+    )
+
+
+def _contract(path: str) -> str:
+    return re.search(r"(ContractSmall\d+)", path).group(1)
+
+
+def test_resume_skips_done_and_retries_failed_changed_and_missing(tmp_path):
+    files = generate_corpus(str(tmp_path / "src"), 6, "small")
+    names = [_contract(path) for path in files]
+    journal_path = str(tmp_path / "journal.jsonl")
+
+    # 第一次运行：ContractSmall1 失败，收到 3 个结果后中断 (相当于 Ctrl-C)
+    first_llm = RecordingLLMService(fail_contract=names[1])
+    first: Dict[str, BatchResult] = {}
+
+    async def _interrupted():
+        journal = AuditJournal(journal_path, CONFIG)
+        try:
+            async for result in _runner(first_llm, journal).run(files):
+                first[_contract(result.file_path)] = result
+                if len(first) == 3:
+                    break
+        finally:
+            journal.close()
+
+    asyncio.run(_interrupted())
+    done = [name for name, result in first.items() if result.ok]
+    failed = [name for name, result in first.items() if not result.ok]
+    missing = [name for name in names if name not in first]
+    assert failed == [names[1]] and len(done) == 2 and missing
+
+    # 进程被杀时写了一半的最后一行
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('{"type": "done", "file": "%s", "sha": "' % files[names.index(missing[0])])
+    # 一个已完成的文件在两次运行之间被修改
+    changed = done[1]
+    with open(files[names.index(changed)], "a", encoding="utf-8") as f:
+        f.write("\n// edited after the interrupted run\n")
+    unchanged = done[0]
+
+    # 不带 --resume 时拒绝清空仍有失败 / 未完成文件的日志
+    assert journal_backlog(journal_path)[0] == 1
+    with pytest.raises(JournalInUseError):
+        AuditJournal(journal_path, CONFIG)
+
+    second_llm = RecordingLLMService()
+    second: Dict[str, BatchResult] = {}
+
+    async def _resumed():
+        journal = AuditJournal(journal_path, CONFIG, resume=True)
+        try:
+            async for result in _runner(second_llm, journal).run(files):
+                second[_contract(result.file_path)] = result
+        finally:
+            journal.close()
+
+    asyncio.run(_resumed())
+    assert sorted(second) == sorted(names)
+    assert all(result.ok for result in second.values())
+    # 内容未变的已完成文件直接复用报告，不再调用 LLM
+    assert second[unchanged].resumed
+    assert second[unchanged].report == first[unchanged].report
+    assert second_llm.calls[unchanged] == 0
+    # 失败、内容已变化与缺失 (包括只写了半行 done 记录) 的文件重新审计
+    for name in [names[1], changed, *missing]:
+        assert not second[name].resumed
+        assert second_llm.calls[name] == 1
+    assert journal_backlog(journal_path) == (0, 0)
+
+
+def test_fresh_run_only_truncates_finished_journal(tmp_path):
+    files: List[str] = generate_corpus(str(tmp_path / "src"), 2, "small")
+    journal_path = str(tmp_path / "journal.jsonl")
+
+    async def _run(journal: AuditJournal, llm: FakeLLMService):
+        try:
+            return [result async for result in _runner(llm, journal).run(files)]
+        finally:
+            journal.close()
+
+    asyncio.run(_run(AuditJournal(journal_path, CONFIG), RecordingLLMService(fail_contract=_contract(files[0]))))
+    with pytest.raises(JournalInUseError):
+        AuditJournal(journal_path, CONFIG)
+    # 确认丢弃 (--fresh) 后重新开始
+    results = asyncio.run(_run(AuditJournal(journal_path, CONFIG, overwrite=True), RecordingLLMService()))
+    assert all(result.ok for result in results)
+    # 上一次全部完成：普通运行可以直接清空
+    AuditJournal(journal_path, CONFIG).close()
+    assert journal_backlog(journal_path) == (0, 0)
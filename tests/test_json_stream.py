@@ -0,0 +1,98 @@
+# tests/test_json_stream.py
+"""
+IncrementalArrayParser：任意切分的流式片段、字符串中的转义引号与括号，以及元素在流结束前就被交给回调。
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from core.analyzer import AuditAnalyzer
+from llm_services.json_stream import IncrementalArrayParser
+from static_analyzers.findings import StaticAnalysisResult
+
+TRICKY = [
+    {"name": "Reentrancy", "line": 4, "severity": "High",
+     "description": "调用 \"withdraw\" 时 } ] 与 { [ 出现在字符串中", "fix_suggestion": "反斜杠结尾 \\",
+     "fixed_code_snippet": "if (x) { revert(\"}\"); }"},
+    {"name": "Nested", "line": 7, "severity": "Low", "description": "{\"vulnerabilities\": [{}]}",
+     "fix_suggestion": "f", "fixed_code_snippet": "// [", "extra": {"items": [{"a": 1}, {"b": [2, 3]}]}},
+]
+
+REPORT = {
+    # 摘要中出现目标 key 与括号，不应被当作数组开始
+    "analysis_summary": "提示: \"vulnerabilities\": [{\"name\": \"fake\"}]",
+    "meta": {"vulnerabilities": [{"ignored": True}]},
+    "vulnerabilities": TRICKY,
+}
+
+
+def _feed(pieces: List[str]) -> List[Any]:
+    parser = IncrementalArrayParser("vulnerabilities")
+    elements = [element for piece in pieces for element in parser.feed(piece)]
+    assert parser.text == "".join(pieces)
+    return [json.loads(element) for element in elements]
+
+
+def test_every_split_point_yields_the_same_elements():
+    text = json.dumps(REPORT, ensure_ascii=False)
+    assert _feed([text]) == TRICKY
+    # 逐字符输入：转义符、引号、括号与 key 都可能被切开
+    assert _feed(list(text)) == TRICKY
+    for cut in range(1, len(text)):
+        assert _feed([text[:cut], text[cut:]]) == TRICKY
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    text = json.dumps({"vulnerabilities": [{"description": "a\\\"}{b", "q": "\"]"}, {"n": 2}]})
+    assert _feed(list(text)) == [{"description": "a\\\"}{b", "q": "\"]"}, {"n": 2}]
+
+
+def test_code_fence_and_trailing_text_are_ignored():
+    text = "```json\n" + json.dumps({"vulnerabilities": [{"n": 1}]}) + "\n```\n"
+    text += "补充说明 {\"vulnerabilities\": [{\"n\": 2}]}"
+    assert _feed([text[:5], text[5:]]) == [{"n": 1}]
+
+
+def test_truncated_stream_keeps_closed_elements():
+    text = json.dumps(REPORT, ensure_ascii=False)
+    truncated = text[:text.index("Nested") + 3]
+    assert _feed(list(truncated)) == TRICKY[:1]
+
+
+class TrackingLLMService(FakeLLMService):
+    """逐片段流式输出，记录已经发出的片段数"""
+
+    def __init__(self, report: Dict[str, Any]):
+        super().__init__(latency=0, tokens_per_second=0, stream_chunk_chars=7)
+        self.report = report
+        self.sent = 0
+        self.total = 0
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        text = json.dumps(self.report, ensure_ascii=False)
+        pieces = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        self.total = len(pieces)
+        for piece in pieces:
+            self.sent += 1
+            yield piece
+            await asyncio.sleep(0)
+
+
+def test_vulnerability_is_emitted_before_stream_ends():
+    report = {"analysis_summary": "s", "vulnerabilities": [
+        {"name": "Reentrancy", "line": 4, "severity": "High", "description": "d \"}\"",
+         "fix_suggestion": "f", "fixed_code_snippet": "// {"},
+    ], "confidence": "High"}
+    llm = TrackingLLMService(report)
+    analyzer = AuditAnalyzer(llm, ReplayStaticAnalyzer("Slither (replay)", []))
+    code = "pragma solidity ^0.8.0;\ncontract A {\n    function f() external {}\n}\n"
+    job, = analyzer.plan_audit(code, StaticAnalysisResult(tool="Slither"), file_path="A.sol").jobs
+
+    seen = []
+    raw = asyncio.run(analyzer.agenerate_streaming(job, lambda vul: seen.append((vul.name, llm.sent))))
+    assert raw == report
+    # 回调发生时 confidence 等后续内容还没有发出
+    assert seen and seen[0][0] == "Reentrancy"
+    assert seen[0][1] < llm.total
@@ -0,0 +1,227 @@
+# tests/test_rate_limit.py
+"""
+RateLimiter / retry_with_backoff：真实的 AsyncOpenAI 客户端请求本地桩 HTTP 服务 (按脚本返回 429 / 5xx / Retry-After)，
+用假时钟记录退避与限流等待，不真正 sleep。
+"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import openai
+import pytest
+
+from benchmarks.replay import ReplayStaticAnalyzer
+from config.settings import llm_settings, project_settings
+from core.analyzer import AuditAnalyzer
+from llm_services import rate_limit
+from llm_services.openai_service import OpenAIService
+from llm_services.rate_limit import CallPolicy, RateLimiter, get_status_code, retry_with_backoff
+from static_analyzers.findings import StaticAnalysisResult
+
+COMPLETION = {
+    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "{}"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8},
+}
+
+# (状态码, 额外响应头)
+Scripted = Tuple[int, Dict[str, str]]
+
+_real_sleep = asyncio.sleep
+
+
+class StubServer:
+    """按脚本依次返回响应的 OpenAI 兼容桩服务；脚本用完后重复最后一条"""
+
+    def __init__(self, script: List[Scripted], content: str = "{}"):
+        self.script = list(script)
+        completion = json.loads(json.dumps(COMPLETION))
+        completion["choices"][0]["message"]["content"] = content
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, headers = stub.script[min(stub.hits, len(stub.script) - 1)]
+                stub.hits += 1
+                body = json.dumps(completion if status == 200 else {"error": {"message": f"stub {status}"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeClock:
+    """替换 rate_limit 模块中的 time / asyncio：monotonic 返回假时间，sleep 只推进假时间并记录时长"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += max(seconds, 0.0)
+        await _real_sleep(0)
+
+    def __getattr__(self, name):
+        # 其余 asyncio API (Lock / Semaphore / get_running_loop ...) 原样转发
+        return getattr(asyncio, name)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", fake)
+    monkeypatch.setattr(rate_limit, "asyncio", fake)
+    # 抖动取上界，退避时长可预测
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    return fake
+
+
+def _completion_call(server: StubServer):
+    client = openai.AsyncOpenAI(api_key="x", base_url=server.base_url, max_retries=0)
+
+    async def _call():
+        response = await client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "ping"}]
+        )
+        return response, response.usage.total_tokens
+    return _call
+
+
+async def _retry(server: StubServer, max_retries: int, base_delay: float, max_delay: float,
+                 statuses: Optional[List[Optional[int]]] = None):
+    call = _completion_call(server)
+
+    async def _once():
+        return (await call())[0]
+
+    def _on_retry(attempt, error, delay):
+        if statuses is not None:
+            statuses.append(get_status_code(error))
+    return await retry_with_backoff(_once, max_retries, base_delay, max_delay, on_retry=_on_retry)
+
+
+def test_backoff_schedule_honours_retry_after(clock):
+    statuses: List[Optional[int]] = []
+    script = [(429, {"Retry-After": "7"}), (503, {}), (500, {}), (200, {})]
+    with StubServer(script) as server:
+        response = asyncio.run(_retry(server, max_retries=5, base_delay=1.0, max_delay=30.0, statuses=statuses))
+    assert response.choices[0].message.content == "{}"
+    assert server.hits == 4
+    assert statuses == [429, 503, 500]
+    # Retry-After 作为第一次退避的下限，之后按 base * 2^n 指数增长
+    assert clock.sleeps == [7.0, 2.0, 4.0]
+
+
+def test_backoff_is_capped_by_max_delay(clock):
+    script = [(429, {"Retry-After": "120"}), (502, {}), (502, {}), (502, {}), (200, {})]
+    with StubServer(script) as server:
+        asyncio.run(_retry(server, max_retries=5, base_delay=2.0, max_delay=5.0))
+    assert clock.sleeps == [5.0, 4.0, 5.0, 5.0]
+
+
+def test_retry_cap_reraises_last_error(clock):
+    with StubServer([(503, {})]) as server:
+        with pytest.raises(openai.APIStatusError) as excinfo:
+            asyncio.run(_retry(server, max_retries=2, base_delay=1.0, max_delay=30.0))
+    assert excinfo.value.status_code == 503
+    assert server.hits == 3
+    assert clock.sleeps == [1.0, 2.0]
+
+
+def test_client_errors_are_not_retried(clock):
+    with StubServer([(400, {}), (200, {})]) as server:
+        with pytest.raises(openai.BadRequestError):
+            asyncio.run(_retry(server, max_retries=5, base_delay=1.0, max_delay=30.0))
+    assert server.hits == 1
+    assert clock.sleeps == []
+
+
+def test_rpm_budget_delays_until_window_frees(clock):
+    limiter = RateLimiter(requests_per_minute=2)
+
+    async def _acquire_three():
+        return [(await limiter.acquire(10)).timestamp for _ in range(3)]
+
+    assert asyncio.run(_acquire_three()) == [1000.0, 1000.0, 1060.0]
+    assert clock.sleeps == [60.0]
+
+
+def test_tpm_budget_uses_actual_usage(clock):
+    limiter = RateLimiter(tokens_per_minute=1000)
+
+    async def _scenario():
+        # 预估 900，实际只用了 100：窗口按真实用量计，下一次 800 不必等待
+        await limiter.run(900, lambda: _result("a", 100))
+        await limiter.acquire(800)
+        assert clock.sleeps == []
+        clock.now += 10
+        # 窗口内已用 900，再占 600 需要等第一笔 (t=1000) 滑出窗口
+        await limiter.acquire(600)
+
+    async def _result(value, tokens):
+        return value, tokens
+
+    asyncio.run(_scenario())
+    assert clock.sleeps == [50.0]
+
+
+def test_call_policy_retries_share_rpm_budget(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit.usage_tracker, "record_retry", lambda: None)
+    policy = CallPolicy(RateLimiter(requests_per_minute=1), max_retries=3, base_delay=1.0, max_delay=30.0)
+    with StubServer([(429, {}), (200, {})]) as server:
+        response = asyncio.run(policy.run("Stub", 10, _completion_call(server)))
+    assert response.usage.total_tokens == 8
+    assert server.hits == 2
+    assert policy.retries == 1
+    # 退避 1s 后，重试仍要等第一次请求滑出 60 秒窗口
+    assert clock.sleeps == [1.0, 59.0]
+
+
+def test_single_file_sync_audit_goes_through_call_policy(clock, monkeypatch):
+    """单文件、单块的同步入口 (python main.py file.sol) 同样经过限流与退避重试"""
+    monkeypatch.setattr(rate_limit.usage_tracker, "record_retry", lambda: None)
+    monkeypatch.setattr(project_settings, "OPENAI_API_KEY", "x")
+    monkeypatch.setattr(llm_settings, "MAX_RETRIES", 3)
+    monkeypatch.setattr(llm_settings, "RETRY_BASE_DELAY", 1.0)
+    monkeypatch.setattr(llm_settings, "REQUESTS_PER_MINUTE", 0)
+    monkeypatch.setattr(llm_settings, "TOKENS_PER_MINUTE", 0)
+    report = {"analysis_summary": "ok", "vulnerabilities": []}
+    with StubServer([(429, {"Retry-After": "3"}), (503, {}), (200, {})], content=json.dumps(report)) as server:
+        monkeypatch.setattr(llm_settings, "BASE_URL", server.base_url)
+        service = OpenAIService("gpt-4o")
+        analyzer = AuditAnalyzer(service, ReplayStaticAnalyzer("Slither (replay)", []))
+        code = "pragma solidity ^0.8.0;\ncontract A {\n    function f() external {}\n}\n"
+        result = analyzer.analyze_with_static(code, StaticAnalysisResult(tool="Slither"), file_path="A.sol")
+    assert result.analysis_summary == "ok"
+    assert server.hits == 3
+    assert service.call_policy.retries == 2
+    assert clock.sleeps == [3.0, 2.0]
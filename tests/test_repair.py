@@ -0,0 +1,111 @@
+# tests/test_repair.py
+"""
+输出修复：Schema 校验失败时只把错误与原输出发回模型修正；修复次数用尽时保留能通过校验的漏洞。
+"""
+import json
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from pydantic import ValidationError
+
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from config import prompt_templates
+from config.settings import llm_settings
+from core.analyzer import AuditAnalyzer
+from static_analyzers.findings import StaticAnalysisResult
+
+CODE = """pragma solidity ^0.8.0;
+contract Vault {
+    function withdraw(uint256 amount) external {
+        (bool ok, ) = msg.sender.call{value: amount}("");
+        require(ok);
+    }
+}
+"""
+
+
+def _vulnerability(name: str, line: Any, severity: str = "High") -> Dict[str, Any]:
+    return {
+        "name": name, "line": line, "severity": severity,
+        "description": "d", "fix_suggestion": "f", "fixed_code_snippet": "// fixed",
+    }
+
+
+class ScriptedLLMService(FakeLLMService):
+    """按脚本依次返回原始文本 (脚本用完后重复最后一条)，记录每次收到的 Prompt"""
+
+    def __init__(self, outputs: List[str]):
+        super().__init__(latency=0, tokens_per_second=0)
+        self.outputs = outputs
+        self.prompts: List[Tuple[str, str]] = []
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        self.prompts.append((system_prompt, user_prompt))
+        return self.parse_json_output(self.outputs[min(len(self.prompts), len(self.outputs)) - 1])
+
+
+def _audit(llm: ScriptedLLMService):
+    analyzer = AuditAnalyzer(llm, ReplayStaticAnalyzer("Slither (replay)", []))
+    return analyzer.analyze_with_static(CODE, StaticAnalysisResult(tool="Slither"), file_path="Vault.sol")
+
+
+def test_schema_error_sends_repair_prompt(monkeypatch):
+    monkeypatch.setattr(llm_settings, "REPAIR_MAX_ATTEMPTS", 1)
+    invalid = json.dumps({"analysis_summary": "s", "vulnerabilities": [_vulnerability("Reentrancy", "four")]})
+    valid = json.dumps({"analysis_summary": "s", "vulnerabilities": [_vulnerability("Reentrancy", 4)]})
+    llm = ScriptedLLMService([invalid, valid])
+
+    report = _audit(llm)
+    assert [(vul.name, vul.line) for vul in report.vulnerabilities] == [("Reentrancy", 4)]
+    assert len(llm.prompts) == 2
+    # 修复请求不重发审计 Prompt，只带校验错误与上一次的输出
+    system_prompt, user_prompt = llm.prompts[1]
+    assert system_prompt == prompt_templates.REPAIR_SYSTEM_PROMPT
+    assert "vulnerabilities.0.line" in user_prompt
+    assert '"four"' in user_prompt
+    assert CODE not in user_prompt
+
+
+def test_exhausted_repairs_keep_valid_vulnerabilities(monkeypatch):
+    monkeypatch.setattr(llm_settings, "REPAIR_MAX_ATTEMPTS", 2)
+    first = json.dumps({"analysis_summary": "first", "vulnerabilities": [
+        _vulnerability("Reentrancy", 4), _vulnerability("Bad Severity", 5, "Critical"),
+        _vulnerability("Unchecked Call Return", 4, "Medium"),
+    ]})
+    # 修复后反而只剩一条有效漏洞：保留有效条目最多的那次输出
+    repaired = json.dumps({"analysis_summary": "repaired", "vulnerabilities": [
+        _vulnerability("Reentrancy", 4), _vulnerability("Bad Line", None),
+    ]})
+    llm = ScriptedLLMService([first, repaired])
+
+    report = _audit(llm)
+    assert len(llm.prompts) == 1 + 2
+    assert [vul.name for vul in report.vulnerabilities] == ["Reentrancy", "Unchecked Call Return"]
+    assert report.analysis_summary.startswith("first\n")
+    assert "丢弃 1 条不合法条目" in report.analysis_summary
+
+
+def test_truncated_output_salvages_closed_vulnerabilities(monkeypatch):
+    monkeypatch.setattr(llm_settings, "REPAIR_MAX_ATTEMPTS", 1)
+    full = json.dumps({"analysis_summary": "s", "vulnerabilities": [
+        _vulnerability("Reentrancy", 4), _vulnerability("Unchecked Call Return", 5, "Medium"),
+    ]})
+    # 输出在第二条漏洞中间被截断，修复请求也只返回了非 JSON 文本
+    truncated = full[:full.index("Unchecked") + 5]
+    llm = ScriptedLLMService([truncated, "抱歉，我无法修复。"])
+
+    report = _audit(llm)
+    assert prompt_templates.REPAIR_SYSTEM_PROMPT == llm.prompts[1][0]
+    assert [(vul.name, vul.line) for vul in report.vulnerabilities] == [("Reentrancy", 4)]
+    assert report.analysis_summary.startswith("(摘要缺失)")
+
+
+def test_nothing_salvageable_raises_last_error(monkeypatch):
+    monkeypatch.setattr(llm_settings, "REPAIR_MAX_ATTEMPTS", 1)
+    invalid = json.dumps({"vulnerabilities": [_vulnerability("Reentrancy", "four")]})
+    llm = ScriptedLLMService([invalid])
+
+    with pytest.raises(ValidationError):
+        _audit(llm)
+    assert len(llm.prompts) == 2
@@ -0,0 +1,214 @@
+# tests/test_server.py
+"""
+常驻审计服务：AuditService + ThreadingHTTPServer (端口 0)，LLM 与静态分析使用 benchmarks 中的替身。
+可以用 gate 把 LLM 调用挡住，使任务停在 "运行中"，从而构造排队、取消等场景。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import pytest
+
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from core.factories import ServiceFactory
+from core.server import AuditRequestHandler, AuditService
+
+CONTRACT = """pragma solidity ^0.8.0;
+
+contract {name} {{
+    mapping(address => uint256) balances;
+
+    function withdraw(uint256 amount) external {{
+        (bool ok, ) = msg.sender.call{{value: amount}}("");
+        require(ok);
+        balances[msg.sender] -= amount;
+    }}
+}}
+"""
+
+
+class GatedLLMService(FakeLLMService):
+    """gate 打开之前所有 LLM 调用都停在这里"""
+
+    def __init__(self):
+        super().__init__(latency=0, tokens_per_second=0)
+        self.gate = threading.Event()
+
+    async def _wait_gate(self) -> None:
+        while not self.gate.is_set():
+            await asyncio.sleep(0.01)
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        await self._wait_gate()
+        return await super().agenerate_response(system_prompt, user_prompt, **kwargs)
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, **kwargs):
+        await self._wait_gate()
+        async for piece in super().astream_response(system_prompt, user_prompt, **kwargs):
+            yield piece
+
+
+class Client:
+    def __init__(self, httpd: ThreadingHTTPServer):
+        self.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    def request(self, method: str, path: str, payload: Optional[dict] = None) -> Tuple[int, Any]:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def submit(self, name: str, priority: int = 0) -> Tuple[int, Any]:
+        return self.request("POST", "/jobs", {
+            "sources": {f"{name}.sol": CONTRACT.format(name=name)}, "priority": priority,
+        })
+
+    def wait_status(self, job_id: str, *statuses: str, timeout: float = 30) -> Dict[str, Any]:
+        deadline = time.monotonic() + timeout
+        while True:
+            _, job = self.request("GET", f"/jobs/{job_id}")
+            if job["status"] in statuses:
+                return job
+            assert time.monotonic() < deadline, f"任务 {job_id} 停留在 {job['status']}"
+            time.sleep(0.02)
+
+
+@pytest.fixture
+def llm(monkeypatch) -> GatedLLMService:
+    service = GatedLLMService()
+    monkeypatch.setattr(ServiceFactory, "get_llm_service", lambda: service)
+    monkeypatch.setattr(ServiceFactory, "get_region_cache", lambda: None)
+    monkeypatch.setattr(
+        ServiceFactory, "get_static_analyzer",
+        lambda project_type=None: ReplayStaticAnalyzer.for_project_type(project_type or "EVM"),
+    )
+    return service
+
+
+@pytest.fixture
+def make_server(llm):
+    started = []
+
+    def _make(max_jobs: int = 1, max_queued: int = 10) -> Tuple[AuditService, Client]:
+        service = AuditService(max_jobs=max_jobs, max_queued=max_queued, history=50,
+                               static_workers=1, llm_concurrency=2)
+        service.start()
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), AuditRequestHandler)
+        httpd.service = service
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        started.append((service, httpd))
+        return service, Client(httpd)
+
+    yield _make
+    llm.gate.set()
+    for service, httpd in started:
+        httpd.shutdown()
+        httpd.server_close()
+        service.stop()
+
+
+def test_higher_priority_job_runs_first(make_server, llm):
+    service, client = make_server(max_jobs=1)
+    _, blocker = client.submit("Blocker")
+    client.wait_status(blocker["id"], "running")
+    _, low = client.submit("Low", priority=0)
+    _, high = client.submit("High", priority=5)
+
+    llm.gate.set()
+    low_job = client.wait_status(low["id"], "done")
+    high_job = client.wait_status(high["id"], "done")
+    assert high_job["started"] < low_job["started"]
+    assert low_job["results"][0]["ok"] and high_job["results"][0]["ok"]
+
+
+def test_full_queue_returns_503(make_server):
+    service, client = make_server(max_jobs=1, max_queued=1)
+    _, blocker = client.submit("Blocker")
+    client.wait_status(blocker["id"], "running")
+    assert client.submit("Queued")[0] == 202
+    status, body = client.submit("Overflow")
+    assert status == 503
+    assert "上限" in body["error"]
+    _, listing = client.request("GET", "/jobs")
+    assert len(listing["jobs"]) == 2
+
+
+def test_concurrent_submits_respect_queue_limit(make_server):
+    service, client = make_server(max_jobs=1, max_queued=3)
+    _, blocker = client.submit("Blocker")
+    client.wait_status(blocker["id"], "running")
+    statuses = []
+    threads = [threading.Thread(target=lambda i=i: statuses.append(client.submit(f"C{i}")[0])) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [202] * 3 + [503] * 9
+    assert client.request("GET", "/health")[1]["queued"] == 3
+
+
+def test_delete_queued_job(make_server, llm):
+    service, client = make_server(max_jobs=1)
+    _, blocker = client.submit("Blocker")
+    client.wait_status(blocker["id"], "running")
+    _, queued = client.submit("Queued")
+    workdir = service.get(queued["id"]).workdir
+
+    status, body = client.request("DELETE", f"/jobs/{queued['id']}")
+    assert status == 200
+    assert body["status"] == "cancelled"
+    assert workdir and not os.path.exists(workdir)
+
+    llm.gate.set()
+    client.wait_status(blocker["id"], "done")
+    job = client.wait_status(queued["id"], "cancelled")
+    # 出队时跳过，从未开始运行
+    assert job["started"] is None and job["results"] == []
+
+
+def test_delete_running_job(make_server, llm):
+    service, client = make_server(max_jobs=1)
+    _, running = client.submit("Running")
+    client.wait_status(running["id"], "running")
+    _, after = client.submit("After")
+
+    assert client.request("DELETE", f"/jobs/{running['id']}")[0] == 200
+    job = client.wait_status(running["id"], "cancelled")
+    assert job["results"] == []
+    # 取消释放了运行槽位，后面排队的任务照常执行
+    llm.gate.set()
+    assert client.wait_status(after["id"], "done")["results"][0]["ok"]
+
+
+@pytest.mark.parametrize("name", ["../escape.sol", "nested/../../escape.sol", "/tmp/absolute.sol"])
+def test_path_traversal_in_sources_is_rejected(make_server, name):
+    service, client = make_server()
+    status, body = client.request("POST", "/jobs", {"sources": {name: CONTRACT.format(name="Evil")}})
+    assert status == 400
+    assert "相对路径" in body["error"]
+    assert client.request("GET", "/jobs")[1]["jobs"] == []
+
+
+def test_events_stream_closes_after_job_finishes(make_server, llm):
+    service, client = make_server()
+    llm.gate.set()
+    _, job = client.submit("Streamed")
+    with urllib.request.urlopen(f"{client.base}/jobs/{job['id']}/events", timeout=30) as response:
+        assert response.headers["Content-Type"].startswith("application/x-ndjson")
+        # 服务端在任务结束、事件发完后关闭连接，read() 才会返回
+        events = [json.loads(line) for line in response.read().decode("utf-8").splitlines()]
+    kinds = [event["event"] for event in events]
+    assert kinds[0] == "status" and events[0]["status"] == "queued"
+    assert "file" in kinds
+    assert events[-1] == {"event": "status", "status": "done", "error": None}
@@ -0,0 +1,34 @@
+# tests/test_watch.py
+"""
+监听模式：读取失败 (非 UTF-8 / 写到一半) 的文件只提示一次，内容不变时不会反复触发新的一轮。
+"""
+import asyncio
+
+import pytest
+
+from benchmarks.fake_llm import FakeLLMService
+from benchmarks.replay import ReplayStaticAnalyzer
+from core.analyzer import AuditAnalyzer
+from core.batch import BatchAuditRunner
+from core.watch import ContractWatcher, scan_files
+
+
+def test_undecodable_save_is_not_retriggered(tmp_path, capsys):
+    contract = tmp_path / "Token.sol"
+    contract.write_text("pragma solidity ^0.8.0;\ncontract Token {\n    function f() external {}\n}\n")
+    analyzer = AuditAnalyzer(FakeLLMService(latency=0), ReplayStaticAnalyzer.for_project_type("EVM"))
+    watcher = ContractWatcher([str(tmp_path)], BatchAuditRunner({"EVM": analyzer}, 1, 1), interval=0.01, debounce=0.05)
+    watcher.stamps = scan_files(watcher.targets)
+    previous = watcher._remember(str(contract))
+
+    contract.write_bytes(b"pragma solidity ^0.8.0;\n// \xff\xfe\n")
+    changed, _ = asyncio.run(watcher.wait_for_changes())
+    assert changed == [str(contract)]
+    assert watcher.plan_round(changed) == {}
+    assert str(contract) in watcher.stamps
+    # 上一次成功读取的源码仍是下一次保存时计算区域变更的基线
+    assert watcher.sources[str(contract)] == previous
+    assert capsys.readouterr().out.count("无法读取") == 1
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(watcher.wait_for_changes(), 0.3))
@@ -0,0 +1,149 @@
+# tests/test_workqueue.py
+"""
+多进程分片审计：真实的 QueueWorker 子进程 + 本地 LLM 替身，验证 worker 崩溃后文件被重新领取、
+汇总报告中每个文件恰好出现一次。
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from benchmarks.corpus import generate_corpus
+from core.workqueue import WorkQueue, aggregate_report
+
+LEASE_SECONDS = 1.0
+
+
+def _worker_main(db_path: str, workdir: str, worker_id: str, latency: float) -> None:
+    """子进程入口 (spawn 不继承父进程对配置的修改，在这里重新设置)"""
+    from benchmarks.fake_llm import FakeLLMService
+    from benchmarks.replay import ReplayStaticAnalyzer
+    from config.settings import project_settings
+    from core.analyzer import AuditAnalyzer
+    from core.batch import BatchAuditRunner
+    from core.workqueue import QueueWorker
+
+    project_settings.CACHE_ENABLED = False
+    project_settings.RAG_INDEX_PATH = os.path.join(workdir, f"rag_index_{worker_id}.json")
+    analyzer = AuditAnalyzer(
+        FakeLLMService(latency=latency, tokens_per_second=0), ReplayStaticAnalyzer.for_project_type("EVM")
+    )
+    runner = BatchAuditRunner({"EVM": analyzer}, static_workers=1, llm_concurrency=2)
+    worker = QueueWorker(
+        WorkQueue(db_path), runner, worker_id=worker_id,
+        batch_size=1, lease_seconds=LEASE_SECONDS, poll_interval=0.1,
+    )
+    asyncio.run(worker.run(model="fake-llm"))
+
+
+def _start(ctx, db_path: str, workdir: str, worker_id: str, latency: float):
+    process = ctx.Process(target=_worker_main, args=(db_path, workdir, worker_id, latency), daemon=True)
+    process.start()
+    return process
+
+
+def _leased_by(db_path: str, worker_id: str) -> list:
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute(
+            "SELECT file_path FROM jobs WHERE status = 'leased' AND worker = ?", (worker_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def _wait_until(predicate, timeout: float, message: str) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, message
+        time.sleep(0.05)
+
+
+def test_crashed_worker_job_is_released_and_reported_once(tmp_path):
+    files = generate_corpus(str(tmp_path / "src"), 6, "small")
+    db_path = str(tmp_path / "queue.db")
+    queue = WorkQueue(db_path, max_attempts=3)
+    assert queue.enqueue([(path, "EVM") for path in files]) == len(files)
+
+    ctx = multiprocessing.get_context("spawn")
+    # 这个 worker 的 LLM 替身一直不返回：领到文件后在处理中途被杀掉
+    victim = _start(ctx, db_path, str(tmp_path), "victim", latency=600.0)
+    healthy = []
+    try:
+        _wait_until(lambda: _leased_by(db_path, "victim"), 60, "victim 没有领取到文件")
+        (crashed_file,), = _leased_by(db_path, "victim")
+        healthy = [_start(ctx, db_path, str(tmp_path), f"healthy-{i}", latency=0.01) for i in range(2)]
+        time.sleep(0.5)
+        victim.kill()
+        victim.join(10)
+        for process in healthy:
+            process.join(120)
+            assert process.exitcode == 0
+    finally:
+        for process in [victim, *healthy]:
+            if process.is_alive():
+                process.kill()
+
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": len(files), "failed": 0}
+    results = queue.results()
+    assert sorted(item["file_path"] for item in results) == sorted(os.path.abspath(path) for path in files)
+
+    # 崩溃时持有的文件在租约过期后由健康的 worker 重新领取
+    crashed = next(item for item in results if item["file_path"] == crashed_file)
+    assert crashed["worker"].startswith("healthy-")
+    conn = sqlite3.connect(db_path)
+    try:
+        (attempts,), = conn.execute("SELECT attempts FROM jobs WHERE file_path = ?", (crashed_file,)).fetchall()
+    finally:
+        conn.close()
+    assert attempts == 2
+
+    report = aggregate_report(results)
+    assert report["summary"]["files"] == len(files)
+    assert report["summary"]["audited"] == len(files)
+    assert report["failed"] == {}
+    assert sorted(report["files"]) == sorted(os.path.abspath(path) for path in files)
+
+
+def test_local_workers_inherit_stream_flags(tmp_path, monkeypatch):
+    import main
+    from benchmarks.fake_llm import FakeLLMService
+    from benchmarks.replay import ReplayStaticAnalyzer
+    from core.factories import ServiceFactory
+
+    files = generate_corpus(str(tmp_path / "src"), 4, "small")
+    db_path = str(tmp_path / "queue.db")
+    stream_out = str(tmp_path / "stream.jsonl")
+    metrics_out = str(tmp_path / "metrics.jsonl")
+    monkeypatch.setattr("sys.argv", [
+        "main.py", *files, "--queue", db_path, "--workers", "2",
+        "--stream-out", stream_out, "--metrics-out", metrics_out,
+    ])
+    command = main.worker_command(main.parse_arguments())
+    assert command[command.index("--stream-out") + 1] == os.path.abspath(stream_out)
+    # 指标由协调者从队列汇总后写入，不交给各个 worker
+    assert "--metrics-out" not in command
+
+    # 按协调者给出的命令行在本进程内运行 worker
+    WorkQueue(db_path).enqueue([(path, "EVM") for path in files])
+    monkeypatch.setattr("sys.argv", ["main.py", *command[2:]])
+    worker_args = main.parse_arguments()
+    monkeypatch.setattr(ServiceFactory, "get_llm_service", lambda: FakeLLMService(latency=0, tokens_per_second=0))
+    monkeypatch.setattr(ServiceFactory, "get_region_cache", lambda: None)
+    monkeypatch.setattr(
+        ServiceFactory, "get_static_analyzer",
+        lambda project_type=None: ReplayStaticAnalyzer.for_project_type(project_type or "EVM"),
+    )
+    asyncio.run(main.run_worker(worker_args))
+
+    results = WorkQueue(db_path).results()
+    expected = sorted(
+        (item["file_path"], vul["name"]) for item in results for vul in item["report"]["vulnerabilities"]
+    )
+    assert expected
+    with open(stream_out, encoding="utf-8") as f:
+        streamed = sorted((record["file"], record["name"]) for record in map(json.loads, f))
+    assert streamed == expected
+    assert not os.path.exists(metrics_out)